@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark for the /api/route pipeline.
+
+Drives main.app in-process (Flask test client) and over HTTP (a local
+werkzeug server) with a corpus of Scenic, Health and Commute/Event prompts,
+against the local Google Maps stand-ins from local_upstreams.py.
+
+Reports p50/p95/p99 latency, requests/s at fixed concurrency levels,
+upstream calls per request and peak RSS, and writes the results as JSON so
+two runs can be compared:
+
+    python benchmark.py --output bench_before.json
+    python benchmark.py --output bench_after.json --compare bench_before.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from local_upstreams import LocalUpstreams
+
+RESULTS_VERSION = 1
+
+# Prompts are phrased so the NVIDIA mock resolves them to the intended intent
+CORPUS = [
+    ("Scenic", "Give me a scenic route from UC Berkeley to Castro Valley"),
+    ("Scenic", "Beautiful nature drive from Oakland to Half Moon Bay"),
+    ("Scenic", "Scenic park route from Berkeley Marina to Tilden Park"),
+    ("Health", "I want a 10000 steps stroll starting at 2601 Telegraph Ave, Berkeley"),
+    ("Health", "Walk from UC Berkeley to Bushrod Park for exercise"),
+    ("Commute", "Fastest morning commute from Oakland to downtown SF"),
+    ("Commute", "Quick route to work from Albany to Emeryville"),
+    ("Event", "Date night dinner from UC Berkeley to Jack London Square"),
+]
+
+DEFAULT_CONCURRENCY = [1, 4, 16]
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(latencies_ms, 50), 2),
+        "p95": round(percentile(latencies_ms, 95), 2),
+        "p99": round(percentile(latencies_ms, 99), 2),
+        "mean": round(sum(latencies_ms) / len(latencies_ms), 2) if latencies_ms else 0.0,
+        "max": round(max(latencies_ms), 2) if latencies_ms else 0.0,
+    }
+
+def peak_rss_kb() -> int:
+    """Peak resident set size of this process in KiB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def configure_environment(upstreams: LocalUpstreams, nvidia=None):
+    """
+    Point the app at the stand-ins before main is imported. With `nvidia`
+    (a LocalNVIDIA) the LLM calls go over HTTP to it; otherwise NVIDIAAgent
+    stays in mock mode.
+    """
+    os.environ["GOOGLE_MAPS_BASE_URL"] = upstreams.base_url
+    # googlemaps.Client rejects keys that don't look like real ones
+    os.environ["GOOGLE_MAPS_API_KEY"] = "AIzaLocalBenchmarkKey"
+    os.environ["GOOGLE_API_KEY"] = "AIzaLocalBenchmarkKey"
+    os.environ.setdefault("NVIDIA_API_KEY", "local-benchmark")
+    if nvidia is not None:
+        os.environ["NVIDIA_BASE_URL"] = nvidia.base_url
+        os.environ["NVIDIA_MOCK_MODE"] = "0"
+    else:
+        os.environ.setdefault("NVIDIA_MOCK_MODE", "1")
+    # The stand-ins have no quota; measure the app, not the production rate limits
+    os.environ.setdefault("UPSTREAM_LIMITS", json.dumps({
+        api: {"qps": 100000, "burst": 100000, "max_in_flight": 256}
+        for api in ("geocode", "directions", "places", "elevation", "text_search", "nvidia")
+    }))
+
+# --- Transports ---
+
+class InProcessTransport:
+    """Calls the Flask app directly through its test client."""
+    name = "inprocess"
+
+    def __init__(self, app):
+        self.app = app
+
+    def post(self, payload: Dict[str, Any]) -> int:
+        with self.app.test_client() as client:
+            return client.post("/api/route", json=payload).status_code
+
+    def close(self):
+        pass
+
+class HTTPTransport:
+    """Serves the app on a local threaded werkzeug server and calls it over HTTP."""
+    name = "http"
+
+    def __init__(self, app):
+        import requests
+        from werkzeug.serving import make_server
+
+        self._server = make_server("127.0.0.1", 0, app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self.url = f"http://127.0.0.1:{self._server.server_port}/api/route"
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=64, pool_maxsize=64)
+        self._session.mount("http://", adapter)
+
+    def post(self, payload: Dict[str, Any]) -> int:
+        return self._session.post(self.url, json=payload, timeout=120).status_code
+
+    def close(self):
+        self._server.shutdown()
+        self._session.close()
+
+# --- Runner ---
+
+def run_scenario(transport, upstreams: LocalUpstreams, concurrency: int, requests_total: int,
+                 response_cache: bool = False) -> Dict[str, Any]:
+    """Send `requests_total` prompts through `transport` with `concurrency` workers."""
+    jobs = [CORPUS[i % len(CORPUS)] for i in range(requests_total)]
+    latencies: List[float] = []
+    by_intent: Dict[str, List[float]] = defaultdict(list)
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+
+    def one(job):
+        intent, prompt = job
+        t0 = time.perf_counter()
+        try:
+            # The corpus repeats, so bypass the response cache unless asked to measure it
+            status = transport.post({"prompt": prompt, "cache": response_cache})
+        except Exception:
+            status = -1
+        elapsed = (time.perf_counter() - t0) * 1000
+        with lock:
+            latencies.append(elapsed)
+            by_intent[intent].append(elapsed)
+            statuses[status] += 1
+
+    upstreams.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, jobs))
+    wall = time.perf_counter() - started
+    calls = upstreams.snapshot()
+
+    return {
+        "transport": transport.name,
+        "concurrency": concurrency,
+        "requests": requests_total,
+        "errors": sum(n for s, n in statuses.items() if s != 200),
+        "status_codes": {str(s): n for s, n in sorted(statuses.items())},
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(requests_total / wall, 2) if wall else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "latency_ms_by_intent": {k: latency_summary(v) for k, v in sorted(by_intent.items())},
+        "upstream_calls_per_request": {
+            "total": round(sum(calls.values()) / requests_total, 2),
+            **{api: round(n / requests_total, 2) for api, n in sorted(calls.items())},
+        },
+    }
+
+def run_benchmark(transports: List[str], concurrency_levels: List[int], requests_per_level: int,
+                  upstream_latency_ms: float, warmup: int, response_cache: bool = False,
+                  nvidia_latency_ms: Optional[float] = None) -> Dict[str, Any]:
+    upstreams = LocalUpstreams(latency_ms=upstream_latency_ms).start()
+    nvidia = None
+    if nvidia_latency_ms is not None:
+        from local_nvidia import LocalNVIDIA
+        nvidia = LocalNVIDIA(latency_ms=nvidia_latency_ms, distribution="lognormal", seed=0).start()
+    configure_environment(upstreams, nvidia)
+
+    import main
+    # The app logs every request at DEBUG; keep the benchmark output readable
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    scenarios = []
+    try:
+        for name in transports:
+            transport = InProcessTransport(main.app) if name == "inprocess" else HTTPTransport(main.app)
+            try:
+                if warmup:
+                    run_scenario(transport, upstreams, 1, warmup, response_cache)
+                for level in concurrency_levels:
+                    result = run_scenario(transport, upstreams, level, requests_per_level, response_cache)
+                    scenarios.append(result)
+                    print(f"  {name:9s} c={level:<3d} {result['throughput_rps']:8.2f} req/s  "
+                          f"p50={result['latency_ms']['p50']:.1f}ms p99={result['latency_ms']['p99']:.1f}ms  "
+                          f"upstream/req={result['upstream_calls_per_request']['total']}  errors={result['errors']}")
+            finally:
+                transport.close()
+    finally:
+        upstreams.stop()
+        if nvidia is not None:
+            nvidia.stop()
+
+    return {
+        "version": RESULTS_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "config": {
+            "transports": transports,
+            "concurrency_levels": concurrency_levels,
+            "requests_per_level": requests_per_level,
+            "upstream_latency_ms": upstream_latency_ms,
+            "response_cache": response_cache,
+            "nvidia_stand_in_latency_ms": nvidia_latency_ms,
+            "corpus_size": len(CORPUS),
+        },
+        "scenarios": scenarios,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Pair scenarios by (transport, concurrency) and compute relative changes."""
+    def pct(old, new):
+        return round((new - old) / old * 100, 1) if old else None
+
+    base = {(s["transport"], s["concurrency"]): s for s in baseline.get("scenarios", [])}
+    rows = []
+    for s in current.get("scenarios", []):
+        b = base.get((s["transport"], s["concurrency"]))
+        if not b:
+            continue
+        rows.append({
+            "transport": s["transport"],
+            "concurrency": s["concurrency"],
+            "throughput_rps_change_pct": pct(b["throughput_rps"], s["throughput_rps"]),
+            "p50_change_pct": pct(b["latency_ms"]["p50"], s["latency_ms"]["p50"]),
+            "p99_change_pct": pct(b["latency_ms"]["p99"], s["latency_ms"]["p99"]),
+            "upstream_calls_change_pct": pct(b["upstream_calls_per_request"]["total"],
+                                             s["upstream_calls_per_request"]["total"]),
+        })
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the /api/route pipeline against local upstream stand-ins")
+    ap.add_argument("--transport", choices=["inprocess", "http", "both"], default="both")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_CONCURRENCY)
+    ap.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    ap.add_argument("--upstream-latency-ms", type=float, default=5.0)
+    ap.add_argument("--warmup", type=int, default=len(CORPUS))
+    ap.add_argument("--response-cache", action="store_true", help="let repeated prompts hit the /api/route response cache")
+    ap.add_argument("--nvidia-stand-in", type=float, metavar="LATENCY_MS",
+                    help="send LLM calls over HTTP to local_nvidia.py (lognormal latency, this median) instead of mock mode")
+    ap.add_argument("--output", default="bench_results.json")
+    ap.add_argument("--compare", help="previous results file to compare against")
+    args = ap.parse_args()
+
+    transports = ["inprocess", "http"] if args.transport == "both" else [args.transport]
+    print("🏁 MapsAI /api/route benchmark")
+    results = run_benchmark(transports, args.concurrency, args.requests, args.upstream_latency_ms,
+                            args.warmup, args.response_cache, args.nvidia_stand_in)
+    print(f"  peak RSS: {results['peak_rss_kb'] / 1024:.1f} MiB")
+
+    if args.compare:
+        with open(args.compare) as f:
+            results["comparison"] = compare_results(json.load(f), results)
+        fmt = lambda v: "n/a" if v is None else f"{v:+}%"
+        for row in results["comparison"]:
+            print(f"  vs baseline {row['transport']:9s} c={row['concurrency']:<3d} "
+                  f"rps {fmt(row['throughput_rps_change_pct'])}  p99 {fmt(row['p99_change_pct'])}  "
+                  f"upstream {fmt(row['upstream_calls_change_pct'])}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"📄 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
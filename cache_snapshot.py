@@ -0,0 +1,81 @@
+# cache_snapshot.py
+
+"""
+Compact on-disk snapshots of the hottest upstream-cache entries, so a
+restarted process starts warm instead of re-asking Google and NVIDIA for
+everything it knew before the deploy.
+
+Layout (little-endian):
+
+    header   magic "MAPSNAP\\0" | format version u32 | cache version u32 |
+             created_at f64 | entry count u32
+    entries  api len u16 | key len u32 | value len u32 | expires_at f64 |
+             api | key | value (UTF-8; value is the cached JSON text)
+
+Snapshots are written to a temporary file and renamed into place, so
+readers never see a partial file. They are read through mmap. A file whose
+magic, format version or cache version differs from this build's is
+skipped, as is one that ends mid-entry (truncated by a full disk or a
+copy), and so is any entry that has expired.
+"""
+
+import os
+import mmap
+import time
+import struct
+from typing import Iterable, Iterator, Optional, Tuple
+
+MAGIC = b"MAPSNAP\0"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sIIdI")
+_ENTRY = struct.Struct("<HIId")
+
+# (api, key, value JSON text, expires_at epoch seconds)
+Entry = Tuple[str, str, str, float]
+
+class SnapshotMismatch(ValueError):
+    """The file is not a snapshot this build can read."""
+
+def write_snapshot(path: str, entries: Iterable[Entry], cache_version: int) -> int:
+    """Atomically write `entries` to `path`. Returns the number written."""
+    body = bytearray()
+    count = 0
+    for api, key, value, expires_at in entries:
+        api_b, key_b, value_b = api.encode(), key.encode(), value.encode()
+        body += _ENTRY.pack(len(api_b), len(key_b), len(value_b), expires_at)
+        body += api_b + key_b + value_b
+        count += 1
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, cache_version, time.time(), count))
+        f.write(body)
+    os.replace(tmp, path)
+    return count
+
+def read_snapshot(path: str, cache_version: int, now: Optional[float] = None) -> Iterator[Entry]:
+    """Unexpired entries of the snapshot at `path`; raises SnapshotMismatch for foreign files."""
+    now = time.time() if now is None else now
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise SnapshotMismatch(f"{path} is too short to be a snapshot")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, format_version, version, _, count = _HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or format_version != FORMAT_VERSION:
+                raise SnapshotMismatch(f"{path} is not a version {FORMAT_VERSION} snapshot")
+            if version != cache_version:
+                raise SnapshotMismatch(f"{path} holds cache version {version}, this build uses {cache_version}")
+            offset, size = _HEADER.size, len(mm)
+            for i in range(count):
+                if offset + _ENTRY.size > size:
+                    raise SnapshotMismatch(f"{path} is truncated at entry {i} of {count}")
+                api_len, key_len, value_len, expires_at = _ENTRY.unpack_from(mm, offset)
+                offset += _ENTRY.size
+                end = offset + api_len + key_len + value_len
+                if end > size:
+                    raise SnapshotMismatch(f"{path} is truncated at entry {i} of {count}")
+                if expires_at > now:
+                    api = mm[offset:offset + api_len].decode()
+                    key = mm[offset + api_len:offset + api_len + key_len].decode()
+                    yield api, key, mm[end - value_len:end].decode(), expires_at
+                offset = end
@@ -0,0 +1,154 @@
+# commute_agent.py
+
+import os
+from datetime import datetime, timezone, tzinfo
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from config import load_env
+from typing import List, Dict, Any, Optional, Union
+from pydantic import BaseModel
+from models import RouteIntent
+from upstream import create_maps_client
+from deadline import Deadline, should_degrade
+from waypoints import WaypointList
+
+# Load environment variables from .env file
+load_env()
+
+class CommuteRouteResponse(BaseModel):
+    waypoints: WaypointList  # dumps to [{"name": ..., "lat": ..., "lng": ...}, …]
+
+class CommuteAgent:
+    """
+    Fast path for Commute, Transit, Event and other point-to-point intents.
+    Makes a single Directions call (addresses are resolved by Directions itself,
+    GSR stops are passed as coordinates), ranks the alternatives by duration
+    (in traffic when available) and returns the key points of the fastest one.
+    """
+    # Modes for which Google accepts departure_time and returns duration_in_traffic
+    TRAFFIC_MODES = {"driving", "transit"}
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.getenv("GOOGLE_MAPS_API_KEY")
+        if not self.api_key:
+            raise ValueError("Missing Google Maps API key")
+        self.client = create_maps_client(self.api_key)
+
+    def get_commute_route(self, intent: RouteIntent, deadline: Optional[Deadline] = None) -> CommuteRouteResponse:
+        mode = intent.travel_modes[0] if intent.travel_modes else "driving"
+
+        # 1. Stops: reuse GSR coordinates, otherwise let Directions geocode the address
+        stops = intent.stops[:] if intent.stops else []
+        destination: Union[str, Dict[str, Any]]
+        if (not intent.destination or not intent.destination.strip()) and stops:
+            destination = self._stop_point(stops.pop())
+        else:
+            destination = intent.destination or (
+                f"Nearby {intent.location_hint.city}"
+                if intent.location_hint and intent.location_hint.city
+                else intent.origin
+            )
+        via = [self._stop_point(s) for s in stops]
+
+        # 2. One Directions call with alternatives and traffic-aware departure
+        kwargs: Dict[str, Any] = {}
+        if mode in self.TRAFFIC_MODES:
+            zone = intent.location_hint.timezone if intent.location_hint else None
+            kwargs["departure_time"] = self._departure_time(intent.departure_time, zone)
+        routes = self.client.directions(
+            origin=intent.origin,
+            destination=self._as_location(destination),
+            mode=mode,
+            waypoints=[self._as_location(p) for p in via] or None,
+            optimize_waypoints=bool(intent.optimize_waypoints) and len(via) > 1,
+            alternatives=not via and not should_degrade(deadline, "first_alternative"),
+            avoid=self._avoid(intent),
+            deadline=deadline,
+            **kwargs
+        )
+        if not routes:
+            raise RuntimeError("No route returned by Directions API")
+        route = min(routes, key=self._route_duration)
+
+        # 3. Waypoints: origin → stops (in the order Directions chose) → destination
+        legs = route["legs"]
+        order = route.get("waypoint_order") or list(range(len(via)))
+        waypoints = WaypointList()
+        waypoints.append(intent.origin, **self._leg_point(legs[0]["start_location"]))
+        for leg, idx in zip(legs, order):
+            stop = via[idx]
+            name = stop["name"] if isinstance(stop, dict) else stop
+            waypoints.append(name, **self._leg_point(leg["end_location"]))
+        dest_name = destination["name"] if isinstance(destination, dict) else destination
+        waypoints.append(dest_name, **self._leg_point(legs[-1]["end_location"]))
+
+        return CommuteRouteResponse(waypoints=waypoints)
+
+    @staticmethod
+    def _stop_point(stop: Dict[str, Any]) -> Union[str, Dict[str, Any]]:
+        """GSR hit as a coordinate point, or the raw address for Directions to resolve."""
+        if stop.get("gsr"):
+            g = stop["gsr"][0]
+            return {"name": g.get("name", stop["name"]), "lat": g["latitude"], "lng": g["longitude"]}
+        return stop.get("address") or stop["name"]
+
+    @staticmethod
+    def _as_location(point: Union[str, Dict[str, Any]]) -> Union[str, tuple]:
+        return (point["lat"], point["lng"]) if isinstance(point, dict) else point
+
+    @staticmethod
+    def _leg_point(loc: Dict[str, float]) -> Dict[str, float]:
+        return {"lat": loc["lat"], "lng": loc["lng"]}
+
+    @staticmethod
+    def _route_duration(route: Dict[str, Any]) -> int:
+        return sum(
+            leg.get("duration_in_traffic", leg["duration"])["value"]
+            for leg in route["legs"]
+        )
+
+    @staticmethod
+    def _avoid(intent: RouteIntent) -> Optional[List[str]]:
+        allowed = {"tolls", "highways", "ferries", "indoor"}
+        avoid = [a for a in (intent.avoid or []) if a in allowed]
+        return avoid or None
+
+    @staticmethod
+    def _zone(name: Optional[str]) -> Optional[tzinfo]:
+        try:
+            return ZoneInfo(name) if name else None
+        except (ZoneInfoNotFoundError, ValueError):
+            return None
+
+    @classmethod
+    def _departure_time(cls, value: Optional[str], zone: Optional[str] = None) -> Union[str, datetime]:
+        """
+        Parse the intent's ISO departure time. A time without an offset is
+        local to the user's `zone`; without a known zone it can't be placed,
+        so "now" is used. Directions rejects times in the past.
+        """
+        if value:
+            try:
+                when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+                if when.tzinfo is None:
+                    local = cls._zone(zone)
+                    if local is None:
+                        return "now"
+                    when = when.replace(tzinfo=local)
+                if when > datetime.now(timezone.utc):
+                    return when
+            except ValueError:
+                pass
+        return "now"
+
+# --- Usage Example ---
+if __name__ == "__main__":
+    intent = RouteIntent(
+        intent_type="Commute",
+        origin="Oakland, CA",
+        destination="Downtown San Francisco",
+        travel_modes=["driving"],
+        constraints=["fastest route"]
+    )
+    agent = CommuteAgent()
+    resp = agent.get_commute_route(intent)
+    print(resp.model_dump_json(indent=2))
@@ -0,0 +1,25 @@
+# config.py
+
+"""
+Process-wide configuration loading.
+
+Every module calls `load_env()` where it used to call `load_dotenv()`; the
+.env file is read once per process however many modules ask for it, and
+python-dotenv itself is only imported when that first load happens.
+"""
+
+import threading
+
+_loaded = False
+_lock = threading.Lock()
+
+def load_env() -> None:
+    """Load .env into os.environ (once; existing variables win)."""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _loaded = True
@@ -0,0 +1,116 @@
+# corridor.py
+
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+EARTH_RADIUS_M = 6371000.0
+
+# Largest radius Places Nearby Search accepts
+MAX_PLACES_RADIUS_M = 50000
+# Results per Nearby Search page; a full page may have left places out
+PLACES_PAGE_SIZE = 20
+
+def _distance_m(a: Sequence[float], b: Sequence[float]) -> float:
+    """Equirectangular distance; accurate to well under 1% at corridor scales."""
+    x = math.radians(b[1] - a[1]) * math.cos(math.radians((a[0] + b[0]) / 2))
+    y = math.radians(b[0] - a[0])
+    return EARTH_RADIUS_M * math.hypot(x, y)
+
+def _offset(point: Sequence[float], north_m: float, east_m: float) -> Tuple[float, float]:
+    lat = point[0] + math.degrees(north_m / EARTH_RADIUS_M)
+    lng = point[1] + math.degrees(east_m / (EARTH_RADIUS_M * math.cos(math.radians(point[0]))))
+    return lat, lng
+
+def corridor_length_km(coords: Sequence[Sequence[float]]) -> float:
+    return sum(_distance_m(a, b) for a, b in zip(coords, coords[1:])) / 1000
+
+def corridor_centres(
+    coords: Sequence[Sequence[float]],
+    radius_m: float = 500,
+    half_width_m: float = 250,
+    max_centres: Optional[int] = None
+) -> Tuple[List[Tuple[float, float]], int]:
+    """
+    Query centres (and one shared radius) whose circles cover a buffer of
+    `half_width_m` on each side of the polyline.
+
+    A circle of radius r covers a 2·sqrt(r² − w²) long stretch of a corridor
+    of half-width w, so centres are spaced evenly by at most that along the
+    route. If more than `max_centres` would be needed, the radius grows
+    instead so the same corridor is still covered.
+    """
+    if not coords:
+        return [], int(radius_m)
+    cum = [0.0]
+    for a, b in zip(coords, coords[1:]):
+        cum.append(cum[-1] + _distance_m(a, b))
+    length = cum[-1]
+    if length == 0:
+        return [(coords[0][0], coords[0][1])], int(radius_m)
+
+    spacing = 2 * math.sqrt(max(radius_m ** 2 - half_width_m ** 2, 1.0))
+    n = max(1, math.ceil(length / spacing))
+    if max_centres and n > max_centres:
+        n = max_centres
+        radius_m = min(MAX_PLACES_RADIUS_M, math.hypot(length / n / 2, half_width_m))
+
+    centres = []
+    i = 0
+    for k in range(n):
+        target = (k + 0.5) * length / n
+        while cum[i + 1] < target:
+            i += 1
+        span = cum[i + 1] - cum[i]
+        t = 0.0 if span == 0 else (target - cum[i]) / span
+        a, b = coords[i], coords[i + 1]
+        centres.append((a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1])))
+    return centres, int(math.ceil(radius_m))
+
+class CorridorCoverage:
+    """
+    Circles already searched with one kind of Places query, and their results.
+
+    A new circle whose area already lies inside earlier circles is answered
+    from those results instead of another places_nearby call. Only circles
+    that returned less than a full page count as covering: a full page means
+    Places stopped listing, and a smaller circle inside it may hold more.
+    """
+    # Points just inside a circle's rim checked for coverage, plus its centre
+    RIM_POINTS = 8
+    RIM_FRACTION = 0.98
+
+    def __init__(self):
+        self._circles: List[Tuple[Tuple[float, float], float, List[Dict[str, Any]]]] = []
+        self._complete: List[Tuple[Tuple[float, float], float]] = []
+        self.queries = 0
+        self.skipped = 0
+
+    def _inside_any(self, point: Tuple[float, float]) -> bool:
+        return any(_distance_m(point, c) <= r for c, r in self._complete)
+
+    def covers(self, centre: Tuple[float, float], radius_m: float) -> bool:
+        if not self._complete:
+            return False
+        probes = [centre] + [
+            _offset(centre, self.RIM_FRACTION * radius_m * math.cos(a), self.RIM_FRACTION * radius_m * math.sin(a))
+            for a in (2 * math.pi * k / self.RIM_POINTS for k in range(self.RIM_POINTS))
+        ]
+        return all(self._inside_any(p) for p in probes)
+
+    def results_within(self, centre: Tuple[float, float], radius_m: float) -> List[Dict[str, Any]]:
+        """Earlier results located inside the circle, deduplicated, in query order."""
+        seen = set()
+        out = []
+        for _, _, results in self._circles:
+            for place in results:
+                loc = place["geometry"]["location"]
+                if place["place_id"] in seen or _distance_m(centre, (loc["lat"], loc["lng"])) > radius_m:
+                    continue
+                seen.add(place["place_id"])
+                out.append(place)
+        return out
+
+    def add(self, centre: Tuple[float, float], radius_m: float, results: List[Dict[str, Any]]):
+        self._circles.append((centre, radius_m, results))
+        if len(results) < PLACES_PAGE_SIZE:
+            self._complete.append((centre, radius_m))
@@ -0,0 +1,83 @@
+# deadline.py
+
+import os
+import time
+import threading
+from typing import List, Optional
+from config import load_env
+
+# Load environment variables from .env file
+load_env()
+
+# Ordered quality degradations. Each one kicks in once the remaining share of
+# the budget drops to its threshold, so they are always applied in this order.
+DEGRADATION_STEPS = [
+    ("fewer_places_samples", 0.50),  # sample fewer polyline vertices for places_nearby
+    ("skip_elevation", 0.35),        # drop elevation scoring of alternatives
+    ("first_alternative", 0.25),     # take the first Directions alternative unscored
+    ("skip_llm_extras", 0.15),       # skip the NVIDIA fitness extras call
+]
+_THRESHOLDS = dict(DEGRADATION_STEPS)
+
+# Smallest per-call timeout handed to an upstream client, in seconds
+MIN_CALL_TIMEOUT_S = 0.05
+
+class DeadlineExceeded(RuntimeError):
+    """Raised when a required upstream call cannot start before the deadline."""
+
+class Deadline:
+    """
+    Request-scoped latency budget.
+
+    Created once per request and passed through parse_prompt, the agents and
+    the upstream clients. Upstream calls get `timeout()` as their HTTP timeout;
+    agents ask `should_degrade(step)` before optional work and every step that
+    was applied is listed in `degradations` for the response.
+    """
+    def __init__(self, budget_ms: float):
+        if budget_ms <= 0:
+            raise ValueError("budget_ms must be positive")
+        self.budget_s = budget_ms / 1000
+        self.started = time.monotonic()
+        self.degradations: List[str] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_request(cls, budget_ms: Optional[float] = None) -> Optional["Deadline"]:
+        """Per-request budget, else the global ROUTE_BUDGET_MS, else no deadline."""
+        budget_ms = budget_ms or os.getenv("ROUTE_BUDGET_MS")
+        return cls(float(budget_ms)) if budget_ms else None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        return max(0.0, self.budget_s - self.elapsed())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def fraction_remaining(self) -> float:
+        return self.remaining() / self.budget_s
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """HTTP timeout for the next upstream call, bounded by the remaining budget."""
+        t = self.remaining() if cap is None else min(cap, self.remaining())
+        return max(MIN_CALL_TIMEOUT_S, t)
+
+    def check(self, what: str = "upstream call"):
+        if self.expired():
+            raise DeadlineExceeded(f"Latency budget of {self.budget_s * 1000:.0f} ms exhausted before {what}")
+
+    def should_degrade(self, step: str) -> bool:
+        """True (and recorded) when the budget is tight enough to apply `step`."""
+        if self.fraction_remaining() > _THRESHOLDS[step]:
+            return False
+        with self._lock:
+            if step not in self.degradations:
+                self.degradations.append(step)
+        return True
+
+def should_degrade(deadline: Optional[Deadline], step: str) -> bool:
+    """`deadline.should_degrade(step)`, treating a missing deadline as unlimited."""
+    return deadline is not None and deadline.should_degrade(step)
@@ -0,0 +1,119 @@
+# encoding.py
+
+"""
+Response encodings for the route endpoints.
+
+Clients pick a representation with the Accept header:
+
+- application/json (default): the original response shape, unchanged.
+- application/vnd.mapsai.compact+json: every waypoint list becomes columnar,
+  {"names": [...], "polyline6": "<encoded>", "extra": [...]}, where polyline6
+  is the Google encoded-polyline algorithm (delta-encoded integer
+  coordinates) at precision 6 (~0.1 m). "extra" only appears when waypoints
+  carry keys besides name/lat/lng.
+- application/msgpack: the compact form as MessagePack (needs `msgpack`).
+
+Bodies of at least COMPRESS_MIN_BYTES are compressed with brotli (needs
+`brotli`) or gzip according to Accept-Encoding. JSON is serialized with
+orjson when it is installed.
+"""
+
+import gzip
+import json
+from typing import Any, Dict, Optional
+import polyline
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional encoding
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # optional compression
+    brotli = None
+
+JSON = "application/json"
+COMPACT_JSON = "application/vnd.mapsai.compact+json"
+MSGPACK = "application/msgpack"
+
+POLYLINE_PRECISION = 6
+COMPRESS_MIN_BYTES = 1024
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON bytes with sorted keys, like Flask's jsonify."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+def _is_waypoint_list(value: Any) -> bool:
+    return bool(value) and isinstance(value, list) and all(
+        isinstance(w, dict) and isinstance(w.get("lat"), (int, float)) and isinstance(w.get("lng"), (int, float))
+        for w in value
+    )
+
+def compact(obj: Any) -> Any:
+    """Replace every list of {"name", "lat", "lng", ...} dicts with its columnar form."""
+    if _is_waypoint_list(obj):
+        out: Dict[str, Any] = {
+            "names": [w.get("name") for w in obj],
+            "polyline6": polyline.encode([(w["lat"], w["lng"]) for w in obj], POLYLINE_PRECISION),
+        }
+        extra = [{k: compact(v) for k, v in w.items() if k not in ("name", "lat", "lng")} for w in obj]
+        if any(extra):
+            out["extra"] = [e or None for e in extra]
+        return out
+    if isinstance(obj, dict):
+        return {k: compact(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [compact(v) for v in obj]
+    return obj
+
+def expand(obj: Any) -> Any:
+    """Inverse of `compact` (coordinates rounded to POLYLINE_PRECISION)."""
+    if isinstance(obj, dict) and "polyline6" in obj and "names" in obj:
+        coords = polyline.decode(obj["polyline6"], POLYLINE_PRECISION)
+        extras = obj.get("extra") or [None] * len(coords)
+        return [
+            {"name": name, "lat": lat, "lng": lng, **{k: expand(v) for k, v in (extra or {}).items()}}
+            for name, (lat, lng), extra in zip(obj["names"], coords, extras)
+        ]
+    if isinstance(obj, dict):
+        return {k: expand(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [expand(v) for v in obj]
+    return obj
+
+def available_types():
+    return [JSON, COMPACT_JSON] + ([MSGPACK, "application/x-msgpack"] if msgpack is not None else [])
+
+def respond(body: Dict[str, Any], status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Encode `body` in the representation and compression the request asked for."""
+    mimetype = request.accept_mimetypes.best_match(available_types(), default=JSON)
+    if mimetype == JSON:
+        payload = dumps(body)
+    elif mimetype == COMPACT_JSON:
+        payload = dumps(compact(body))
+    else:
+        mimetype = MSGPACK
+        payload = msgpack.packb(compact(body), use_bin_type=True)
+
+    response = Response(payload, status=status, mimetype=mimetype)
+    response.vary.update(("Accept", "Accept-Encoding"))
+    if len(payload) >= COMPRESS_MIN_BYTES:
+        accepted = request.accept_encodings
+        if brotli is not None and accepted["br"]:
+            response.set_data(brotli.compress(payload, quality=5))
+            response.headers["Content-Encoding"] = "br"
+        elif accepted["gzip"]:
+            response.set_data(gzip.compress(payload, compresslevel=5))
+            response.headers["Content-Encoding"] = "gzip"
+    for name, value in (headers or {}).items():
+        response.headers[name] = value
+    return response
@@ -3,18 +3,20 @@
 import os
 import json
 import re
-import googlemaps
-from dotenv import load_dotenv
-from typing import List, Dict, Any
+from config import load_env
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from models import RouteIntent
 from nvidia_agent import NVIDIAAgent
+from upstream import create_maps_client
+from deadline import Deadline
+from waypoints import WaypointList
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 class FallbackRouteMetrics(BaseModel):
-    waypoints: List[Dict[str, Any]]
+    waypoints: WaypointList
 
 class FallbackAgent:
     """
@@ -24,20 +26,20 @@ class FallbackAgent:
       3) Merging them into one ordered list without duplicates
     """
     def __init__(self, maps_key=None, nvidia_key=None):
-        self.gmaps = googlemaps.Client(key=maps_key or os.getenv("GOOGLE_MAPS_API_KEY"))
+        self.gmaps = create_maps_client(maps_key or os.getenv("GOOGLE_MAPS_API_KEY"))
         nvidia_api_key = nvidia_key or os.getenv("NVIDIA_API_KEY")
         if not nvidia_api_key:
             print("⚠️  WARNING: NVIDIA_API_KEY not found, using mock mode")
         self.nvidia = NVIDIAAgent(api_key=nvidia_api_key)
 
-    def _geocode_name(self, place_name: str) -> Dict[str, float]:
-        resp = self.gmaps.geocode(place_name)
+    def _geocode_name(self, place_name: str, deadline: Optional[Deadline] = None) -> Dict[str, float]:
+        resp = self.gmaps.geocode(place_name, deadline=deadline)
         if not resp:
             raise RuntimeError(f"Geocoding failed for '{place_name}'")
         loc = resp[0]["geometry"]["location"]
         return {"lat": loc["lat"], "lng": loc["lng"]}
 
-    def get_waypoints(self, intent: RouteIntent) -> FallbackRouteMetrics:
+    def get_waypoints(self, intent: RouteIntent, deadline: Optional[Deadline] = None) -> FallbackRouteMetrics:
         # 1) Fixed list: origin + GSR stops
         fixed: List[Dict[str, Any]] = [{"name": intent.origin}]
         if intent.stops:
@@ -51,12 +53,12 @@ class FallbackAgent:
                     })
 
         # 2) Ask NVIDIA model for full waypoint list
-        gpt_wpts = self.nvidia.plan_route(intent.model_dump())
+        gpt_wpts = self.nvidia.plan_route(intent.model_dump(), deadline=deadline)
 
         # 4) Geocode any placeholder coordinates
         for wp in gpt_wpts:
             if not isinstance(wp.get("lat"), (int, float)) or not isinstance(wp.get("lng"), (int, float)):
-                coords = self._geocode_name(wp["name"])
+                coords = self._geocode_name(wp["name"], deadline)
                 wp["lat"], wp["lng"] = coords["lat"], coords["lng"]
 
         # 5) Merge without duplicates, preserving order:
@@ -85,7 +87,7 @@ class FallbackAgent:
         if not merged:
             merged = fixed
 
-        return FallbackRouteMetrics(waypoints=merged)
+        return FallbackRouteMetrics(waypoints=WaypointList(merged))
 
 
 # --- Example Usage ---
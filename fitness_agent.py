@@ -2,59 +2,124 @@
 
 import os
 import re
-import googlemaps
-from dotenv import load_dotenv
+import math
+from config import load_env
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from models import RouteIntent
 from google_text_search import PlacesTextSearchClient
 from nvidia_agent import NVIDIAAgent
+import polyline
+import route_metrics
+from route_metrics import pre_estimate, haversine_m
+from upstream import create_maps_client
+from upstream_scheduler import BULK
+from deadline import Deadline, should_degrade
+from waypoints import WaypointList
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 class FitnessRouteMetrics(BaseModel):
-    waypoints: List[Dict[str, Any]]
+    waypoints: WaypointList
     total_distance_m: int
     total_duration_s: int
     calories_burned: float
+    steps: int = 0
+    elevation_gain_m: float = 0.0
 
 class FitnessAgent:
     """
     - Builds point-to-point (origin→GSR stops→destination) or steps-loop (origin→POI→origin)
-    - Estimates calories via MET × duration
+    - Picks the loop POI from several candidates by haversine pre-estimate, before any Directions call
+    - Estimates calories via grade-adjusted MET × duration (route_metrics)
     - Invokes ChatGPT for extra waypoints if constraints (steps/km/calories) are unmet
     """
-    MET_VALUES = {"walking": 3.3, "bicycling": 6.0}
-    DEFAULT_WEIGHT_KG = 70
+    MET_VALUES = route_metrics.MET_VALUES
+    DEFAULT_WEIGHT_KG = route_metrics.DEFAULT_WEIGHT_KG
+    # Loop POI candidates pre-estimated per request
+    LOOP_CANDIDATES = 5
+    # Pre-estimates outside this fraction of the target are clearly infeasible
+    FEASIBLE_RANGE = (0.5, 3.0)
+    # Elevation samples along the chosen route for grade-adjusted MET
+    ELEVATION_SAMPLES = 32
 
     def __init__(self, maps_key: str = None, places_key: str = None, nvidia_key: str = None):
-        self.gmaps = googlemaps.Client(key=maps_key or os.getenv("GOOGLE_MAPS_API_KEY"))
+        self.gmaps = create_maps_client(maps_key or os.getenv("GOOGLE_MAPS_API_KEY"))
         self.places = PlacesTextSearchClient(places_key or os.getenv("GOOGLE_MAPS_API_KEY"))
         nvidia_api_key = nvidia_key or os.getenv("NVIDIA_API_KEY")
         if not nvidia_api_key:
             print("⚠️  WARNING: NVIDIA_API_KEY not found, using mock mode")
         self.nvidia = NVIDIAAgent(api_key=nvidia_api_key)
 
-    def _geocode(self, addr: str) -> Dict[str, float]:
-        res = self.gmaps.geocode(addr)
+    def _geocode(self, addr: str, deadline: Optional[Deadline] = None) -> Dict[str, float]:
+        res = self.gmaps.geocode(addr, deadline=deadline)
         if not res:
             raise RuntimeError(f"Geocode failed for '{addr}'")
         return res[0]["geometry"]["location"]
 
-    def _estimate_calories(self, duration_s: int, mode: str, weight_kg: float) -> float:
-        met = self.MET_VALUES.get(mode, self.MET_VALUES["walking"])
-        mins = duration_s / 60
-        return (met * 3.5 * weight_kg / 200) * mins
+    def _feasible(self, distance_m: float, target_m: float) -> bool:
+        low, high = self.FEASIBLE_RANGE
+        return low * target_m <= distance_m <= high * target_m
+
+    def _pick_loop_poi(self, origin: Dict[str, float], candidates: List[Dict], mode: str,
+                       target_m: float, weight_kg: float) -> Dict:
+        """
+        The candidate whose out-and-back loop pre-estimate is nearest the
+        target; clearly infeasible ones are only used when nothing else is left.
+        """
+        if not candidates:
+            raise RuntimeError("No park or trail found for the loop")
+        start = (origin["lat"], origin["lng"])
+        scored = []
+        for poi in candidates:
+            est = pre_estimate([start, (poi["latitude"], poi["longitude"])], mode, weight_kg, loop=True)
+            miss = abs(math.log(max(est.distance_m, 1.0) / target_m))
+            scored.append((not self._feasible(est.distance_m, target_m), miss, poi))
+        return min(scored, key=lambda s: s[:2])[2]
+
+    def _feasible_extras(self, end: Dict[str, float], extras: List[Dict], total_m: float,
+                         target_m: Optional[float]) -> List[Dict]:
+        """
+        LLM-suggested extras that are usable: numeric coordinates, and an
+        out-and-back detour from the route's end that doesn't overshoot the target.
+        """
+        kept = []
+        last = (end["lat"], end["lng"])
+        for wp in extras:
+            if not isinstance(wp, dict) or not all(isinstance(wp.get(k), (int, float)) for k in ("lat", "lng")):
+                continue
+            added = 2 * haversine_m(last, (wp["lat"], wp["lng"])) * route_metrics.DETOUR_FACTOR
+            if target_m and total_m + added > self.FEASIBLE_RANGE[1] * target_m:
+                continue
+            kept.append(wp)
+            total_m += added
+            last = (wp["lat"], wp["lng"])
+        return kept
+
+    def _elevations(self, coords: List, deadline: Optional[Deadline]) -> Optional[List[float]]:
+        """Elevations at even spacing along the route, or None when skipped or unavailable."""
+        if len(coords) < 2 or should_degrade(deadline, "skip_elevation"):
+            return None
+        try:
+            points = self.gmaps.elevation_along_path(path=coords, samples=min(len(coords), self.ELEVATION_SAMPLES),
+                                                     deadline=deadline, priority=BULK)
+        except Exception as e:
+            # Calories fall back to level ground; the route itself is fine
+            print(f"Warning: elevation lookup failed: {str(e)}")
+            return None
+        return [p["elevation"] for p in points]
 
     def get_fitness_route(
         self,
         intent: RouteIntent,
-        weight_kg: Optional[float] = None
+        weight_kg: Optional[float] = None,
+        deadline: Optional[Deadline] = None
     ) -> FitnessRouteMetrics:
         mode = (intent.travel_modes or ["walking"])[0].lower()
         if mode not in self.MET_VALUES:
             raise ValueError(f"Unsupported mode: {mode}")
+        weight_kg = weight_kg or self.DEFAULT_WEIGHT_KG
 
         # 1) Parse constraints
         steps_m = None; target_m = None; target_cal = None
@@ -70,21 +135,29 @@ class FitnessAgent:
         origin = intent.origin
         dest   = intent.destination or origin
 
+        # Level-ground distance that meets every target, for pre-estimates
+        target_dist = route_metrics.target_distance_m(mode, max(target_m or 0, steps_m or 0) or None,
+                                                      calories_kcal=target_cal, weight_kg=weight_kg)
+
         # 3) Base route (steps-loop or point-to-point)
         if steps_m and origin == dest:
-            loc = self._geocode(origin)
-            poi = self.places.search(
+            loc = self._geocode(origin, deadline)
+            candidates = self.places.search(
                 query="park|trail",
                 location=(loc["lat"], loc["lng"]),
-                radius=int(steps_m)
-            )[0]
+                radius=int(steps_m),
+                deadline=deadline,
+                top_k=self.LOOP_CANDIDATES
+            )
+            poi = self._pick_loop_poi(loc, candidates, mode, target_dist, weight_kg)
             wp = f"{poi['latitude']},{poi['longitude']}"
             directions = self.gmaps.directions(
                 origin=(loc["lat"], loc["lng"]),
                 destination=(loc["lat"], loc["lng"]),
                 mode=mode,
                 waypoints=[wp],
-                optimize_waypoints=True
+                optimize_waypoints=True,
+                deadline=deadline
             )
         else:
             wp_coords = []
@@ -93,67 +166,71 @@ class FitnessAgent:
                     if gsr := stop.get("gsr"):
                         g = gsr[0]
                         wp_coords.append(f"{g['latitude']},{g['longitude']}")
-            start = self._geocode(origin)
-            end   = self._geocode(dest)
+            start = self._geocode(origin, deadline)
+            end   = self._geocode(dest, deadline)
             directions = self.gmaps.directions(
                 origin=(start["lat"], start["lng"]),
                 destination=(end["lat"], end["lng"]),
                 mode=mode,
                 waypoints=wp_coords or None,
-                optimize_waypoints=bool(intent.optimize_waypoints)
+                optimize_waypoints=bool(intent.optimize_waypoints),
+                deadline=deadline
             )
 
         if not directions:
             raise RuntimeError("No route found")
         route = directions[0]
 
-        # 4) Totals
+        # 4) Totals, with effort from the route's shape and elevation profile
         total_dist = sum(leg["distance"]["value"] for leg in route["legs"])
         total_dur  = sum(leg["duration"]["value"] for leg in route["legs"])
-        calories   = self._estimate_calories(total_dur, mode, weight_kg or self.DEFAULT_WEIGHT_KG)
+        coords = polyline.decode(route["overview_polyline"]["points"]) if route.get("overview_polyline") else []
+        metrics = route_metrics.measure(coords, mode, duration_s=total_dur,
+                                        elevations=self._elevations(coords, deadline),
+                                        weight_kg=weight_kg, distance_m=total_dist)
+        calories = metrics.calories
 
         # 5) Build waypoints list
-        out = []
+        out = WaypointList()
         start_loc = route["legs"][0]["start_location"]
-        out.append({"name": origin, "lat": start_loc["lat"], "lng": start_loc["lng"]})
+        out.append(origin, start_loc["lat"], start_loc["lng"])
 
         if steps_m and origin == dest:
-            out.append({"name": poi["name"], "lat": poi["latitude"], "lng": poi["longitude"]})
-            out.append({"name": origin, "lat": start_loc["lat"], "lng": start_loc["lng"]})
+            out.append(poi["name"], poi["latitude"], poi["longitude"])
+            out.append(origin, start_loc["lat"], start_loc["lng"])
         else:
             if intent.stops:
                 for stop in intent.stops:
                     if gsr := stop.get("gsr"):
                         g = gsr[0]
-                        out.append({"name": g["name"], "lat": g["latitude"], "lng": g["longitude"]})
+                        out.append(g["name"], g["latitude"], g["longitude"])
             end_loc = route["legs"][-1]["end_location"]
-            out.append({"name": dest, "lat": end_loc["lat"], "lng": end_loc["lng"]})
+            out.append(dest, end_loc["lat"], end_loc["lng"])
 
         # 6) If constraints unmet, ask NVIDIA model for extras
-        unmet = (
-            (target_m   and total_dist < target_m) or
-            (steps_m    and total_dist < steps_m) or
-            (target_cal and calories < target_cal)
-        )
-        if unmet:
+        unmet = not metrics.meets(distance_m=max(target_m or 0, steps_m or 0) or None, calories=target_cal)
+        if unmet and not should_degrade(deadline, "skip_llm_extras"):
             current_metrics = {
                 "distance_m": total_dist,
                 "duration_s": total_dur,
                 "calories": calories
             }
             extras = self.nvidia.optimize_fitness_route(
-                current_route=out,
+                current_route=out.to_json(),
                 constraints=intent.constraints,
                 mode=mode,
-                current_metrics=current_metrics
+                current_metrics=current_metrics,
+                deadline=deadline
             )
-            out.extend(extras)
+            out.extend(self._feasible_extras(route["legs"][-1]["end_location"], extras, total_dist, target_dist))
 
         return FitnessRouteMetrics(
             waypoints=out,
             total_distance_m=total_dist,
             total_duration_s=total_dur,
-            calories_burned=round(calories, 2)
+            calories_burned=round(calories, 2),
+            steps=metrics.steps,
+            elevation_gain_m=round(metrics.ascent_m, 1)
         )
 
 # Example Usage
@@ -0,0 +1,209 @@
+# gazetteer.py
+
+import os
+import re
+import json
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Set
+from config import load_env
+
+# Load environment variables from .env file
+load_env()
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.json")
+
+_NON_WORD = re.compile(r"[^\w]+")
+_DIGITS = re.compile(r"\d+")
+
+def normalize_name(name: str) -> str:
+    """Case-fold and reduce punctuation/whitespace runs to single spaces."""
+    return _NON_WORD.sub(" ", name.casefold()).strip()
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up (returning limit + 1) once it exceeds `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+class Gazetteer:
+    """
+    Known place names and aliases → coordinates, consulted before geocoding.
+
+    Lookups are an exact match on the normalized name, then a fuzzy match
+    (a trigram index narrows candidates, a bounded edit distance confirms)
+    so small typos still resolve. Names containing numbers only match
+    exactly, so "124 Main St" never resolves to "123 Main St".
+
+    Confident geocode results are learned into a bounded LRU and, when
+    `learned_path` is set, appended there as JSON lines for the next start.
+    """
+    # Fuzzy matching: minimum trigram overlap, and edits allowed per name length
+    MIN_TRIGRAM_SIMILARITY = 0.5
+    MIN_FUZZY_LENGTH = 6
+
+    def __init__(self, places: Optional[List[Dict[str, Any]]] = None, max_learned: int = 5000,
+                 learned_path: Optional[str] = None):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._learned: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._grams: Dict[str, Set[str]] = defaultdict(set)
+        self._gram_counts: Dict[str, int] = {}
+        self.max_learned = max_learned
+        self.learned_path = learned_path
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        for place in places or []:
+            entry = self._entry(place["name"], place["lat"], place["lng"], place.get("formatted_address"))
+            for name in [place["name"]] + list(place.get("aliases", [])):
+                self._add(normalize_name(name), entry)
+        if learned_path and os.path.exists(learned_path):
+            with open(learned_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                        self._remember(item["key"], self._entry(item["name"], item["lat"], item["lng"],
+                                                                item.get("formatted_address")))
+                    except (ValueError, KeyError):
+                        continue
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "Gazetteer":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    @staticmethod
+    def _entry(name: str, lat: float, lng: float, formatted_address: Optional[str] = None) -> Dict[str, Any]:
+        """A geocode-shaped result, so callers can't tell it from the live API."""
+        return {
+            "formatted_address": formatted_address or name,
+            "geometry": {"location": {"lat": float(lat), "lng": float(lng)}, "location_type": "GAZETTEER"},
+            "types": ["gazetteer"],
+        }
+
+    def _add(self, key: str, entry: Dict[str, Any]):
+        if not key:
+            return
+        self._entries[key] = entry
+        grams = _trigrams(key)
+        self._gram_counts[key] = len(grams)
+        for gram in grams:
+            self._grams[gram].add(key)
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        if key in self._entries:
+            return
+        self._learned[key] = entry
+        self._learned.move_to_end(key)
+        while len(self._learned) > self.max_learned:
+            self._learned.popitem(last=False)
+
+    def resolve(self, name: str) -> Optional[Dict[str, Any]]:
+        """Geocode-shaped result for a known name, or None."""
+        key = normalize_name(name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._learned.get(key)
+                if entry is not None:
+                    self._learned.move_to_end(key)
+            if entry is None:
+                entry = self._fuzzy(key)
+                if entry is not None:
+                    self.fuzzy_hits += 1
+                    # The same misspelling resolves exactly next time
+                    self._remember(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def _fuzzy(self, key: str) -> Optional[Dict[str, Any]]:
+        if len(key) < self.MIN_FUZZY_LENGTH or _DIGITS.search(key):
+            return None
+        grams = _trigrams(key)
+        counts: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self._grams.get(gram, ()):
+                counts[candidate] += 1
+        limit = 1 if len(key) < 14 else 2
+        best, best_distance = None, limit + 1
+        for candidate, shared in counts.items():
+            # Jaccard similarity of the trigram sets
+            if shared / (len(grams) + self._gram_counts[candidate] - shared) < self.MIN_TRIGRAM_SIMILARITY:
+                continue
+            if _DIGITS.search(candidate):
+                continue
+            distance = _edit_distance(key, candidate, limit)
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return self._entries[best] if best is not None else None
+
+    def learn(self, name: str, results: Any):
+        """Remember an unambiguous, exact geocode answer for `name`."""
+        if not isinstance(results, list) or len(results) != 1:
+            return
+        result = results[0]
+        if result.get("partial_match") or "geometry" not in result:
+            return
+        key = normalize_name(name)
+        if not key:
+            return
+        loc = result["geometry"]["location"]
+        entry = self._entry(name, loc["lat"], loc["lng"], result.get("formatted_address"))
+        with self._lock:
+            if key in self._entries or key in self._learned:
+                return
+            self._remember(key, entry)
+            if self.learned_path:
+                try:
+                    with open(self.learned_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({"key": key, "name": name, "lat": loc["lat"], "lng": loc["lng"],
+                                            "formatted_address": result.get("formatted_address")}) + "\n")
+                except OSError as e:
+                    print(f"Warning: could not persist gazetteer entry: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"names": len(self._entries), "learned": len(self._learned), "hits": self.hits,
+                    "fuzzy_hits": self.fuzzy_hits, "misses": self.misses}
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """
+    Process-wide gazetteer (GAZETTEER_PATH, GAZETTEER_LEARNED_PATH,
+    GAZETTEER_MAX_LEARNED), or None when GAZETTEER_ENABLED=0.
+    """
+    global _gazetteer
+    if os.getenv("GAZETTEER_ENABLED", "1") == "0":
+        return None
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                kwargs = {
+                    "max_learned": int(os.getenv("GAZETTEER_MAX_LEARNED", "5000")),
+                    "learned_path": os.getenv("GAZETTEER_LEARNED_PATH") or None,
+                }
+                path = os.getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER_PATH)
+                try:
+                    _gazetteer = Gazetteer.from_file(path, **kwargs)
+                except (OSError, ValueError) as e:
+                    print(f"Warning: gazetteer unavailable ({str(e)}), starting empty")
+                    _gazetteer = Gazetteer(**kwargs)
+    return _gazetteer
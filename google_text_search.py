@@ -1,31 +1,125 @@
 import requests
 import os
-from dotenv import load_dotenv
-from typing import Optional, Tuple, List, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import load_env
+from typing import Optional, Tuple, List, Dict, Sequence
+from upstream import (maps_base_url, memoized, DEFAULT_TIMEOUT_S, current_memo, current_trace,
+                      memo_scope, trace_scope)
+from deadline import Deadline
+from upstream_scheduler import get_scheduler, INTERACTIVE
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
+
+# Results kept per cached search; `top_k` trims the cached window, so
+# searches differing only in top_k share one upstream call
+RESULT_WINDOW = 5
+
+# Location bias is snapped to this many decimals (2 ~ 1.1 km) so nearby
+# requests for the same query share a cache entry
+LOCATION_DECIMALS = 2
+
+# Concurrent searches in one search_many() call
+MAX_PARALLEL = 4
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _http_session() -> requests.Session:
+    """One keep-alive connection pool shared by every PlacesTextSearchClient."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = requests.Session()
+    return _session
 
 class PlacesTextSearchClient:
     """
     Client for the Google Places Text Search API, returning only the top 
     results, each with name, formatted_address, latitude, and longitude.
+
+    Answers go through the upstream caches keyed by query, location (snapped
+    to LOCATION_DECIMALS), radius and type, so repeated stop and POI lookups
+    near the same place are cache hits.
     """
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, top_k: int = 1, location_decimals: int = LOCATION_DECIMALS):
         self.api_key = api_key
-        self.base_url = "https://maps.googleapis.com/maps/api/place/textsearch/json"  # :contentReference[oaicite:0]{index=0}
+        self.base_url = f"{maps_base_url()}/maps/api/place/textsearch/json"  # :contentReference[oaicite:0]{index=0}
+        self.top_k = top_k
+        self.location_decimals = location_decimals
 
     def search(
         self,
         query: str,
         location: Optional[Tuple[float, float]] = None,
         radius: int = 5000,
-        place_type: Optional[str] = None
+        place_type: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        priority: str = INTERACTIVE,
+        top_k: Optional[int] = None
     ) -> List[Dict]:
         """
-        Perform a text search for places, returning up to 1 results
-        with name, address, lat, and lng.
+        Perform a text search for places, returning up to `top_k` (default:
+        the client's, 1) results with name, address, lat, and lng.
+        """
+        top_k = self.top_k if top_k is None else top_k
+        if top_k > RESULT_WINDOW:
+            raise ValueError(f"top_k can be at most {RESULT_WINDOW}")
+        if location:
+            location = (round(location[0], self.location_decimals), round(location[1], self.location_decimals))
+        results = memoized(
+            "text_search",
+            (query, location, radius, place_type, RESULT_WINDOW),
+            {},
+            lambda: self._search(query, location, radius, place_type, deadline, priority)
+        )
+        return results[:top_k]
+
+    def search_many(
+        self,
+        queries: Sequence[str],
+        location: Optional[Tuple[float, float]] = None,
+        radius: int = 5000,
+        place_type: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        priority: str = INTERACTIVE,
+        top_k: Optional[int] = None
+    ) -> List[List[Dict]]:
+        """
+        search() for every query concurrently, results in query order.
+        Duplicate queries are searched once. A query whose search fails
+        (or runs out of budget) yields [] with a warning.
         """
+        unique = list(dict.fromkeys(queries))
+        memo, trace = current_memo(), current_trace()
+
+        def one(query: str) -> List[Dict]:
+            with memo_scope(memo), trace_scope(trace):
+                try:
+                    return self.search(query, location, radius, place_type, deadline, priority, top_k)
+                except Exception as e:
+                    print(f"Warning: Google search failed for '{query}': {str(e)}")
+                    return []
+
+        if len(unique) <= 1:
+            found = [one(q) for q in unique]
+        else:
+            with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL, len(unique))) as pool:
+                found = list(pool.map(one, unique))
+        by_query = dict(zip(unique, found))
+        return [list(by_query[q]) for q in queries]
+
+    def _search(
+        self,
+        query: str,
+        location: Optional[Tuple[float, float]],
+        radius: int,
+        place_type: Optional[str],
+        deadline: Optional[Deadline],
+        priority: str
+    ) -> List[Dict]:
         params = {
             "query": query,
             "key": self.api_key
@@ -36,11 +130,21 @@ class PlacesTextSearchClient:
         if place_type:
             params["type"] = place_type
 
-        response = requests.get(self.base_url, params=params)
+        with get_scheduler().slot("text_search", priority, deadline):
+            if deadline is not None:
+                deadline.check("text search")
+                timeout = deadline.timeout(DEFAULT_TIMEOUT_S)
+            else:
+                timeout = DEFAULT_TIMEOUT_S
+            response = _http_session().get(self.base_url, params=params, timeout=timeout)
         response.raise_for_status()
         data = response.json()
+        # Quota and key errors come back as HTTP 200 with no results; raise so they are not cached
+        status = data.get("status", "OK")
+        if status not in ("OK", "ZERO_RESULTS"):
+            raise RuntimeError(f"Text Search failed: {status} {data.get('error_message', '')}".rstrip())
 
-        results = data.get("results", [])[:1]  # top 1 only :contentReference[oaicite:1]{index=1}
+        results = data.get("results", [])[:RESULT_WINDOW]  # the rest of the page is never used
 
         enriched = []
         for place in results:
@@ -81,7 +185,8 @@ if __name__ == "__main__":
         "sushi place",
         location=sf_location,
         radius=3000,
-        place_type="restaurant"
+        place_type="restaurant",
+        top_k=3
     )
     # Iterate through up to three enriched results
     for place in sushi_places:
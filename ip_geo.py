@@ -0,0 +1,283 @@
+# ip_geo.py
+
+"""
+Local IP-prefix → location table used to bias searches toward the user.
+
+Prefixes (IPv4 and IPv6 CIDRs) live in a CSV:
+
+    prefix,country,region,city,latitude,longitude,accuracy_km,timezone
+    2607:f140::/32,US,California,Berkeley,37.8716,-122.2727,5,America/Los_Angeles
+
+(timezone, an IANA zone name, is optional.)
+
+and are compiled into a binary trie file that is memory-mapped for lookups:
+
+    python ip_geo.py build data/ip_prefixes.csv data/ip_prefixes.bin
+    python ip_geo.py lookup 2607:f140:6000:800e::1
+
+IPv4 addresses are stored as IPv4-mapped IPv6 (::ffff:a.b.c.d), so one trie
+answers both. The trie is path-compressed, so a longest-prefix lookup only
+visits branching points and stored prefixes rather than one node per bit.
+"""
+
+import os
+import csv
+import sys
+import json
+import mmap
+import socket
+import time
+import struct
+import hashlib
+import tempfile
+import threading
+import ipaddress
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+from config import load_env
+
+# Load environment variables from .env file
+load_env()
+
+MAGIC = b"IPGEO2\0\0"
+# magic, node count, location blob length
+HEADER = struct.Struct("<8sII")
+# Node record (uint32s): child for bit 0, child for bit 1, location index,
+# prefix length, then the 128-bit prefix as four big-endian-ordered words
+NODE_WORDS = 8
+NO_CHILD = 0xFFFFFFFF
+NO_LOCATION = 0xFFFFFFFF
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ip_prefixes.csv")
+
+def _network_bits(prefix: str) -> Tuple[int, int]:
+    """(128-bit network value, prefix length) with IPv4 mapped into ::ffff:0:0/96."""
+    net = ipaddress.ip_network(prefix.strip(), strict=False)
+    if net.version == 4:
+        return (0xFFFF << 32) | int(net.network_address), 96 + net.prefixlen
+    return int(net.network_address), net.prefixlen
+
+def _address_bits(address: str) -> int:
+    # inet_pton is an order of magnitude faster than the ipaddress module
+    address = address.strip()
+    try:
+        if ":" in address:
+            return int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+        return (0xFFFF << 32) | int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+    except OSError:
+        raise ValueError(f"Invalid IP address: {address!r}")
+
+def build(rows: List[Dict[str, str]]) -> bytes:
+    """Compile prefix rows into the path-compressed (radix) trie format."""
+    locations: List[Dict[str, Any]] = []
+    location_ids: Dict[str, int] = {}
+    # Uncompressed binary trie first: {(value, length): location}
+    prefixes: Dict[Tuple[int, int], int] = {}
+    for row in rows:
+        value, length = _network_bits(row["prefix"])
+        loc = {
+            "country": row["country"],
+            "region": row.get("region") or None,
+            "city": row.get("city") or None,
+            "latitude": float(row["latitude"]),
+            "longitude": float(row["longitude"]),
+            "accuracy_km": float(row.get("accuracy_km") or 50),
+            "timezone": row.get("timezone") or None,
+        }
+        loc_key = json.dumps(loc, sort_keys=True)
+        if loc_key not in location_ids:
+            location_ids[loc_key] = len(locations)
+            locations.append(loc)
+        prefixes[(value, length)] = location_ids[loc_key]
+
+    # Only the root, prefixes and branching points become nodes; single-child
+    # chains in between are skipped (each node carries its full prefix)
+    nodes = array("I")
+
+    def emit(value: int, length: int, members: List[Tuple[int, int]]) -> int:
+        index = len(nodes) // NODE_WORDS
+        nodes.extend((NO_CHILD, NO_CHILD, prefixes.get((value, length), NO_LOCATION), length,
+                      (value >> 96) & 0xFFFFFFFF, (value >> 64) & 0xFFFFFFFF,
+                      (value >> 32) & 0xFFFFFFFF, value & 0xFFFFFFFF))
+        below = [m for m in members if m[1] > length]
+        for bit in (0, 1):
+            side = [m for m in below if (m[0] >> (127 - length)) & 1 == bit]
+            if not side:
+                continue
+            # Descend to where this side's prefixes next branch or end
+            child_len = min(m[1] for m in side)
+            first = side[0][0]
+            for other, _ in side:
+                # Length of the bits shared with the first prefix
+                child_len = min(child_len, 128 - (first ^ other).bit_length())
+            child_value = first & ~((1 << (128 - child_len)) - 1) if child_len else 0
+            nodes[index * NODE_WORDS + bit] = emit(child_value, child_len, side)
+        return index
+
+    emit(0, 0, sorted(prefixes))
+    blob = json.dumps(locations, separators=(",", ":")).encode("utf-8")
+    if sys.byteorder != "little":
+        nodes.byteswap()
+    return HEADER.pack(MAGIC, len(nodes) // NODE_WORDS, len(blob)) + nodes.tobytes() + blob
+
+def compiled_path(csv_path: str) -> str:
+    """
+    Where a CSV is compiled to: next to it, or in the temp directory when its
+    directory isn't writable (a read-only deploy).
+    """
+    directory = os.path.dirname(os.path.abspath(csv_path))
+    name = os.path.basename(csv_path)[:-4]
+    if os.access(directory, os.W_OK):
+        return os.path.join(directory, name + ".bin")
+    digest = hashlib.sha1(os.path.abspath(csv_path).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"mapsai-{name}-{digest}.bin")
+
+def build_file(csv_path: str, bin_path: str):
+    """Compile a CSV into a trie file, atomically replacing any existing one."""
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = [r for r in csv.DictReader(f) if r.get("prefix") and not r["prefix"].startswith("#")]
+    tmp = f"{bin_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(build(rows))
+    # Readers keep their old mapping; new loads see the new file
+    os.replace(tmp, bin_path)
+
+class IPGeoTable:
+    """A memory-mapped compiled trie."""
+    def __init__(self, bin_path: str):
+        self.path = bin_path
+        with open(bin_path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size:
+            raise ValueError(f"{bin_path} is too short to be an IP prefix table")
+        magic, node_count, blob_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{bin_path} is not an IP prefix table")
+        start = HEADER.size
+        end = start + node_count * NODE_WORDS * 4
+        self._nodes = memoryview(self._mm)[start:end].cast("I")
+        self._locations = json.loads(self._mm[end:end + blob_len].decode("utf-8"))
+        self.nodes = node_count
+
+    def lookup(self, address: str) -> Optional[Dict[str, Any]]:
+        """Location of the longest matching prefix, or None."""
+        try:
+            value = _address_bits(address)
+        except ValueError:
+            return None
+        nodes = self._nodes
+        node, best = 0, NO_LOCATION
+        while node != NO_CHILD:
+            base = node * NODE_WORDS
+            length = nodes[base + 3]
+            if length:
+                prefix = (nodes[base + 4] << 96) | (nodes[base + 5] << 64) | (nodes[base + 6] << 32) | nodes[base + 7]
+                if (value ^ prefix) >> (128 - length):
+                    break
+            if nodes[base + 2] != NO_LOCATION:
+                best = nodes[base + 2]
+            if length == 128:
+                break
+            node = nodes[base + ((value >> (127 - length)) & 1)]
+        return None if best == NO_LOCATION else self._locations[best]
+
+class IPGeoDB:
+    """
+    Hot-reloading wrapper: at most every `check_s` seconds it looks at the
+    CSV and compiled file mtimes, recompiles a newer CSV and swaps in a
+    fresh mapping. In-flight lookups keep using the table they started with.
+    """
+    def __init__(self, path: str = DEFAULT_DB_PATH, check_s: float = 30):
+        if path.endswith(".csv"):
+            self.csv_path: Optional[str] = path
+            self.bin_path = compiled_path(path)
+        else:
+            self.csv_path, self.bin_path = None, path
+        self.check_s = check_s
+        self._table: Optional[IPGeoTable] = None
+        self._loaded_mtime = 0.0
+        self._built_csv_mtime = 0.0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.reload()
+
+    def _mtime(self, path: Optional[str]) -> float:
+        try:
+            return os.path.getmtime(path) if path else 0.0
+        except OSError:
+            return 0.0
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompile/remap if the source changed; returns True when a new table was loaded."""
+        with self._lock:
+            self._checked = time.monotonic()
+            csv_mtime, bin_mtime = self._mtime(self.csv_path), self._mtime(self.bin_path)
+            # Rebuild when the CSV changed since we last compiled it (or is
+            # newer than a compiled file left by a previous process)
+            if csv_mtime and csv_mtime != self._built_csv_mtime and (
+                self._built_csv_mtime or csv_mtime > bin_mtime
+            ):
+                build_file(self.csv_path, self.bin_path)
+                bin_mtime = self._mtime(self.bin_path)
+            self._built_csv_mtime = csv_mtime
+            if not bin_mtime or (not force and self._table is not None and bin_mtime == self._loaded_mtime):
+                return False
+            self._table = IPGeoTable(self.bin_path)
+            self._loaded_mtime = bin_mtime
+            self.reloads += 1
+            return True
+
+    def lookup(self, address: str) -> Optional[Dict[str, Any]]:
+        if time.monotonic() - self._checked > self.check_s:
+            try:
+                self.reload()
+            except Exception as e:
+                # Keep serving the previous table
+                print(f"Warning: IP prefix table reload failed: {str(e)}")
+        table = self._table
+        return table.lookup(address) if table is not None else None
+
+_db: Optional[IPGeoDB] = None
+_db_lock = threading.Lock()
+# (path, mtime) of the last table that failed to load, so it isn't retried per request
+_failed: Optional[Tuple[str, float]] = None
+
+def get_ip_geo() -> Optional[IPGeoDB]:
+    """
+    Process-wide prefix table (IP_GEO_DB, IP_GEO_RELOAD_S), or None when
+    unavailable. A failed load is retried only once the file changes.
+    """
+    global _db, _failed
+    if _db is None:
+        path = os.getenv("IP_GEO_DB", DEFAULT_DB_PATH)
+        try:
+            attempt = (path, os.path.getmtime(path))
+        except OSError:
+            attempt = (path, 0.0)
+        if _failed == attempt:
+            return None
+        with _db_lock:
+            if _db is None:
+                if _failed == attempt:
+                    return None
+                try:
+                    _db = IPGeoDB(path, check_s=float(os.getenv("IP_GEO_RELOAD_S", "30")))
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"Warning: IP prefix table unavailable: {str(e)}")
+                    _failed = attempt
+                    return None
+    return _db
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        build_file(sys.argv[2], sys.argv[3])
+        print(f"Wrote {sys.argv[3]} ({IPGeoTable(sys.argv[3]).nodes} trie nodes)")
+    elif len(sys.argv) == 3 and sys.argv[1] == "lookup":
+        db = get_ip_geo()
+        started = time.perf_counter()
+        result = db.lookup(sys.argv[2]) if db else None
+        print(json.dumps(result), f"({(time.perf_counter() - started) * 1e6:.1f} µs)")
+    else:
+        print("usage: python ip_geo.py build <prefixes.csv> <prefixes.bin> | lookup <address>")
+        sys.exit(2)
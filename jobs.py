@@ -0,0 +1,121 @@
+# jobs.py
+
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from config import load_env
+
+# Load environment variables from .env file
+load_env()
+
+class JobQueueFull(RuntimeError):
+    """Raised when the job pool already has `max_pending` queued or running jobs."""
+
+class Job:
+    __slots__ = ("id", "status", "result", "error", "http_status", "created", "finished", "_done")
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"  # queued → running → done | failed
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.http_status = 200
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self._done = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"job_id": self.id, "status": self.status}
+        if self.status == "done":
+            out["result"] = self.result
+        elif self.status == "failed":
+            out["error"] = self.error
+            if self.result:
+                out.update({k: v for k, v in self.result.items() if k != "error"})
+        return out
+
+class JobQueue:
+    """
+    Bounded worker pool for heavy /api/route requests (Scenic, Road-Trip).
+
+    `submit` returns immediately with a Job; the work function runs on one of
+    `workers` threads and must return (response_dict, http_status). Finished
+    jobs are kept for `ttl_s` seconds for clients to poll or long-poll.
+    """
+    def __init__(self, workers: int = 4, max_pending: int = 64, ttl_s: float = 600):
+        self.max_pending = max_pending
+        self.ttl_s = ttl_s
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="route-job")
+        self._jobs: Dict[str, Job] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[], Any]) -> Job:
+        self._reap()
+        job = Job()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"Job queue is full ({self.max_pending} pending)")
+            self._pending += 1
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[], Any]):
+        job.status = "running"
+        try:
+            body, status = fn()
+            job.http_status = status
+            if status == 200:
+                job.result, job.status = body, "done"
+            else:
+                job.result, job.error, job.status = body, body.get("error"), "failed"
+        except Exception as e:
+            job.error, job.http_status, job.status = str(e), 500, "failed"
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._pending -= 1
+            job._done.set()
+
+    def get(self, job_id: str, wait_s: float = 0) -> Optional[Job]:
+        """Look up a job, optionally blocking up to `wait_s` seconds for it to finish."""
+        self._reap()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None and wait_s > 0:
+            job._done.wait(wait_s)
+        return job
+
+    def _reap(self):
+        cutoff = time.time() - self.ttl_s
+        with self._lock:
+            expired = [jid for jid, j in self._jobs.items() if j.finished and j.finished < cutoff]
+            for jid in expired:
+                del self._jobs[jid]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """Process-wide job queue sized from ROUTE_JOB_WORKERS / ROUTE_JOB_MAX_PENDING / ROUTE_JOB_TTL_S."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(
+                    workers=int(os.getenv("ROUTE_JOB_WORKERS", "4")),
+                    max_pending=int(os.getenv("ROUTE_JOB_MAX_PENDING", "64")),
+                    ttl_s=float(os.getenv("ROUTE_JOB_TTL_S", "600")),
+                )
+    return _queue
@@ -0,0 +1,130 @@
+# json_extract.py
+
+"""
+Tolerant extraction of the JSON value in an LLM reply.
+
+Models wrap JSON in code fences or prose, and make a few habitual mistakes:
+trailing commas, single-quoted strings, unquoted keys, Python literals
+(True/False/None) and, when max_tokens cuts them off, unclosed brackets.
+`extract_json` finds the first JSON object or array in the reply and
+repairs those mistakes in one left-to-right scan instead of throwing, so a
+slightly malformed answer doesn't cost another round trip.
+"""
+
+import json
+from typing import Any, Callable, List, Optional
+
+_CLOSERS = {"{": "}", "[": "]"}
+_LITERALS = {"True": "true", "False": "false", "None": "null",
+             "true": "true", "false": "false", "null": "null"}
+
+# Candidate start positions tried before giving up (prose can contain brackets)
+MAX_CANDIDATES = 4
+
+class JSONExtractError(ValueError):
+    """No JSON value of the expected kind could be recovered from the text."""
+
+def _strip_trailing_comma(out: List[str]):
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i]
+
+def _repair(text: str, start: int) -> str:
+    """Repaired JSON text of the bracketed value opening at text[start]."""
+    out: List[str] = []
+    stack: List[str] = []
+    quote: Optional[str] = None
+    i, n = start, len(text)
+    while i < n:
+        ch = text[i]
+        if quote is not None:
+            if ch == "\\" and i + 1 < n:
+                nxt = text[i + 1]
+                # \' is only meaningful inside the single-quoted strings we rewrite
+                out.append("'" if nxt == "'" else ch + nxt)
+                i += 2
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+            out.append(ch)
+        elif ch in "}]":
+            _strip_trailing_comma(out)
+            # A mismatched closer ends the value where it stands
+            while stack and stack[-1] != ch:
+                out.append(stack.pop())
+            if stack:
+                out.append(stack.pop())
+            if not stack:
+                return "".join(out)
+        elif ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (text[j].isalnum() or text[j] in "_-"):
+                j += 1
+            word = text[i:j]
+            k = j
+            while k < n and text[k] in " \t":
+                k += 1
+            if k < n and text[k] == ":" and stack and stack[-1] == "}":
+                out.append(f'"{word}"')  # unquoted key
+            else:
+                out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    # Truncated reply: close the open string and brackets
+    if quote is not None:
+        out.append('"')
+    _strip_trailing_comma(out)
+    while out and out[-1] in (":", " "):
+        out.pop()
+    out.extend(reversed(stack))
+    return "".join(out)
+
+def extract_json(text: str, expect: Optional[type] = None,
+                 accept: Optional[Callable[[Any], bool]] = None) -> Any:
+    """
+    Parse the first JSON object or array in `text`, repairing common
+    model mistakes. `expect` (dict or list) restricts which kind is
+    looked for, and `accept` can reject a candidate (e.g. a "[3]" in the
+    prose before the real array). Raises JSONExtractError when nothing parses.
+    """
+    openers = {dict: "{", list: "["}.get(expect, "{[")
+    tried = 0
+    i = 0
+    while tried < MAX_CANDIDATES:
+        starts = [p for p in (text.find(o, i) for o in openers) if p != -1]
+        if not starts:
+            break
+        start = min(starts)
+        tried += 1
+        try:
+            value = json.loads(_repair(text, start))
+        except ValueError:
+            i = start + 1
+            continue
+        if (expect is None or isinstance(value, expect)) and (accept is None or accept(value)):
+            return value
+        i = start + 1
+    snippet = text[:80].replace("\n", " ")
+    kind = {dict: "object", list: "array"}.get(expect, "value")
+    raise JSONExtractError(f"No JSON {kind} found in model response: {snippet!r}")
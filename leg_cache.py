@@ -0,0 +1,117 @@
+# leg_cache.py
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from config import load_env
+from waypoints import WaypointList
+
+# Load environment variables from .env file
+load_env()
+
+# Endpoints are rounded to this many decimals (~11 m) before keying a leg
+LEG_KEY_PRECISION = 4
+
+def leg_key(start: Dict[str, float], end: Dict[str, float], mode: str, optimize: bool) -> Tuple:
+    """Key for one (start, end, mode, optimize) leg with quantized endpoints."""
+    q = lambda v: round(float(v), LEG_KEY_PRECISION)
+    return (q(start["lat"]), q(start["lng"]), q(end["lat"]), q(end["lng"]), mode, bool(optimize))
+
+class LegResult:
+    """A computed scenic leg: the chosen segment polyline and its POI waypoints."""
+    __slots__ = ("coords", "waypoints")
+
+    def __init__(self, coords: List[Tuple[float, float]], waypoints: WaypointList):
+        self.coords = coords
+        self.waypoints = waypoints
+
+class LegCache:
+    """Entry-bounded LRU of LegResults with a TTL."""
+    def __init__(self, max_entries: int = 2048, ttl_s: float = 1800):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[Tuple, Tuple[float, LegResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[LegResult]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or time.monotonic() - item[0] > self.ttl_s:
+                if item is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Tuple, result: LegResult):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+class SessionLegCaches:
+    """
+    One small LegCache per conversation session, so refinements such as
+    "same route but add a coffee stop" only recompute the legs that changed.
+    Requests without a session share a larger global cache.
+    """
+    def __init__(self, max_sessions: int = 1024, session_ttl_s: float = 1800,
+                 per_session_entries: int = 64, global_entries: int = 2048):
+        self.max_sessions = max_sessions
+        self.session_ttl_s = session_ttl_s
+        self.per_session_entries = per_session_entries
+        self.shared = LegCache(max_entries=global_entries, ttl_s=session_ttl_s)
+        self._sessions: "OrderedDict[Hashable, Tuple[float, LegCache]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def for_session(self, session_id: Optional[str]) -> LegCache:
+        if not session_id:
+            return self.shared
+        now = time.monotonic()
+        with self._lock:
+            item = self._sessions.get(session_id)
+            if item is None or now - item[0] > self.session_ttl_s:
+                cache = LegCache(max_entries=self.per_session_entries, ttl_s=self.session_ttl_s)
+            else:
+                cache = item[1]
+            self._sessions[session_id] = (now, cache)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return cache
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = [c.stats() for _, c in self._sessions.values()]
+        return {
+            "shared": self.shared.stats(),
+            "sessions": len(sessions),
+            "session_hits": sum(s["hits"] for s in sessions),
+            "session_misses": sum(s["misses"] for s in sessions),
+        }
+
+_caches: Optional[SessionLegCaches] = None
+_caches_lock = threading.Lock()
+
+def get_leg_caches() -> SessionLegCaches:
+    """Process-wide session leg caches (LEG_CACHE_SESSIONS, LEG_CACHE_TTL_S)."""
+    global _caches
+    if _caches is None:
+        with _caches_lock:
+            if _caches is None:
+                _caches = SessionLegCaches(
+                    max_sessions=int(os.getenv("LEG_CACHE_SESSIONS", "1024")),
+                    session_ttl_s=float(os.getenv("LEG_CACHE_TTL_S", "1800")),
+                )
+    return _caches
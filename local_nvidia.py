@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for NVIDIA's OpenAI-compatible chat completions API.
+
+Answers POST /chat/completions (also under /v1) with the same intent,
+waypoint and fitness content NVIDIAAgent's mock mode produces, but over
+HTTP, so load tests exercise the real client path: serialization, the
+connection pool, timeouts, retries and streaming. Latency follows a
+configurable distribution, a fraction of requests can fail with 429/503,
+and "stream": true is answered as server-sent events. Guided-output
+requests (nvext.guided_json / response_format) are accepted and counted.
+
+Point the agents at a running instance with NVIDIA_BASE_URL and
+NVIDIA_MOCK_MODE=0 (mock mode is on by default).
+"""
+
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from nvidia_agent import NVIDIAAgent, approx_tokens
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+# Statuses injected errors are drawn from
+ERROR_STATUSES = (429, 503)
+
+class LocalNVIDIA:
+    """
+    Threaded HTTP server answering chat completions like NVIDIA's API.
+
+    Args:
+        latency_ms:   Median time to the complete answer (or the first chunk).
+        distribution: "fixed", "uniform" (0..2x the median) or "lognormal".
+        sigma:        Spread of the lognormal distribution.
+        error_rate:   Fraction of requests answered with 429 or 503.
+        chunk_ms:     Delay between streamed chunks.
+        seed:         Seed for latency and error sampling.
+        port:         Port to bind on 127.0.0.1 (0 picks a free port).
+    """
+    def __init__(self, latency_ms: float = 0.0, distribution: str = "fixed", sigma: float = 0.5,
+                 error_rate: float = 0.0, chunk_ms: float = 0.0, seed: Optional[int] = None, port: int = 0):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {LATENCY_DISTRIBUTIONS}")
+        self.latency_ms = latency_ms
+        self.distribution = distribution
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.chunk_ms = chunk_ms
+        self.calls: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._mock = NVIDIAAgent(api_key="local", mock_mode=True)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "LocalNVIDIA":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def snapshot(self) -> Dict[str, int]:
+        """Copy of the counters (requests, errors, streamed, guided, tokens)."""
+        with self._lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Request handling ---
+
+    def _sample(self):
+        """(latency in seconds, injected error status or None)"""
+        with self._lock:
+            if self.distribution == "uniform":
+                ms = self._rng.uniform(0, 2 * self.latency_ms)
+            elif self.distribution == "lognormal" and self.latency_ms > 0:
+                ms = self._rng.lognormvariate(math.log(self.latency_ms), self.sigma)
+            else:
+                ms = self.latency_ms
+            error = self._rng.choice(ERROR_STATUSES) if self._rng.random() < self.error_rate else None
+        return ms / 1000, error
+
+    def _count(self, **counts: int):
+        with self._lock:
+            self.calls.update(counts)
+
+    def _handler_class(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, status: int, body: Dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._json(400, {"error": {"message": "invalid JSON body"}})
+                if self.path.split("?")[0].rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+                    return self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+                delay, error = stand_in._sample()
+                stand_in._count(requests=1, guided=int("nvext" in body or "response_format" in body))
+                time.sleep(delay)
+                if error is not None:
+                    stand_in._count(errors=1)
+                    return self._json(error, {"error": {"message": "injected error", "code": error}})
+
+                messages: List[Dict[str, str]] = body.get("messages", [])
+                content = stand_in._mock._get_mock_response(messages)
+                usage = {
+                    "prompt_tokens": sum(approx_tokens(m.get("content", "")) for m in messages),
+                    "completion_tokens": approx_tokens(content),
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                stand_in._count(prompt_tokens=usage["prompt_tokens"], completion_tokens=usage["completion_tokens"])
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                model = body.get("model") or "local/mock"
+                if body.get("stream"):
+                    stand_in._count(streamed=1)
+                    return self._stream(completion_id, model, content)
+                self._json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+
+            def _stream(self, completion_id: str, model: str, content: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = [content[i:i + 32] for i in range(0, len(content), 32)] or [""]
+                for i, piece in enumerate(pieces):
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "model": model,
+                        "choices": [{"index": 0, "delta": {"content": piece},
+                                     "finish_reason": "stop" if i == len(pieces) - 1 else None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if stand_in.chunk_ms:
+                        time.sleep(stand_in.chunk_ms / 1000)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Serve a local NVIDIA-compatible chat completions stand-in")
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    ap.add_argument("--sigma", type=float, default=0.5)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--chunk-ms", type=float, default=0.0)
+    ap.add_argument("--seed", type=int)
+    args = ap.parse_args()
+
+    server = LocalNVIDIA(latency_ms=args.latency_ms, distribution=args.distribution, sigma=args.sigma,
+                         error_rate=args.error_rate, chunk_ms=args.chunk_ms, seed=args.seed,
+                         port=args.port).start()
+    print(f"🧪 Local NVIDIA chat completions stand-in on {server.base_url}")
+    print(f"   export NVIDIA_BASE_URL={server.base_url} NVIDIA_MOCK_MODE=0")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the Google Maps web services used by the agents
+(geocode, directions, places nearby, places text search, elevation).
+
+Responses are deterministic, shaped like the real APIs and cheap to produce,
+so the full /api/route pipeline can be driven offline. Every request is
+counted per API, which lets the benchmark report upstream calls per request.
+
+Point the agents at a running instance with GOOGLE_MAPS_BASE_URL.
+"""
+
+import json
+import math
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+import polyline
+
+# Bounding box the synthetic geocoder spreads addresses over (East Bay / SF)
+BBOX = (37.60, -122.50, 37.95, -122.05)
+
+# Rough travel speeds in m/s used to derive leg durations
+MODE_SPEEDS = {"driving": 13.0, "walking": 1.4, "bicycling": 4.5, "transit": 8.0}
+
+API_PATHS = {
+    "/maps/api/geocode/json": "geocode",
+    "/maps/api/directions/json": "directions",
+    "/maps/api/place/nearbysearch/json": "places_nearby",
+    "/maps/api/place/textsearch/json": "text_search",
+    "/maps/api/elevation/json": "elevation",
+}
+
+def _stable_fraction(text: str, salt: str = "") -> float:
+    """Map a string to a stable float in [0, 1)."""
+    return (zlib.crc32(f"{salt}|{text}".encode("utf-8")) & 0xFFFFFFFF) / 2**32
+
+def _haversine_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h))
+
+def fake_geocode(address: str) -> Tuple[float, float]:
+    """Deterministic coordinates for any address string."""
+    lat = BBOX[0] + (BBOX[2] - BBOX[0]) * _stable_fraction(address.lower().strip(), "lat")
+    lng = BBOX[1] + (BBOX[3] - BBOX[1]) * _stable_fraction(address.lower().strip(), "lng")
+    return round(lat, 7), round(lng, 7)
+
+def _parse_point(value: str) -> Tuple[float, float]:
+    """Parse "lat,lng" or fall back to geocoding the string."""
+    value = value.replace("via:", "")
+    try:
+        lat, lng = value.split(",")
+        return float(lat), float(lng)
+    except ValueError:
+        return fake_geocode(value)
+
+def _path_points(start: Tuple[float, float], end: Tuple[float, float], bend: float, n: int = 120) -> List[Tuple[float, float]]:
+    """A gently curved path between two points; `bend` shifts it sideways."""
+    pts = []
+    for i in range(n + 1):
+        t = i / n
+        offset = bend * math.sin(math.pi * t)
+        lat = start[0] + (end[0] - start[0]) * t + offset * (end[1] - start[1])
+        lng = start[1] + (end[1] - start[1]) * t - offset * (end[0] - start[0])
+        pts.append((round(lat, 6), round(lng, 6)))
+    return pts
+
+class LocalUpstreams:
+    """
+    Threaded HTTP server answering the Google Maps endpoints the agents use.
+
+    Args:
+        latency_ms: Artificial per-request latency, to mimic a real round-trip.
+        port:       Port to bind on 127.0.0.1 (0 picks a free port).
+    """
+    def __init__(self, latency_ms: float = 0.0, port: int = 0):
+        self.latency_ms = latency_ms
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "LocalUpstreams":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def snapshot(self) -> Dict[str, int]:
+        """Copy of the per-API call counters."""
+        with self._lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Request handling ---
+
+    def _handler_class(self):
+        upstreams = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                api = API_PATHS.get(url.path)
+                if api is None:
+                    self._send(404, {"status": "NOT_FOUND"})
+                    return
+                with upstreams._lock:
+                    upstreams.calls[api] += 1
+                if upstreams.latency_ms:
+                    time.sleep(upstreams.latency_ms / 1000)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                self._send(200, getattr(upstreams, f"_{api}")(params))
+
+            def _send(self, status: int, body: Dict):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def _geocode(self, params: Dict[str, str]) -> Dict:
+        address = params.get("address", "")
+        lat, lng = fake_geocode(address)
+        return {
+            "status": "OK",
+            "results": [{
+                "formatted_address": address,
+                "geometry": {"location": {"lat": lat, "lng": lng}, "location_type": "APPROXIMATE"},
+                "place_id": f"geo-{zlib.crc32(address.encode('utf-8')):08x}",
+                "types": ["locality"],
+            }],
+        }
+
+    def _directions(self, params: Dict[str, str]) -> Dict:
+        mode = params.get("mode", "driving")
+        speed = MODE_SPEEDS.get(mode, MODE_SPEEDS["driving"])
+        stops = [_parse_point(params["origin"])]
+        if params.get("waypoints"):
+            stops += [_parse_point(w) for w in params["waypoints"].split("|") if w and not w.startswith("optimize:")]
+        stops.append(_parse_point(params["destination"]))
+
+        count = 3 if params.get("alternatives") == "true" else 1
+        routes = []
+        for alt in range(count):
+            legs, overview = [], []
+            for a, b in zip(stops, stops[1:]):
+                pts = _path_points(a, b, bend=0.08 * alt)
+                dist = int(_haversine_m(a, b) * (1.25 + 0.1 * alt)) + 1
+                dur = int(dist / speed) + 1
+                leg = {
+                    "distance": {"value": dist, "text": f"{dist / 1000:.1f} km"},
+                    "duration": {"value": dur, "text": f"{dur // 60} mins"},
+                    "start_location": {"lat": a[0], "lng": a[1]},
+                    "end_location": {"lat": b[0], "lng": b[1]},
+                    "steps": [{
+                        "distance": {"value": dist},
+                        "duration": {"value": dur},
+                        "start_location": {"lat": a[0], "lng": a[1]},
+                        "end_location": {"lat": b[0], "lng": b[1]},
+                        "polyline": {"points": polyline.encode(pts)},
+                        "travel_mode": mode.upper(),
+                    }],
+                }
+                if "departure_time" in params:
+                    leg["duration_in_traffic"] = {"value": int(dur * (1.1 + 0.05 * alt))}
+                legs.append(leg)
+                overview.extend(pts if not overview else pts[1:])
+            routes.append({
+                "summary": f"Route {alt + 1}",
+                "legs": legs,
+                "overview_polyline": {"points": polyline.encode(overview)},
+                "waypoint_order": list(range(max(0, len(stops) - 2))),
+            })
+        return {"status": "OK", "routes": routes}
+
+    def _places_nearby(self, params: Dict[str, str]) -> Dict:
+        lat, lng = map(float, params["location"].split(","))
+        label = params.get("keyword") or params.get("type") or "place"
+        # Snap to a ~1 km grid so neighbouring samples share POIs, like real parks do
+        cell = (round(lat, 2), round(lng, 2))
+        results = []
+        for i in range(3):
+            seed = f"{cell}|{label}|{i}"
+            results.append({
+                "place_id": f"poi-{zlib.crc32(seed.encode('utf-8')):08x}",
+                "name": f"{label.split('|')[0].title()} {cell[0]:.2f},{cell[1]:.2f} #{i + 1}",
+                "geometry": {"location": {
+                    "lat": round(cell[0] + 0.002 * (_stable_fraction(seed, "a") - 0.5), 7),
+                    "lng": round(cell[1] + 0.002 * (_stable_fraction(seed, "b") - 0.5), 7),
+                }},
+                "types": ["park"],
+            })
+        return {"status": "OK", "results": results}
+
+    def _text_search(self, params: Dict[str, str]) -> Dict:
+        query = params.get("query", "")
+        if params.get("location"):
+            base = tuple(map(float, params["location"].split(",")))
+        else:
+            base = fake_geocode(query)
+        results = []
+        for i in range(5):
+            seed = f"{query}|{i}"
+            results.append({
+                "name": f"{query.title()} {i + 1}",
+                "formatted_address": f"{100 + i} {query.title()} St, Berkeley, CA",
+                "geometry": {"location": {
+                    "lat": round(base[0] + 0.02 * (_stable_fraction(seed, "a") - 0.5), 7),
+                    "lng": round(base[1] + 0.02 * (_stable_fraction(seed, "b") - 0.5), 7),
+                }},
+            })
+        return {"status": "OK", "results": results}
+
+    def _elevation(self, params: Dict[str, str]) -> Dict:
+        raw = params.get("path") or params.get("locations", "")
+        if raw.startswith("enc:"):
+            pts = polyline.decode(raw[4:])
+        else:
+            pts = [tuple(map(float, p.split(","))) for p in raw.split("|") if p]
+        samples = int(params.get("samples", len(pts)))
+        if samples and len(pts) > 1 and samples != len(pts):
+            pts = [pts[round(i * (len(pts) - 1) / max(1, samples - 1))] for i in range(samples)]
+        results = [{
+            "elevation": 50 + 120 * math.sin(lat * 40) * math.cos(lng * 40),
+            "location": {"lat": lat, "lng": lng},
+            "resolution": 9.5,
+        } for lat, lng in pts]
+        return {"status": "OK", "results": results}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Serve local Google Maps API stand-ins")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    args = ap.parse_args()
+
+    upstreams = LocalUpstreams(latency_ms=args.latency_ms, port=args.port).start()
+    print(f"🧪 Local Google Maps stand-ins on {upstreams.base_url}")
+    print(f"   export GOOGLE_MAPS_BASE_URL={upstreams.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        upstreams.stop()
@@ -1,22 +1,225 @@
-from flask import Flask, request, jsonify, render_template_string, send_from_directory
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, request, jsonify, send_from_directory
 import logging
 import traceback
 import os
-from starter import NVIDIAIntentParser
-from scenic_agent import ScenicAgent
-from fitness_agent import FitnessAgent
-from fallback_agent import FallbackAgent
-from polyline_agent import PolylineAgent
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import load_env
+from deadline import Deadline, DeadlineExceeded
+from upstream_scheduler import get_scheduler
+from upstream import CallMemo, memo_scope, current_memo, trace_scope, current_trace
+from jobs import get_job_queue, JobQueueFull
+from response_cache import get_response_cache
+from leg_cache import get_leg_caches
+from upstream_cache import get_upstream_cache
+from navigation import NavigationSession, get_nav_sessions
+from gazetteer import get_gazetteer
+from ip_geo import get_ip_geo
+from encoding import respond
+from traffic_capture import get_traffic_capture
+
+# Load environment variables from .env file
+load_env()
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder='static', static_url_path='/static')
-parser = NVIDIAIntentParser()
+
+# Fallback IPv6 when the client doesn't send one
+DEFAULT_IPV6 = "2607:f140:6000:800e:384d:a5ee:7eb4:fa5e"
+
+# /api/routes/batch limits
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "8"))
+
+# Travel modes a client may request explicitly
+TRAVEL_MODES = {"driving", "walking", "bicycling", "transit"}
+
+# Longest a client may long-poll /api/jobs/<id>
+JOB_MAX_WAIT_S = 30.0
+
+# The intent parser and the agents (with googlemaps, requests and the NVIDIA
+# client behind them) load on first use, so importing this module stays cheap
+_parser = None
+_parser_lock = threading.Lock()
+
+def get_parser():
+    """Process-wide NVIDIAIntentParser, created on first use."""
+    global _parser
+    if _parser is None:
+        with _parser_lock:
+            if _parser is None:
+                from starter import NVIDIAIntentParser
+                _parser = NVIDIAIntentParser()
+    return _parser
+
+def warm_up():
+    """
+    Pay the first-request costs up front: import the agents, create the
+    parser and the pooled Maps client, and build the process-wide caches,
+    scheduler, gazetteer, IP-prefix table and scenic raster. Runs at import
+    with WARM_UP=1 (before a pre-forking server forks its workers, for
+    example). Returns the milliseconds each step took.
+    """
+    def load_agents():
+        import scenic_agent, fitness_agent, commute_agent, polyline_agent  # noqa: F401
+
+    def maps_client():
+        from upstream import create_maps_client
+        create_maps_client(os.getenv("GOOGLE_MAPS_API_KEY"))
+
+    def scenic_raster():
+        from scenic_raster import get_scenic_raster
+        get_scenic_raster()
+
+    steps = [
+        ("agents", load_agents),
+        ("parser", get_parser),
+        ("maps_client", maps_client),
+        ("scheduler", get_scheduler),
+        ("response_cache", get_response_cache),
+        ("leg_caches", get_leg_caches),
+        ("job_queue", get_job_queue),
+        ("upstream_cache", get_upstream_cache),
+        ("gazetteer", get_gazetteer),
+        ("ip_geo", lambda: get_ip_geo() and get_ip_geo().lookup(DEFAULT_IPV6)),
+        ("scenic_raster", scenic_raster),
+    ]
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {str(e)}")
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
+
+def plan_route(intent, deadline=None, session_id=None):
+    """Route a parsed intent to the appropriate agent and return its response model."""
+    # Always return waypoints for iOS compatibility
+    if intent.intent_type in ("Scenic", "Road-Trip"):
+        from scenic_agent import ScenicAgent
+        logger.info("Using Scenic Agent")
+        scenicAgent = ScenicAgent()
+        leg_cache = get_leg_caches().for_session(session_id)
+        return scenicAgent.get_scenic_route(intent, deadline=deadline, leg_cache=leg_cache)
+    elif intent.intent_type == "Health":
+        from fitness_agent import FitnessAgent
+        logger.info("Using Fitness Agent")
+        fitnessAgent = FitnessAgent()
+        return fitnessAgent.get_fitness_route(intent, deadline=deadline)
+    else:
+        # Commute, Transit, Event and Other intents take the single-Directions-call fast path
+        from commute_agent import CommuteAgent
+        logger.info(f"Using Commute Agent for {intent.intent_type} intent (waypoints format)")
+        commuteAgent = CommuteAgent()
+        return commuteAgent.get_commute_route(intent, deadline=deadline)
+
+def plan_modes(intent, deadline=None, session_id=None):
+    """
+    Plan every requested travel mode concurrently.
+
+    Returns {"waypoints": ...} for a single mode. With several modes each one is
+    planned and summarized (distance, duration) on its own thread; geocodes and
+    identical Places/Directions calls are shared through one CallMemo, so wall
+    time stays close to the slowest mode. The fastest mode is recommended and
+    its waypoints are returned as the top-level "waypoints".
+    """
+    modes = [m for m in dict.fromkeys(intent.travel_modes or []) if m in TRAVEL_MODES]
+    if len(modes) < 2:
+        return {"waypoints": plan_route(intent, deadline, session_id).model_dump()}
+
+    from models import ModeSummary
+    from polyline_agent import PolylineAgent
+    memo = current_memo() or CallMemo()
+    trace = current_trace()
+
+    def evaluate(mode):
+        mode_intent = intent.model_copy(update={"travel_modes": [mode]})
+        with memo_scope(memo), trace_scope(trace):
+            try:
+                waypoints = plan_route(mode_intent, deadline, session_id).waypoints
+                summary = PolylineAgent().get_route_summary(mode_intent, waypoints, deadline=deadline)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.warning(f"Mode {mode} failed: {str(e)}")
+                return ModeSummary(mode=mode, error=str(e))
+        return ModeSummary(
+            mode=mode,
+            total_distance_m=summary.total_distance_m,
+            total_duration_s=summary.total_duration_s,
+            waypoints=waypoints
+        )
+
+    with ThreadPoolExecutor(max_workers=len(modes)) as pool:
+        summaries = list(pool.map(evaluate, modes))
+
+    planned = [s for s in summaries if s.error is None]
+    if not planned:
+        raise RuntimeError(f"No travel mode could be planned: {summaries[0].error}")
+    # Fastest wins; ties keep the user's order
+    best = min(planned, key=lambda s: s.total_duration_s)
+    return {
+        "waypoints": {"waypoints": best.waypoints.to_json()},
+        "modes": [s.model_dump() for s in summaries],
+        "recommended_mode": best.mode
+    }
+
+def route_response(prompt, user_ipv6, deadline=None, mode=None, session_id=None):
+    """Parse and plan one prompt. Returns (response_dict, http_status)."""
+    try:
+        logger.info(f"Processing prompt: {prompt}")
+        
+        # Parse prompt to RouteIntent
+        logger.info("Parsing prompt to RouteIntent...")
+        intent = get_parser().parse_prompt(prompt, user_ipv6, deadline=deadline)
+        logger.info(f"Intent parsed: {intent.intent_type}")
+
+        # An explicitly requested travel mode replaces the parsed ones
+        if mode:
+            intent = intent.model_copy(update={"travel_modes": [mode]})
+
+        plans = plan_modes(intent, deadline, session_id)
+
+        logger.info("Preparing response...")
+        response = {
+            "intent": intent.model_dump(),
+            **plans,
+            "degradations": deadline.degradations if deadline else []
+        }
+        return response, 200
+
+    except DeadlineExceeded as e:
+        logger.warning(f"Latency budget exceeded in get_route: {str(e)}")
+        return {"error": str(e), "degradations": deadline.degradations}, 504
+
+    except Exception as e:
+        logger.error(f"Error in get_route: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return {"error": str(e)}, 500
 
 @app.route('/api/route', methods=['POST'])
 def get_route():
+    """Serve a route; sampled requests are recorded for replay when capture is enabled"""
+    capture = get_traffic_capture()
+    trace = capture.sample() if capture is not None else None
+    if trace is None:
+        return _get_route()
+    started_at, started = time.time(), time.perf_counter()
+    with trace_scope(trace):
+        response = app.make_response(_get_route())
+    capture.write(request.get_json(silent=True), response.status_code, (time.perf_counter() - started) * 1000,
+                  response.headers.get("X-Route-Cache"), trace, started_at)
+    return response
+
+def _get_route():
     try:
         logger.info("Received POST request to /api/route")
         
@@ -24,48 +227,283 @@ def get_route():
         logger.info(f"Request data: {data}")
         
         prompt = data.get("prompt")
-        user_ipv6 = data.get("ipv6", "2607:f140:6000:800e:384d:a5ee:7eb4:fa5e")  # fallback IPv6
+        user_ipv6 = data.get("ipv6", DEFAULT_IPV6)
 
         if not prompt:
             logger.error("Missing prompt in request")
             return jsonify({"error": "Missing prompt"}), 400
 
-        logger.info(f"Processing prompt: {prompt}")
-        
-        # Parse prompt to RouteIntent
-        logger.info("Parsing prompt to RouteIntent...")
-        intent = parser.parse_prompt(prompt, user_ipv6)
-        logger.info(f"Intent parsed: {intent.intent_type}")
+        # Latency budget: per-request "budget_ms", else ROUTE_BUDGET_MS, else none
+        try:
+            deadline = Deadline.from_request(data.get("budget_ms"))
+        except (TypeError, ValueError):
+            return jsonify({"error": "budget_ms must be a positive number"}), 400
+
+        # Optional travel mode override ("mode": "walking", ...)
+        mode = data.get("mode")
+        if mode is not None and mode not in TRAVEL_MODES:
+            return jsonify({"error": f"mode must be one of {sorted(TRAVEL_MODES)}"}), 400
+
+        # Conversation id: refinements reuse the legs computed for earlier prompts
+        session_id = data.get("session_id")
 
-        # Route to appropriate agent - Always return waypoints for iOS compatibility
-        if intent.intent_type == "Scenic":
-            logger.info("Using Scenic Agent")
-            scenicAgent = ScenicAgent()
-            resp = scenicAgent.get_scenic_route(intent)
-        elif intent.intent_type == "Health":
-            logger.info("Using Fitness Agent")
-            fitnessAgent = FitnessAgent()
-            resp = fitnessAgent.get_fitness_route(intent)
+        # Job mode: hand heavy work to the worker pool and return a job id
+        if data.get("async"):
+            budget_ms = data.get("budget_ms")
+            try:
+                job = get_job_queue().submit(
+                    # The budget starts when a worker picks the job up
+                    lambda: route_response(prompt, user_ipv6, Deadline.from_request(budget_ms), mode, session_id)
+                )
+            except JobQueueFull as e:
+                return jsonify({"error": str(e)}), 503
+            logger.info(f"Queued route job {job.id}")
+            return jsonify({**job.to_dict(), "poll_url": f"/api/jobs/{job.id}"}), 202
+
+        # Whole-response cache with stale-while-revalidate
+        cache = get_response_cache()
+        if cache is None or data.get("cache") is False or request.cache_control.no_cache:
+            response, status = route_response(prompt, user_ipv6, deadline, mode, session_id)
+            cache_state = "BYPASS"
         else:
-            # For Event, Commute, and Other intents, use Scenic Agent for waypoints format
-            logger.info(f"Using Scenic Agent for {intent.intent_type} intent (waypoints format)")
-            scenicAgent = ScenicAgent()
-            resp = scenicAgent.get_scenic_route(intent)
+            key = cache.key(prompt, get_parser().location_key(user_ipv6), mode)
+            response, cache_state = cache.get(key)
+            if cache_state == "STALE":
+                cache.revalidate(key, lambda: _cacheable(*route_response(prompt, user_ipv6, None, mode, session_id)))
+            if response is not None:
+                status = 200
+            else:
+                response, status = route_response(prompt, user_ipv6, deadline, mode, session_id)
+                if _cacheable(response, status) is not None:
+                    cache.put(key, response)
 
-        logger.info("Preparing response...")
-        response = {
-            "intent": intent.model_dump(),
-            "waypoints": resp.model_dump()
-        }
-        
-        logger.info("Response ready, sending to client")
-        return jsonify(response)
+        logger.info(f"Response ready, sending to client (cache {cache_state})")
+        return respond(response, status, {"X-Route-Cache": cache_state})
 
     except Exception as e:
         logger.error(f"Error in get_route: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({"error": str(e)}), 500
 
+def _cacheable(response, status):
+    """Only complete, successful responses are cached."""
+    return response if status == 200 and not response.get("degradations") else None
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Response, leg, gazetteer and upstream cache occupancy and hit/miss counters, plus route job counts"""
+    cache = get_response_cache()
+    gazetteer = get_gazetteer()
+    upstream = get_upstream_cache()
+    return jsonify({
+        "responses": cache.stats() if cache else {"enabled": False},
+        "legs": get_leg_caches().stats(),
+        "gazetteer": gazetteer.stats() if gazetteer else {"enabled": False},
+        "upstream": upstream.stats() if upstream else {"enabled": False},
+        "jobs": get_job_queue().stats()
+    }), 200
+
+@app.route('/api/llm/stats', methods=['GET'])
+def llm_stats():
+    """Token counts per LLM task and per-model routing, latency and error rates in this process"""
+    from nvidia_agent import get_token_usage
+    from model_router import get_model_router
+    return jsonify({"tokens": get_token_usage().stats(), "router": get_model_router().stats()}), 200
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a route job; ?wait=N long-polls up to N seconds (max JOB_MAX_WAIT_S) for it to finish"""
+    try:
+        wait_s = min(float(request.args.get("wait", 0)), JOB_MAX_WAIT_S)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    job = get_job_queue().get(job_id, wait_s=max(0.0, wait_s))
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    # Finished jobs answer with the status the synchronous request would have had
+    return respond(job.to_dict(), job.http_status if job.finished else 200)
+
+@app.route('/api/routes/batch', methods=['POST'])
+def get_routes_batch():
+    """
+    Plan routes for many prompts in one call.
+
+    Body: {"items": [{"prompt": ..., "ipv6": ..., "budget_ms": ...}, ...]}
+      or  {"prompts": ["...", ...], "ipv6": ..., "budget_ms": ...}
+
+    Identical prompts are parsed once, intents are parsed concurrently, and
+    geocodes, text searches and Directions calls are deduplicated across the
+    whole batch. Each item gets its own result or error, in request order.
+    """
+    try:
+        data = request.get_json() or {}
+        items = data.get("items")
+        if items is None:
+            items = [{"prompt": p} for p in data.get("prompts") or []]
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "Provide a non-empty 'items' or 'prompts' list"}), 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({"error": f"Batch too large (max {BATCH_MAX_ITEMS} items)"}), 400
+
+        jobs = []
+        for item in items:
+            if isinstance(item, str):
+                item = {"prompt": item}
+            if not isinstance(item, dict):
+                jobs.append({"error": "Each item must be a prompt string or an object"})
+                continue
+            job = {
+                "prompt": item.get("prompt"),
+                "ipv6": item.get("ipv6") or data.get("ipv6") or DEFAULT_IPV6,
+            }
+            if not isinstance(job["prompt"], str) or not job["prompt"]:
+                job["error"] = "Missing prompt"
+            # Budgets start now, as for /api/route; parsing counts against them
+            try:
+                job["deadline"] = Deadline.from_request(item.get("budget_ms") or data.get("budget_ms"))
+            except (TypeError, ValueError):
+                job["error"] = "budget_ms must be a positive number"
+            jobs.append(job)
+        logger.info(f"Received batch of {len(jobs)} route requests")
+
+        memo = CallMemo()
+        workers = min(BATCH_MAX_WORKERS, len(jobs))
+
+        # 1) Parse each distinct (prompt, ipv6) once, concurrently, under the
+        # most generous budget of the items sharing it (None means unbounded)
+        parse_deadlines = {}
+        for j in jobs:
+            if "error" in j:
+                continue
+            key = (j["prompt"], j["ipv6"])
+            if key not in parse_deadlines:
+                parse_deadlines[key] = j["deadline"]
+            elif parse_deadlines[key] is not None:
+                parse_deadlines[key] = j["deadline"] and max(parse_deadlines[key], j["deadline"], key=Deadline.remaining)
+
+        def parse(key):
+            with memo_scope(memo):
+                return get_parser().parse_prompt(*key, deadline=parse_deadlines[key])
+
+        keys = set(parse_deadlines)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {key: pool.submit(parse, key) for key in keys}
+
+            # 2) Plan every item; upstream calls are shared through the memo
+            def run(job):
+                if "error" in job:
+                    return {"error": job["error"]}
+                deadline = job["deadline"]
+                try:
+                    intent = futures[(job["prompt"], job["ipv6"])].result()
+                    with memo_scope(memo):
+                        plans = plan_modes(intent, deadline)
+                    return {
+                        "intent": intent.model_dump(),
+                        **plans,
+                        "degradations": deadline.degradations if deadline else []
+                    }
+                except Exception as e:
+                    logger.warning(f"Batch item failed: {str(e)}")
+                    return {"error": str(e), "degradations": deadline.degradations if deadline else []}
+
+            results = list(pool.map(run, jobs))
+
+        for index, result in enumerate(results):
+            result["index"] = index
+        stats = {
+            "items": len(jobs),
+            "succeeded": sum(1 for r in results if "error" not in r),
+            "failed": sum(1 for r in results if "error" in r),
+            "unique_prompts": len(keys),
+            **memo.stats()
+        }
+        logger.info(f"Batch done: {stats}")
+        return respond({"results": results, "stats": stats})
+
+    except Exception as e:
+        logger.error(f"Error in get_routes_batch: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/nav/sessions', methods=['POST'])
+def create_nav_session():
+    """
+    Start following a route returned by /api/route.
+
+    Body: {"waypoints": [{"lat": ..., "lng": ...}, ...], "mode": "driving",
+           "off_route_threshold_m": 50, "off_route_updates": 2}
+
+    One Directions call builds the session's segment index; position updates
+    are then answered locally until the user actually leaves the route.
+    """
+    try:
+        data = request.get_json() or {}
+        waypoints = data.get("waypoints")
+        if isinstance(waypoints, dict):
+            waypoints = waypoints.get("waypoints")
+        if not isinstance(waypoints, list) or len(waypoints) < 2:
+            return jsonify({"error": "Provide at least two 'waypoints' with lat/lng"}), 400
+        mode = data.get("mode", "driving")
+        if mode not in TRAVEL_MODES:
+            return jsonify({"error": f"mode must be one of {sorted(TRAVEL_MODES)}"}), 400
+        try:
+            session = NavigationSession(
+                [{"lat": float(w["lat"]), "lng": float(w["lng"])} for w in waypoints],
+                mode=mode,
+                threshold_m=float(data.get("off_route_threshold_m", 50)),
+                off_route_updates=int(data.get("off_route_updates", 2)),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid waypoints: {str(e)}"}), 400
+        get_nav_sessions().add(session)
+        return jsonify(session.summary()), 201
+
+    except Exception as e:
+        logger.error(f"Error in create_nav_session: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/nav/sessions/<session_id>/position', methods=['POST'])
+def update_nav_position(session_id):
+    """Report a position {"lat", "lng"}; returns distance to route, remaining distance/ETA and re-route status"""
+    session = get_nav_sessions().get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired navigation session"}), 404
+    data = request.get_json() or {}
+    try:
+        lat, lng = float(data["lat"]), float(data["lng"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Provide numeric 'lat' and 'lng'"}), 400
+    try:
+        return jsonify(session.update(lat, lng)), 200
+    except Exception as e:
+        logger.error(f"Error in update_nav_position: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/nav/sessions/<session_id>', methods=['GET', 'DELETE'])
+def nav_session(session_id):
+    """Inspect (GET) or end (DELETE) a navigation session"""
+    sessions = get_nav_sessions()
+    if request.method == 'DELETE':
+        if not sessions.remove(session_id):
+            return jsonify({"error": "Unknown or expired navigation session"}), 404
+        return jsonify({"session_id": session_id, "ended": True}), 200
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired navigation session"}), 404
+    return jsonify(session.summary()), 200
+
+@app.route('/api/upstream/stats', methods=['GET'])
+def upstream_stats():
+    """Per-API rate limiter and bulkhead metrics (queue waits, in-flight, rejections)"""
+    return jsonify(get_scheduler().stats()), 200
+
+@app.route('/api/startup', methods=['GET'])
+def startup_stats():
+    """How long importing the app took, and the warm-up steps if WARM_UP=1 ran them"""
+    return jsonify(STARTUP), 200
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Simple health check endpoint"""
@@ -111,6 +549,12 @@ def debug():
     except FileNotFoundError:
         return jsonify({"error": "Debug page not found"}), 404
 
+# Import cost of this module (see startup_report.py for a per-module breakdown)
+STARTUP = {"import_ms": round((time.perf_counter() - _import_started) * 1000, 1), "warm_up_ms": None}
+if os.getenv("WARM_UP", "0") == "1":
+    STARTUP["warm_up_ms"] = warm_up()
+logger.info(f"Startup: {STARTUP}")
+
 if __name__ == '__main__':
     logger.info("Starting Flask application on port 8000...")
     print("🚀 Starting MapsAI - NVIDIA Powered Navigation API on port 8000...")
@@ -0,0 +1,167 @@
+# model_router.py
+
+import os
+import json
+import time
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from config import load_env
+
+# Load environment variables from .env file
+load_env()
+
+# Tiers, fastest first. A request goes to the first tier whose limits it
+# fits; the last tier takes everything else. Override with
+# NVIDIA_MODEL_TIERS='[{"model": "meta/llama-3.2-3b-instruct", "max_prompt_tokens": 200,
+#                       "max_stops": 0, "max_latency_ms": 800},
+#                      {"model": "nvidia/llama3-8b-instruct"}]'
+# Optional per-tier keys: tasks (list of task names), max_prompt_tokens,
+# max_stops and max_latency_ms (a p50 above it marks the model slow).
+DEFAULT_TIERS: List[Dict[str, Any]] = [
+    {"model": "nvidia/llama3-8b-instruct"},
+]
+
+# Rolling health window per model: the last `window` calls younger than `window_s`
+DEFAULT_WINDOW = 50
+DEFAULT_WINDOW_S = 60.0
+# A model is judged (error rate, p50 latency) once it has at least `min_samples` recent calls;
+# it is failing when more than this share of them errored
+DEFAULT_MAX_ERROR_RATE = 0.5
+DEFAULT_MIN_SAMPLES = 5
+
+class ModelTier:
+    """One entry of the tier list: a model plus the requests it is trusted with."""
+    def __init__(self, model: str, tasks: Optional[List[str]] = None,
+                 max_prompt_tokens: Optional[int] = None, max_stops: Optional[int] = None,
+                 max_latency_ms: Optional[float] = None):
+        self.model = model
+        self.tasks = set(tasks) if tasks else None
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_stops = max_stops
+        self.max_latency_ms = max_latency_ms
+
+    def fits(self, task: str, prompt_tokens: int, stops: int) -> bool:
+        return ((self.tasks is None or task in self.tasks) and
+                (self.max_prompt_tokens is None or prompt_tokens <= self.max_prompt_tokens) and
+                (self.max_stops is None or stops <= self.max_stops))
+
+    def describe(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"model": self.model}
+        if self.tasks is not None:
+            out["tasks"] = sorted(self.tasks)
+        for key in ("max_prompt_tokens", "max_stops", "max_latency_ms"):
+            if getattr(self, key) is not None:
+                out[key] = getattr(self, key)
+        return out
+
+class ModelHealth:
+    """Rolling latency and error samples for one model."""
+    def __init__(self, window: int, window_s: float):
+        self.window_s = window_s
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=window)  # (at, latency s, ok)
+        self.calls = 0
+        self.errors = 0
+        self.routed: Dict[str, int] = defaultdict(int)
+
+    def record(self, latency_s: float, ok: bool):
+        self._samples.append((time.monotonic(), latency_s, ok))
+        self.calls += 1
+        self.errors += int(not ok)
+
+    def recent(self) -> List[Tuple[float, float, bool]]:
+        cutoff = time.monotonic() - self.window_s
+        return [s for s in self._samples if s[0] >= cutoff]
+
+    def summary(self) -> Dict[str, Any]:
+        recent = self.recent()
+        ok = sorted(s[1] for s in recent if s[2])
+        return {
+            "samples": len(recent),
+            "error_rate": round(sum(1 for s in recent if not s[2]) / len(recent), 3) if recent else 0.0,
+            "p50_ms": round(ok[len(ok) // 2] * 1000, 1) if ok else None,
+            "p95_ms": round(ok[int(0.95 * (len(ok) - 1))] * 1000, 1) if ok else None,
+        }
+
+class ModelRouter:
+    """
+    Picks a model per LLM call from the tier list, by prompt size and stop
+    count, and steers away from models whose recent calls are failing or,
+    for tiers with max_latency_ms, slow. Failures age out of the window,
+    so a shunned model gets traffic again once its window is clear.
+    """
+    def __init__(self, tiers: Optional[List[Dict[str, Any]]] = None, window: int = DEFAULT_WINDOW,
+                 window_s: float = DEFAULT_WINDOW_S, max_error_rate: float = DEFAULT_MAX_ERROR_RATE,
+                 min_samples: int = DEFAULT_MIN_SAMPLES):
+        self.tiers = [ModelTier(**cfg) for cfg in (tiers or DEFAULT_TIERS)]
+        if not self.tiers:
+            raise ValueError("At least one model tier is required")
+        self.window = window
+        self.window_s = window_s
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._health: Dict[str, ModelHealth] = {}
+        for tier in self.tiers:
+            self._health.setdefault(tier.model, ModelHealth(window, window_s))
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        tiers = os.getenv("NVIDIA_MODEL_TIERS")
+        return cls(
+            json.loads(tiers) if tiers else None,
+            window=int(os.getenv("NVIDIA_ROUTER_WINDOW", str(DEFAULT_WINDOW))),
+            window_s=float(os.getenv("NVIDIA_ROUTER_WINDOW_S", str(DEFAULT_WINDOW_S))),
+            max_error_rate=float(os.getenv("NVIDIA_ROUTER_MAX_ERROR_RATE", str(DEFAULT_MAX_ERROR_RATE))),
+        )
+
+    def _healthy(self, tier: ModelTier) -> bool:
+        summary = self._health[tier.model].summary()
+        if summary["samples"] < self.min_samples:
+            return True  # too few calls to judge
+        if summary["error_rate"] > self.max_error_rate:
+            return False
+        if tier.max_latency_ms is not None and summary["p50_ms"] is not None:
+            return summary["p50_ms"] <= tier.max_latency_ms
+        return True
+
+    def choose(self, task: str, prompt_tokens: int = 0, stops: int = 0) -> str:
+        """Model for one call: the first fitting tier, else the next healthy one up (then down)."""
+        first = next((i for i, t in enumerate(self.tiers) if t.fits(task, prompt_tokens, stops)),
+                     len(self.tiers) - 1)
+        order = self.tiers[first:] + self.tiers[:first][::-1]
+        with self._lock:
+            tier = next((t for t in order if self._healthy(t)), order[0])
+            self._health[tier.model].routed[task] += 1
+        return tier.model
+
+    def record(self, model: str, latency_s: float, ok: bool):
+        with self._lock:
+            health = self._health.get(model)
+            if health is None:  # a caller-pinned model outside the tier list
+                health = self._health[model] = ModelHealth(self.window, self.window_s)
+            health.record(latency_s, ok)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            healthy = {t.model: self._healthy(t) for t in self.tiers}
+            return {
+                "tiers": [t.describe() for t in self.tiers],
+                "models": {
+                    model: dict(h.summary(), calls=h.calls, errors=h.errors, routed=dict(h.routed),
+                                healthy=healthy.get(model, True))
+                    for model, h in self._health.items()
+                },
+            }
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+def get_model_router() -> ModelRouter:
+    """Process-wide router, built from NVIDIA_MODEL_TIERS on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter.from_env()
+    return _router
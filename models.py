@@ -1,5 +1,6 @@
 from typing import Dict, Optional, Literal, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from waypoints import WaypointList
 
 class LocationHint(BaseModel):
     country: str
@@ -7,6 +8,8 @@ class LocationHint(BaseModel):
     city: Optional[str] = None
     postal_code: Optional[str] = None
     coordinates: Optional[Dict[Literal["latitude", "longitude"], float]] = None
+    accuracy_m: Optional[int] = None  # Radius the location is known to within
+    timezone: Optional[str] = None  # IANA zone, e.g. "America/Los_Angeles"
 
 class RouteIntent(BaseModel):
     intent_type: Literal["Health", "Scenic", "Eco-conscious", "Commute", "Transit", "Event", "Road-Trip", "Other"]
@@ -19,4 +22,10 @@ class RouteIntent(BaseModel):
     avoid: Optional[list[str]] = None  # Route features to avoid
     optimize_waypoints: Optional[bool] = None  # Boolean for reordering stops
     stops: Optional[list[Dict[str, Any]]] = None  # For multi-stop routes with enriched data
-    location_hint: Optional[LocationHint] = None  # User's inferred location 
\ No newline at end of file
+    location_hint: Optional[LocationHint] = None  # User's inferred location 
+class ModeSummary(BaseModel):
+    mode: str
+    total_distance_m: Optional[int] = None
+    total_duration_s: Optional[int] = None
+    waypoints: WaypointList = Field(default_factory=WaypointList)
+    error: Optional[str] = None  # Set when this mode could not be planned
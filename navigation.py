@@ -0,0 +1,303 @@
+# navigation.py
+
+import os
+import math
+import time
+import uuid
+import threading
+from array import array
+from bisect import bisect_right
+from collections import defaultdict, OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import polyline
+from config import load_env
+from upstream import create_maps_client
+
+# Load environment variables from .env file
+load_env()
+
+EARTH_RADIUS_M = 6371000.0
+
+# Grid cell size of the segment index, in degrees (~110 m of latitude)
+CELL_DEG = 0.001
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    h = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+class RouteIndex:
+    """
+    Decoded route polyline with precomputed cumulative distance and duration
+    arrays and a uniform-grid index of its segments.
+
+    `locate(lat, lng)` snaps a position to the nearest segment by only
+    checking segments in nearby grid cells; remaining distance/ETA for any
+    along-route distance is an O(log n) bisect over the cumulative arrays.
+    """
+    def __init__(self, points: Sequence[Tuple[float, float]], durations_s: Sequence[float]):
+        if len(points) < 2:
+            raise ValueError("A route needs at least two points")
+        self.lats = array("d", (p[0] for p in points))
+        self.lngs = array("d", (p[1] for p in points))
+        self.cum_dist = array("d", [0.0])
+        for i in range(1, len(points)):
+            self.cum_dist.append(self.cum_dist[-1] + haversine_m(
+                self.lats[i - 1], self.lngs[i - 1], self.lats[i], self.lngs[i]))
+        self.cum_time = array("d", durations_s)
+        if len(self.cum_time) != len(points):
+            raise ValueError("durations_s must have one entry per point")
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for i in range(len(points) - 1):
+            for cell in self._segment_cells(i):
+                self._cells[cell].append(i)
+
+    @classmethod
+    def from_directions(cls, route: Dict[str, Any]) -> "RouteIndex":
+        """Build from one Directions route, spreading each step's duration over its points."""
+        points: List[Tuple[float, float]] = []
+        times: List[float] = []
+        elapsed = 0.0
+        for leg in route["legs"]:
+            for step in leg["steps"]:
+                pts = polyline.decode(step["polyline"]["points"])
+                if points and pts and tuple(pts[0]) == points[-1]:
+                    pts = pts[1:]
+                if not pts:
+                    continue
+                # Duration is spread proportionally to distance within the step
+                seg = [0.0]
+                prev = points[-1] if points else pts[0]
+                for p in pts:
+                    seg.append(seg[-1] + haversine_m(prev[0], prev[1], p[0], p[1]))
+                    prev = p
+                step_len = seg[-1] or 1.0
+                step_dur = float(step["duration"]["value"])
+                for p, d in zip(pts, seg[1:]):
+                    points.append((p[0], p[1]))
+                    times.append(elapsed + step_dur * d / step_len)
+                elapsed += step_dur
+        return cls(points, times)
+
+    @property
+    def total_distance_m(self) -> float:
+        return self.cum_dist[-1]
+
+    @property
+    def total_duration_s(self) -> float:
+        return self.cum_time[-1]
+
+    def _segment_cells(self, i: int):
+        lat0, lat1 = sorted((self.lats[i], self.lats[i + 1]))
+        lng0, lng1 = sorted((self.lngs[i], self.lngs[i + 1]))
+        for cy in range(math.floor(lat0 / CELL_DEG), math.floor(lat1 / CELL_DEG) + 1):
+            for cx in range(math.floor(lng0 / CELL_DEG), math.floor(lng1 / CELL_DEG) + 1):
+                yield (cy, cx)
+
+    def _project(self, i: int, lat: float, lng: float) -> Tuple[float, float]:
+        """(distance in m, fraction along segment i) of the point's projection."""
+        kx = math.cos(math.radians(lat)) * math.radians(1) * EARTH_RADIUS_M
+        ky = math.radians(1) * EARTH_RADIUS_M
+        ax, ay = (self.lngs[i] - lng) * kx, (self.lats[i] - lat) * ky
+        bx, by = (self.lngs[i + 1] - lng) * kx, (self.lats[i + 1] - lat) * ky
+        dx, dy = bx - ax, by - ay
+        seg2 = dx * dx + dy * dy
+        t = 0.0 if seg2 == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / seg2))
+        px, py = ax + t * dx, ay + t * dy
+        return math.hypot(px, py), t
+
+    def locate(self, lat: float, lng: float, search_radius_m: float = 250.0,
+               hint: Optional[int] = None) -> Tuple[float, int, float]:
+        """
+        Nearest point on the route: (distance_m, segment index, fraction).
+
+        Only segments in grid cells within `search_radius_m` are checked; if none
+        are that close every segment is scanned (the user is far off route).
+        Near-ties prefer the segment closest to `hint` (the last known segment),
+        so routes that double back don't make progress jump.
+        """
+        rings = math.ceil(search_radius_m / (CELL_DEG * 111320 * max(0.2, math.cos(math.radians(lat)))))
+        cy, cx = math.floor(lat / CELL_DEG), math.floor(lng / CELL_DEG)
+        candidates = set()
+        for y in range(cy - rings, cy + rings + 1):
+            for x in range(cx - rings, cx + rings + 1):
+                candidates.update(self._cells.get((y, x), ()))
+        if not candidates:
+            candidates = range(len(self.lats) - 1)
+
+        best: Optional[Tuple[float, int, float]] = None
+        for i in candidates:
+            dist, t = self._project(i, lat, lng)
+            if best is None or dist < best[0] - 5 or (
+                abs(dist - best[0]) <= 5 and hint is not None and abs(i - hint) < abs(best[1] - hint)
+            ):
+                best = (dist, i, t)
+        return best
+
+    def along_distance(self, segment: int, fraction: float) -> float:
+        return self.cum_dist[segment] + fraction * (self.cum_dist[segment + 1] - self.cum_dist[segment])
+
+    def time_at(self, along_m: float) -> float:
+        """Elapsed route time at an along-route distance (bisect over cum_dist)."""
+        if along_m <= 0:
+            return 0.0
+        if along_m >= self.total_distance_m:
+            return self.total_duration_s
+        i = bisect_right(self.cum_dist, along_m) - 1
+        span = self.cum_dist[i + 1] - self.cum_dist[i]
+        frac = 0.0 if span == 0 else (along_m - self.cum_dist[i]) / span
+        return self.cum_time[i] + frac * (self.cum_time[i + 1] - self.cum_time[i])
+
+    def remaining(self, along_m: float) -> Tuple[float, float]:
+        """(remaining distance m, remaining duration s) from an along-route distance."""
+        return max(0.0, self.total_distance_m - along_m), max(0.0, self.total_duration_s - self.time_at(along_m))
+
+class NavigationSession:
+    """
+    Follows one user along a returned route. Position updates are answered from
+    the RouteIndex; a real re-route (one Directions call) only happens after
+    `off_route_updates` consecutive positions farther than `threshold_m`.
+    """
+    def __init__(self, waypoints: List[Dict[str, Any]], mode: str = "driving",
+                 threshold_m: float = 50.0, off_route_updates: int = 2):
+        if len(waypoints) < 2:
+            raise ValueError("At least two waypoints (origin & destination) are required")
+        self.id = uuid.uuid4().hex
+        self.client = create_maps_client(os.getenv("GOOGLE_MAPS_API_KEY"))
+        self.waypoints = waypoints
+        self.mode = mode
+        self.threshold_m = threshold_m
+        self.off_route_updates = off_route_updates
+        self.reroutes = 0
+        self.updates = 0
+        self.upstream_calls = 0
+        self.last_seen = time.monotonic()
+        self._off_count = 0
+        self._segment: Optional[int] = None
+        self._lock = threading.Lock()
+        self.index = self._route((waypoints[0]["lat"], waypoints[0]["lng"]), waypoints[1:])
+
+    def _route(self, origin: Tuple[float, float], remaining: List[Dict[str, Any]]) -> RouteIndex:
+        # Google accepts at most 25 intermediate waypoints
+        via = [(w["lat"], w["lng"]) for w in remaining[:-1]][-25:]
+        dest = remaining[-1]
+        routes = self.client.directions(
+            origin=origin,
+            destination=(dest["lat"], dest["lng"]),
+            mode=self.mode,
+            waypoints=via or None,
+        )
+        self.upstream_calls += 1
+        if not routes:
+            raise RuntimeError("No route returned by Directions API")
+        self._remaining_stops = remaining
+        self._segment = None
+        return RouteIndex.from_directions(routes[0])
+
+    def update(self, lat: float, lng: float) -> Dict[str, Any]:
+        with self._lock:
+            self.updates += 1
+            self.last_seen = time.monotonic()
+            dist, seg, frac = self.index.locate(lat, lng, search_radius_m=max(250.0, 4 * self.threshold_m),
+                                                hint=self._segment)
+            rerouted = False
+            if dist > self.threshold_m:
+                self._off_count += 1
+                if self._off_count >= self.off_route_updates:
+                    self.index = self._route((lat, lng), self._stops_ahead())
+                    self.reroutes += 1
+                    self._off_count = 0
+                    rerouted = True
+                    dist, seg, frac = self.index.locate(lat, lng, hint=0)
+            else:
+                self._off_count = 0
+            if dist <= self.threshold_m or rerouted:
+                self._segment = seg
+            along = self.index.along_distance(seg, frac)
+            remaining_m, remaining_s = self.index.remaining(along)
+            return {
+                "session_id": self.id,
+                "on_route": dist <= self.threshold_m,
+                "distance_to_route_m": round(dist, 1),
+                "progress": round(along / self.index.total_distance_m, 4) if self.index.total_distance_m else 1.0,
+                "remaining_distance_m": round(remaining_m),
+                "remaining_duration_s": round(remaining_s),
+                "rerouted": rerouted,
+                "reroutes": self.reroutes,
+            }
+
+    def _stops_ahead(self) -> List[Dict[str, Any]]:
+        """Stops not yet passed, judged by their position along the current route."""
+        if self._segment is None:
+            return self._remaining_stops
+        passed = self.index.along_distance(self._segment, 0.0)
+        ahead = []
+        for stop in self._remaining_stops[:-1]:
+            _, seg, frac = self.index.locate(stop["lat"], stop["lng"])
+            if self.index.along_distance(seg, frac) > passed:
+                ahead.append(stop)
+        return ahead + [self._remaining_stops[-1]]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "mode": self.mode,
+            "points": len(self.index.lats),
+            "total_distance_m": round(self.index.total_distance_m),
+            "total_duration_s": round(self.index.total_duration_s),
+            "off_route_threshold_m": self.threshold_m,
+            "updates": self.updates,
+            "reroutes": self.reroutes,
+            "upstream_calls": self.upstream_calls,
+        }
+
+class NavigationSessions:
+    """In-memory registry of live navigation sessions, expired after `ttl_s` idle."""
+    def __init__(self, max_sessions: int = 10000, ttl_s: float = 3600):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self._sessions: "OrderedDict[str, NavigationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, session: NavigationSession):
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> Optional[NavigationSession]:
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def remove(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl_s
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_seen >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+_sessions: Optional[NavigationSessions] = None
+_sessions_lock = threading.Lock()
+
+def get_nav_sessions() -> NavigationSessions:
+    """Process-wide navigation sessions (NAV_MAX_SESSIONS, NAV_SESSION_TTL_S)."""
+    global _sessions
+    if _sessions is None:
+        with _sessions_lock:
+            if _sessions is None:
+                _sessions = NavigationSessions(
+                    max_sessions=int(os.getenv("NAV_MAX_SESSIONS", "10000")),
+                    ttl_s=float(os.getenv("NAV_SESSION_TTL_S", "3600")),
+                )
+    return _sessions
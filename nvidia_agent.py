@@ -2,14 +2,143 @@
 
 import os
 import json
-import re
+import math
+import random
+import time
+import logging
+import threading
 import requests
-from dotenv import load_dotenv
+from collections import defaultdict
+from config import load_env
 from typing import Optional, Dict, Any, List
 from pydantic import BaseModel
+from deadline import Deadline, DeadlineExceeded
+from json_extract import JSONExtractError, extract_json
+from model_router import get_model_router
+from upstream_scheduler import get_scheduler
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
+
+# HTTP timeout for NVIDIA API calls made without a deadline, in seconds
+DEFAULT_TIMEOUT_S = 30.0
+
+# Override with NVIDIA_BASE_URL, e.g. to point at local_nvidia.py
+DEFAULT_BASE_URL = "https://api.nvcf.nvidia.com/v1"
+
+# Transient answers retried with jittered exponential backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_BACKOFF_S = 0.25
+
+# How structured output is requested (NVIDIA_GUIDED_JSON): "off", "nvext"
+# (NIM's nvext.guided_json) or "response_format" (OpenAI json_schema)
+GUIDED_JSON_MODES = ("off", "nvext", "response_format")
+
+logger = logging.getLogger(__name__)
+
+# Compact prompt templates. The mock keys off their leading phrases.
+INTENT_PROMPT = (
+    "Parse the user's request into JSON with keys: "
+    "intent_type (Health|Scenic|Eco-conscious|Commute|Transit|Event|Road-Trip|Other); "
+    'origin ("UC Berkeley" if unspecified); destination; '
+    'travel_modes (preferred order, of driving|walking|bicycling|transit; default ["driving"]); '
+    "departure_time/arrival_time (optional ISO); "
+    'constraints (e.g. "avoid tolls", "burn 100 calories", "date night", "5 km"); '
+    "avoid (tolls|highways|ferries); "
+    'stops (only if several stops are named: [{{"name": place}}]); '
+    "optimize_waypoints (bool, true to reorder stops). "
+    "User IP hint: {ipv6}. Reply with the JSON object only."
+)
+WAYPOINTS_PROMPT = (
+    "Route planner: generate a JSON array of waypoints "
+    '[{"name": str, "lat": float, "lng": float}] for the intent. Reply with the array only.'
+)
+FITNESS_PROMPT = (
+    "You are a fitness route optimizer: suggest up to 3 extra waypoints that meet "
+    'the fitness constraints, as a JSON array [{"name": str, "lat": float, "lng": float}]. '
+    "Reply with the array only."
+)
+
+_WAYPOINT_SCHEMA = {
+    "type": "object",
+    "properties": {"name": {"type": "string"}, "lat": {"type": "number"}, "lng": {"type": "number"}},
+    "required": ["name", "lat", "lng"],
+}
+SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "intent": {
+        "type": "object",
+        "properties": {
+            "intent_type": {"enum": ["Health", "Scenic", "Eco-conscious", "Commute", "Transit",
+                                     "Event", "Road-Trip", "Other"]},
+            "origin": {"type": "string"},
+            "destination": {"type": "string"},
+            "travel_modes": {"type": "array", "items": {"enum": ["driving", "walking", "bicycling", "transit"]}},
+            "departure_time": {"type": "string"},
+            "arrival_time": {"type": "string"},
+            "constraints": {"type": "array", "items": {"type": "string"}},
+            "avoid": {"type": "array", "items": {"type": "string"}},
+            "stops": {"type": "array", "items": {"type": "object", "properties": {"name": {"type": "string"}}}},
+            "optimize_waypoints": {"type": "boolean"},
+        },
+        "required": ["intent_type", "origin", "destination", "travel_modes"],
+    },
+    "waypoints": {"type": "array", "items": _WAYPOINT_SCHEMA},
+    "fitness": {"type": "array", "items": _WAYPOINT_SCHEMA, "maxItems": 3},
+}
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), used when the API reports no usage."""
+    return max(1, math.ceil(len(text) / 4)) if text else 0
+
+def _compact(fields: Dict[str, Any]) -> str:
+    """Minified JSON of the non-empty fields, for user prompts."""
+    return json.dumps({k: v for k, v in fields.items() if v not in (None, "", [], {})},
+                      separators=(",", ":"), default=str)
+
+class TokenUsage:
+    """Per-task token counters for every chat completion this process made."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, task: str, prompt_tokens: int, completion_tokens: int, max_tokens: int, estimated: bool):
+        with self._lock:
+            t = self._tasks[task]
+            t["calls"] += 1
+            t["prompt_tokens"] += prompt_tokens
+            t["completion_tokens"] += completion_tokens
+            t["max_tokens"] += max_tokens
+            t["estimated"] += int(estimated)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            out = {}
+            for task, t in sorted(self._tasks.items()):
+                calls = t["calls"] or 1
+                out[task] = dict(t, avg_prompt_tokens=round(t["prompt_tokens"] / calls, 1),
+                                 avg_completion_tokens=round(t["completion_tokens"] / calls, 1))
+            return out
+
+    def reset(self):
+        with self._lock:
+            self._tasks.clear()
+
+_token_usage = TokenUsage()
+
+def get_token_usage() -> TokenUsage:
+    return _token_usage
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _http_session() -> requests.Session:
+    """One keep-alive connection pool shared by every NVIDIAAgent."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = requests.Session()
+    return _session
 
 class NVIDIAAgent:
     """
@@ -19,56 +148,150 @@ class NVIDIAAgent:
     - Route planning
     - Fitness optimization
     - General chat
+
+    Mock mode answers locally without HTTP. It is on unless the caller
+    passes mock_mode=False or NVIDIA_MOCK_MODE=0 is set.
+
+    The model for each call comes from the tier list in model_router.py,
+    by task, prompt size and stop count, unless the caller pins one.
+
+    Structured tasks can ask the backend to constrain output to a JSON
+    schema (guided_json, see GUIDED_JSON_MODES); replies are parsed with
+    json_extract either way.
     """
     
-    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://api.nvcf.nvidia.com/v1", mock_mode: bool = True):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 mock_mode: Optional[bool] = None, max_retries: Optional[int] = None,
+                 stream: Optional[bool] = None, guided_json: Optional[str] = None):
         self.api_key = api_key or os.getenv("NVIDIA_API_KEY")
-        if not self.api_key and not mock_mode:
+        self.base_url = (base_url or os.getenv("NVIDIA_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        if mock_mode is None:
+            mock_mode = os.getenv("NVIDIA_MOCK_MODE", "1") != "0"
+        # A local stand-in (NVIDIA_BASE_URL) doesn't need a key
+        if not self.api_key and not mock_mode and self.base_url == DEFAULT_BASE_URL:
             raise ValueError("NVIDIA_API_KEY is required when not in mock mode. Set it with: export NVIDIA_API_KEY=your_key_here")
-        self.base_url = base_url
         self.mock_mode = mock_mode  # Use mock responses for testing
+        self.max_retries = int(os.getenv("NVIDIA_MAX_RETRIES", "2")) if max_retries is None else max_retries
+        self.stream = os.getenv("NVIDIA_STREAM", "0") == "1" if stream is None else stream
+        self.guided_json = guided_json or os.getenv("NVIDIA_GUIDED_JSON", "off")
+        if self.guided_json not in GUIDED_JSON_MODES:
+            raise ValueError(f"guided_json must be one of {GUIDED_JSON_MODES}")
         
-    def _make_request(self, model_id: str, messages: List[Dict[str, str]], 
-                     temperature: float = 0.7, max_tokens: int = 512) -> str:
+    def _make_request(self, model_id: Optional[str], messages: List[Dict[str, str]], 
+                     temperature: float = 0.7, max_tokens: int = 512,
+                     deadline: Optional[Deadline] = None, task: str = "chat", stops: int = 0) -> str:
         """
-        Make a request to NVIDIA's API or return mock response
+        Make a request to NVIDIA's API or return mock response, and record
+        its token counts under `task` (estimated when the API reports none).
+        With no `model_id`, the model router picks one and is told how the
+        call went.
         """
+        estimated_prompt = sum(approx_tokens(m["content"]) for m in messages)
+        router = get_model_router()
+        if model_id is None:
+            model_id = router.choose(task, estimated_prompt, stops)
         if self.mock_mode:
-            return self._get_mock_response(messages)
-            
+            content, usage = self._get_mock_response(messages), None
+        else:
+            with get_scheduler().slot("nvidia", deadline=deadline):
+                started = time.perf_counter()
+                try:
+                    content, usage = self._post_chat(model_id, messages, temperature, max_tokens, deadline,
+                                                     schema=SCHEMAS.get(task))
+                except DeadlineExceeded:
+                    raise  # our budget ran out, not the model's fault
+                except Exception:
+                    router.record(model_id, time.perf_counter() - started, ok=False)
+                    raise
+                router.record(model_id, time.perf_counter() - started, ok=True)
+        estimated = not usage
+        prompt_tokens = usage["prompt_tokens"] if usage else estimated_prompt
+        completion_tokens = usage["completion_tokens"] if usage else approx_tokens(content)
+        get_token_usage().record(task, prompt_tokens, completion_tokens, max_tokens, estimated)
+        logger.debug(f"NVIDIA {task} ({model_id}): {prompt_tokens} prompt + {completion_tokens} completion tokens"
+                     f"{' (estimated)' if estimated else ''}, max_tokens={max_tokens}")
+        return content
+
+    def _post_chat(self, model_id: str, messages: List[Dict[str, str]],
+                   temperature: float, max_tokens: int,
+                   deadline: Optional[Deadline] = None,
+                   schema: Optional[Dict[str, Any]] = None):
+        """
+        POST to the chat completions endpoint (one rate-limited slot) and
+        return (content, usage or None). With guided_json enabled, `schema`
+        constrains the output.
+        Connection errors, timeouts, 429 and 5xx answers are retried up to
+        `max_retries` times with jittered exponential backoff (honouring
+        Retry-After), as long as the deadline leaves room for the wait.
+        """
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         
         payload = {
+            "model": model_id,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
-            "stream": False
+            "stream": self.stream
         }
+        if schema is not None and self.guided_json == "nvext":
+            payload["nvext"] = {"guided_json": schema}
+        elif schema is not None and self.guided_json == "response_format":
+            payload["response_format"] = {"type": "json_schema", "json_schema": {"name": "output", "schema": schema}}
         
-        # Use the correct NVIDIA API endpoint
-        response = requests.post(
-            f"{self.base_url}/chat/completions",
-            headers=headers,
-            json=payload,
-            params={"model": model_id}
-        )
-        
-        if response.status_code != 200:
-            # Try alternative endpoint format
-            alt_response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload
-            )
-            if alt_response.status_code != 200:
-                raise RuntimeError(f"NVIDIA API error: {response.status_code} - {response.text}")
-            response = alt_response
-        
-        result = response.json()
-        return result["choices"][0]["message"]["content"].strip()
+        attempt = 0
+        while True:
+            if deadline is not None:
+                deadline.check("NVIDIA API call" if attempt == 0 else "NVIDIA API retry")
+            retry_after = None
+            try:
+                response = _http_session().post(
+                    f"{self.base_url}/chat/completions",
+                    headers=headers,
+                    json=payload,
+                    params={"model": model_id},
+                    timeout=deadline.timeout(DEFAULT_TIMEOUT_S) if deadline else DEFAULT_TIMEOUT_S,
+                    stream=self.stream
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error: Exception = RuntimeError(f"NVIDIA API unreachable: {str(e)}")
+            else:
+                if response.status_code == 200:
+                    if self.stream:
+                        return self._read_stream(response), None
+                    result = response.json()
+                    return result["choices"][0]["message"]["content"].strip(), result.get("usage")
+                error = RuntimeError(f"NVIDIA API error: {response.status_code} - {response.text}")
+                if response.status_code not in RETRY_STATUSES:
+                    raise error
+                try:
+                    retry_after = float(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    pass
+
+            if attempt >= self.max_retries:
+                raise error
+            wait = retry_after if retry_after is not None else RETRY_BACKOFF_S * (2 ** attempt) * random.uniform(0.5, 1.5)
+            if deadline is not None and deadline.remaining() <= wait:
+                raise error
+            time.sleep(wait)
+            attempt += 1
+
+    @staticmethod
+    def _read_stream(response: requests.Response) -> str:
+        """Join the content deltas of a server-sent-events completion."""
+        parts = []
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            for choice in json.loads(data).get("choices", []):
+                parts.append(choice.get("delta", {}).get("content") or "")
+        return "".join(parts).strip()
 
     def _get_mock_response(self, messages: List[Dict[str, str]]) -> str:
         """Get dynamic mock responses based on user input for testing"""
@@ -127,13 +350,15 @@ class NVIDIAAgent:
                 if len(parts) > 1:
                     destination = parts[1].strip().title()
             
-            # Extract travel modes
-            if any(word in user_message.lower() for word in ["walk", "walking", "stroll", "step", "steps", "jog", "jogging"]):
-                travel_modes = ["walking"]
-            elif any(word in user_message.lower() for word in ["bike", "cycling", "bicycle"]):
-                travel_modes = ["bicycling"]
-            elif any(word in user_message.lower() for word in ["transit", "bus", "train"]):
-                travel_modes = ["transit"]
+            # Extract travel modes ("walk or bike" yields both)
+            mode_words = {
+                "walking": ["walk", "walking", "stroll", "step", "steps", "jog", "jogging"],
+                "bicycling": ["bike", "cycling", "bicycle"],
+                "transit": ["transit", "bus", "train"],
+            }
+            mentioned = [m for m, words in mode_words.items() if any(w in user_message.lower() for w in words)]
+            if mentioned:
+                travel_modes = mentioned
             elif intent_type == "Health":  # Default to walking for health/fitness intents
                 travel_modes = ["walking"]
             
@@ -196,133 +421,95 @@ class NVIDIAAgent:
         else:
             return "I'm an NVIDIA AI assistant. I can help you plan routes based on your preferences. Try asking for a scenic route, fitness walk, or commute path!"
 
-    def parse_intent(self, prompt: str, ipv6: str) -> Dict[str, Any]:
+    def parse_intent(self, prompt: str, ipv6: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
-        Parse natural language prompt into structured RouteIntent using NVIDIA's 
-        best model for intent classification and structured output.
+        Parse natural language prompt into structured RouteIntent using the
+        NVIDIA model tier that fits the prompt.
         """
-        system_prompt = f"""
-You are an intelligent route-planning assistant. Parse the user's request into JSON with:
-- intent_type: one of: "Health", "Scenic", "Eco-conscious", "Commute", "Transit", "Event", "Road-Trip", "Other".
-- origin: starting point ("UC Berkeley" if unspecified).
-- destination: end point.
-- travel_modes: array of one or more modes in preferred order, any of ["driving", "walking", "bicycling", "transit"]. Use "driving" if nothing mentioned.
-- departure_time / arrival_time: optional ISO timestamps for routing with traffic or schedules.
-- constraints: list of conditions (e.g. "avoid tolls", "burn 100 calories, "date night", "x km").
-- avoid: list of route features to avoid (tolls, highways, ferries).
-- stops: If the user mentions multiple stops, list them here as an array of dictionaries (e.g., [{{name: place}}]). If no stops, this can be omitted.
-- optimize_waypoints: boolean (true to reorder stops for shortest trip).
-User IP hint: {ipv6}.  
-Respond ONLY with the raw JSON object, without any explanatory text or markdown formatting.
-"""
-
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": INTENT_PROMPT.format(ipv6=ipv6)},
             {"role": "user", "content": prompt}
         ]
         
-        # Use NVIDIA's best model for structured output
+        # The router picks the model tier for this prompt
         response = self._make_request(
-            model_id="nvidia/llama3-8b-instruct",  # Good for structured output
+            model_id=None,
             messages=messages,
             temperature=0.1,  # Low temperature for consistent JSON
-            max_tokens=1000
+            max_tokens=320,
+            deadline=deadline,
+            task="intent"
         )
         
-        # Extract JSON from response
-        match = re.search(r'\{.*\}', response, re.DOTALL)
-        if match:
-            json_string = match.group(0)
-            return json.loads(json_string)
-        
-        raise ValueError("Could not find a valid JSON object in the NVIDIA model's response.")
+        return extract_json(response, dict)
 
-    def plan_route(self, intent: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def plan_route(self, intent: Dict[str, Any], deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
         """
         Generate route waypoints using NVIDIA's model optimized for route planning.
         """
-        system_prompt = """
-You are a route planner. Given route intent details, generate a JSON array of waypoints.
-Each waypoint should have: {"name": "place name", "lat": latitude, "lng": longitude}
-Return ONLY the JSON array, no explanation.
-"""
-
-        user_prompt = f"""
-Intent: {intent.get('intent_type', 'Other')}
-Origin: {intent.get('origin', '')}
-Destination: {intent.get('destination', '')}
-Travel modes: {intent.get('travel_modes', ['driving'])}
-Constraints: {intent.get('constraints', [])}
-Avoid: {intent.get('avoid', [])}
-Stops: {intent.get('stops', [])}
-
-Generate waypoints as JSON array: [{{"name": "...", "lat": ..., "lng": ...}}, ...]
-"""
+        user_prompt = _compact({
+            "intent": intent.get("intent_type", "Other"),
+            "origin": intent.get("origin", ""),
+            "destination": intent.get("destination", ""),
+            "travel_modes": intent.get("travel_modes", ["driving"]),
+            "constraints": intent.get("constraints", []),
+            "avoid": intent.get("avoid", []),
+            "stops": intent.get("stops", []),
+        })
 
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": WAYPOINTS_PROMPT},
             {"role": "user", "content": user_prompt}
         ]
         
         response = self._make_request(
-            model_id="nvidia/llama3-8b-instruct",  # Good for structured planning
+            model_id=None,
             messages=messages,
             temperature=0.2,
-            max_tokens=500
+            max_tokens=384,
+            deadline=deadline,
+            task="waypoints",
+            stops=len(intent.get("stops") or [])
         )
         
-        # Extract JSON array
-        start, end = response.find("["), response.rfind("]")
-        if start == -1 or end == -1:
-            raise RuntimeError("No JSON array found in NVIDIA model response")
-        
         try:
-            return json.loads(response[start:end+1])
-        except json.JSONDecodeError as e:
+            return extract_json(response, list, accept=lambda v: all(isinstance(w, dict) for w in v))
+        except JSONExtractError as e:
             raise RuntimeError(f"Invalid JSON from NVIDIA model: {e}")
 
     def optimize_fitness_route(self, current_route: List[Dict[str, Any]], 
                               constraints: List[str], mode: str, 
-                              current_metrics: Dict[str, Any]) -> List[Dict[str, Any]]:
+                              current_metrics: Dict[str, Any],
+                              deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
         """
         Optimize fitness route using NVIDIA's model specialized for health/fitness planning.
         """
-        system_prompt = """
-You are a fitness route optimizer. Given current route metrics and fitness constraints,
-suggest additional waypoints to meet fitness goals. Return only JSON array of waypoints.
-"""
-
-        user_prompt = f"""
-Current route waypoints: {current_route}
-Travel mode: {mode}
-Current metrics: {current_metrics}
-Fitness constraints: {constraints}
-
-Suggest up to 3 extra waypoints as JSON array to satisfy fitness goals:
-[{{"name": "place name", "lat": latitude, "lng": longitude}}, ...]
-"""
+        user_prompt = _compact({
+            "route": current_route,
+            "travel_mode": mode,
+            "metrics": current_metrics,
+            "constraints": constraints,
+        })
 
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": FITNESS_PROMPT},
             {"role": "user", "content": user_prompt}
         ]
         
         response = self._make_request(
-            model_id="nvidia/llama3-8b-instruct",  # Good for optimization tasks
+            model_id=None,
             messages=messages,
             temperature=0.3,
-            max_tokens=300
+            max_tokens=160,
+            deadline=deadline,
+            task="fitness",
+            stops=len(current_route)
         )
         
-        # Extract JSON array
-        match = re.search(r'\[.*\]', response, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(0))
-            except json.JSONDecodeError:
-                pass
-        
-        return []  # Return empty if parsing fails
+        try:
+            return extract_json(response, list, accept=lambda v: all(isinstance(w, dict) for w in v))[:3]
+        except JSONExtractError:
+            return []  # Return empty if parsing fails
 
     def chat(self, prompt: str, temperature: float = 0.7, max_tokens: int = 512) -> str:
         """
@@ -334,7 +521,7 @@ Suggest up to 3 extra waypoints as JSON array to satisfy fitness goals:
         ]
         
         return self._make_request(
-            model_id="nvidia/llama3-8b-instruct",  # Good for general conversation
+            model_id=None,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens
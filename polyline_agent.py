@@ -1,12 +1,13 @@
 import os
-from dotenv import load_dotenv
-from typing import List, Dict
-import googlemaps
+from config import load_env
+from typing import List, Dict, Optional
 from pydantic import BaseModel, Field
 from models import RouteIntent
+from upstream import create_maps_client
+from deadline import Deadline
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 class RouteSummaryResponse(BaseModel):
     polyline: str = Field(..., description="Encoded overview polyline for the full route")
@@ -22,13 +23,14 @@ class PolylineAgent:
         self.api_key = api_key or os.getenv("GOOGLE_MAPS_API_KEY")
         if not self.api_key:
             raise ValueError("Google Maps API key is required")
-        self.client = googlemaps.Client(key=self.api_key)
+        self.client = create_maps_client(self.api_key)
 
     def get_route_summary(
         self,
         intent: RouteIntent,
         waypoints: List[Dict[str, float]],
         optimize: bool = False,
+        deadline: Optional[Deadline] = None,
     ) -> RouteSummaryResponse:
         """
         Args:
@@ -64,6 +66,7 @@ class PolylineAgent:
             waypoints=intermediates or None,
             optimize_waypoints=optimize,
             avoid=avoid_param,
+            deadline=deadline,
         )
         if not directions_result:
             raise RuntimeError("No route returned by Directions API")
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Replay captured /api/route traffic (see traffic_capture.py) against this
+build, and compare builds.
+
+The app runs in-process. Every upstream call it makes is answered from the
+capture: the recorded response after the recorded latency (scaled by
+--upstream-latency-scale). A call the capture has no answer for (the build
+asks something new) goes to the local stand-ins from local_upstreams.py
+and is reported as unrecorded. Requests are sent at their captured
+arrival times divided by --speed; --speed 0 sends them back to back with
+--concurrency in flight.
+
+    python replay.py run capture.jsonl --output replay_new.json
+    python replay.py compare replay_old.json replay_new.json
+    python replay.py compare-builds capture.jsonl --base ../mapsai-main --new .
+
+compare-builds runs `replay.py run` from each build's directory, so each
+build replays with its own code.
+"""
+
+import os
+import sys
+import copy
+import glob
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmark import InProcessTransport, configure_environment, git_revision, latency_summary
+from local_upstreams import LocalUpstreams
+
+REPORT_VERSION = 1
+
+def load_capture(path: str) -> List[Dict[str, Any]]:
+    """
+    Records from `path` and its rotated files (path.N ... path.1, path),
+    oldest first. A "{pid}" in `path` loads every worker's files.
+    """
+    bases = sorted(glob.glob(path.replace("{pid}", "*"))) if "{pid}" in path else [path]
+    names = []
+    for base in bases:
+        rotated = sorted(glob.glob(f"{base}.[0-9]*"), key=lambda p: -int(p.rsplit(".", 1)[1]))
+        names += rotated + [base]
+    records = []
+    for name in names:
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    records.append(json.loads(line))
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+class RecordedUpstreams:
+    """Answers upstream calls from a capture, keyed like upstream.memoized."""
+    def __init__(self, records: List[Dict[str, Any]], latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self._answers: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        for record in records:
+            for call in record.get("upstream", []):
+                if call.get("ms") is not None:
+                    latencies[call["api"]].append(call["ms"])
+                answer = self._answers.setdefault((call["api"], call["key"]), call)
+                # Prefer an answer that came with a measured latency
+                if answer.get("ms") is None and call.get("ms") is not None:
+                    self._answers[(call["api"], call["key"])] = call
+        # Calls that a cache answered during capture have no latency of their own
+        self._typical_ms = {api: sorted(ms)[len(ms) // 2] for api, ms in latencies.items()}
+        self._lock = threading.Lock()
+        self.calls: Counter = Counter()
+        self.unrecorded: Counter = Counter()
+
+    def __call__(self, api: str, key: str, fetch):
+        with self._lock:
+            self.calls[api] += 1
+        answer = self._answers.get((api, key))
+        if answer is None:
+            with self._lock:
+                self.unrecorded[api] += 1
+            return fetch()
+        ms = answer["ms"] if answer.get("ms") is not None else self._typical_ms.get(api, 0.0)
+        if ms and self.latency_scale:
+            time.sleep(ms * self.latency_scale / 1000)
+        if "error" in answer:
+            raise RuntimeError(f"Replayed {api} error: {answer['error']}")
+        return copy.deepcopy(answer["response"])
+
+def run_replay(records: List[Dict[str, Any]], speed: float = 1.0, concurrency: int = 32,
+               latency_scale: float = 1.0) -> Dict[str, Any]:
+    upstreams = LocalUpstreams(latency_ms=0).start()
+    configure_environment(upstreams)
+    import main
+    from upstream import set_upstream_override
+    logging.getLogger().setLevel(logging.WARNING)
+
+    recorded = RecordedUpstreams(records, latency_scale)
+    set_upstream_override(recorded)
+    transport = InProcessTransport(main.app)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+
+    def one(record):
+        t0 = time.perf_counter()
+        try:
+            status = transport.post(record["request"])
+        except Exception:
+            status = -1
+        elapsed = (time.perf_counter() - t0) * 1000
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            first_ts = records[0]["ts"] if records else 0.0
+            for record in records:
+                if speed > 0:
+                    delay = (record["ts"] - first_ts) / speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                pool.submit(one, record)
+    finally:
+        set_upstream_override(None)
+        transport.close()
+        upstreams.stop()
+    wall = time.perf_counter() - started
+
+    captured_calls = Counter(c["api"] for r in records for c in r.get("upstream", []) if c.get("source") == "upstream")
+    n = len(records)
+    return {
+        "version": REPORT_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_revision": git_revision(),
+        "config": {"requests": n, "speed": speed, "concurrency": concurrency,
+                   "upstream_latency_scale": latency_scale},
+        "wall_s": round(wall, 3),
+        "status_codes": {str(s): c for s, c in sorted(statuses.items())},
+        "latency_ms": latency_summary(latencies),
+        "captured_latency_ms": latency_summary([r["latency_ms"] for r in records]),
+        "upstream_calls_per_request": {api: round(c / n, 3) for api, c in sorted(recorded.calls.items())} if n else {},
+        "captured_upstream_calls_per_request": {api: round(c / n, 3) for api, c in sorted(captured_calls.items())} if n else {},
+        "unrecorded_calls": dict(recorded.unrecorded),
+    }
+
+def compare_reports(base: Dict[str, Any], new: Dict[str, Any]) -> List[Tuple[str, float, float, Optional[float]]]:
+    """(metric, base, new, change %) rows for latency percentiles and upstream calls."""
+    def pct(old, cur):
+        return round((cur - old) / old * 100, 1) if old else None
+
+    rows = []
+    for stat in ("p50", "p95", "p99", "mean", "max"):
+        old, cur = base["latency_ms"][stat], new["latency_ms"][stat]
+        rows.append((f"latency {stat} ms", old, cur, pct(old, cur)))
+    apis = sorted(set(base["upstream_calls_per_request"]) | set(new["upstream_calls_per_request"]))
+    for api in apis:
+        old = base["upstream_calls_per_request"].get(api, 0.0)
+        cur = new["upstream_calls_per_request"].get(api, 0.0)
+        rows.append((f"{api} calls/request", old, cur, pct(old, cur)))
+    return rows
+
+def print_comparison(base: Dict[str, Any], new: Dict[str, Any]):
+    print(f"{'metric':<32}{base.get('git_revision') or 'base':>12}{new.get('git_revision') or 'new':>12}{'change':>10}")
+    for metric, old, cur, change in compare_reports(base, new):
+        print(f"{metric:<32}{old:>12.2f}{cur:>12.2f}{(f'{change:+.1f}%' if change is not None else '-'):>10}")
+
+def _replay_build(build_dir: str, capture: str, args) -> Dict[str, Any]:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        output = f.name
+    subprocess.run(
+        [sys.executable, os.path.join(build_dir, "replay.py"), "run", os.path.abspath(capture), "--output", output,
+         "--speed", str(args.speed), "--concurrency", str(args.concurrency),
+         "--upstream-latency-scale", str(args.upstream_latency_scale)],
+        cwd=build_dir, check=True,
+    )
+    with open(output) as f:
+        report = json.load(f)
+    os.remove(output)
+    return report
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay captured /api/route traffic and compare builds",
+                                 formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    sub = ap.add_subparsers(dest="command", required=True)
+    for name in ("run", "compare-builds"):
+        p = sub.add_parser(name)
+        p.add_argument("capture", help="capture JSONL (rotated path.N files are included)")
+        p.add_argument("--speed", type=float, default=1.0, help="arrival-rate multiplier; 0 = back to back")
+        p.add_argument("--concurrency", type=int, default=32)
+        p.add_argument("--upstream-latency-scale", type=float, default=1.0)
+        if name == "run":
+            p.add_argument("--output", default="replay_results.json")
+        else:
+            p.add_argument("--base", required=True, help="directory of the baseline build")
+            p.add_argument("--new", default=".", help="directory of the build under test")
+    p = sub.add_parser("compare")
+    p.add_argument("base")
+    p.add_argument("new")
+    args = ap.parse_args()
+
+    if args.command == "run":
+        records = load_capture(args.capture)
+        print(f"🔁 Replaying {len(records)} captured requests (speed {args.speed}x)")
+        report = run_replay(records, args.speed, args.concurrency, args.upstream_latency_scale)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        lat = report["latency_ms"]
+        print(f"  p50={lat['p50']:.1f}ms p95={lat['p95']:.1f}ms p99={lat['p99']:.1f}ms  "
+              f"status={report['status_codes']}  unrecorded={report['unrecorded_calls']}")
+        print(f"📝 Wrote {args.output}")
+    elif args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        print_comparison(base, new)
+    else:
+        base = _replay_build(os.path.abspath(args.base), args.capture, args)
+        new = _replay_build(os.path.abspath(args.new), args.capture, args)
+        print_comparison(base, new)
+
+if __name__ == "__main__":
+    main()
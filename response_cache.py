@@ -0,0 +1,135 @@
+# response_cache.py
+
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from config import load_env
+
+# Load environment variables from .env file
+load_env()
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_prompt(prompt: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation."""
+    return _WHITESPACE.sub(" ", prompt.casefold()).strip().rstrip(".!?")
+
+class _Entry:
+    __slots__ = ("body", "size", "stored", "refreshing")
+
+    def __init__(self, body: Dict[str, Any], size: int):
+        self.body = body
+        self.size = size
+        self.stored = time.monotonic()
+        self.refreshing = False
+
+class ResponseCache:
+    """
+    Whole-response cache for /api/route with stale-while-revalidate.
+
+    Entries are fresh for `ttl_s`, then served as stale for up to `stale_s`
+    more while one background refresh recomputes them. Memory is bounded by
+    the JSON size of the stored responses (`max_bytes`), evicting LRU first.
+    """
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl_s: float = 300,
+                 stale_s: float = 3600, refresh_workers: int = 2):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.stale_s = stale_s
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="route-cache-refresh")
+        self.stats_counts = {"hit": 0, "stale": 0, "miss": 0, "evicted": 0, "refreshed": 0}
+
+    @staticmethod
+    def key(prompt: str, location_key: str, mode: Optional[str]) -> Tuple[str, str, str]:
+        return (normalize_prompt(prompt), location_key, mode or "")
+
+    def get(self, key: Tuple) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Return (body, state) where state is "HIT", "STALE" or "MISS"."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats_counts["miss"] += 1
+                return None, "MISS"
+            age = time.monotonic() - entry.stored
+            if age > self.ttl_s + self.stale_s:
+                self._remove(key)
+                self.stats_counts["miss"] += 1
+                return None, "MISS"
+            self._entries.move_to_end(key)
+            if age <= self.ttl_s:
+                self.stats_counts["hit"] += 1
+                return entry.body, "HIT"
+            self.stats_counts["stale"] += 1
+            return entry.body, "STALE"
+
+    def put(self, key: Tuple, body: Dict[str, Any]):
+        size = len(json.dumps(body, separators=(",", ":")))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(body, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats_counts["evicted"] += 1
+
+    def revalidate(self, key: Tuple, compute: Callable[[], Optional[Dict[str, Any]]]):
+        """Refresh a stale entry in the background; at most one refresh per key."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.refreshing:
+                return
+            entry.refreshing = True
+
+        def refresh():
+            try:
+                body = compute()
+                if body is not None:
+                    self.put(key, body)
+                    with self._lock:
+                        self.stats_counts["refreshed"] += 1
+            finally:
+                with self._lock:
+                    current = self._entries.get(key)
+                    if current is not None:
+                        current.refreshing = False
+
+        self._refresher.submit(refresh)
+
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, **self.stats_counts}
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide response cache, or None when ROUTE_CACHE_ENABLED=0."""
+    global _cache
+    if os.getenv("ROUTE_CACHE_ENABLED", "1") == "0":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_bytes=int(os.getenv("ROUTE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+                    ttl_s=float(os.getenv("ROUTE_CACHE_TTL_S", "300")),
+                    stale_s=float(os.getenv("ROUTE_CACHE_STALE_S", "3600")),
+                )
+    return _cache
@@ -0,0 +1,152 @@
+# route_metrics.py
+
+"""
+Fitness metrics computed from route geometry instead of flat constants.
+
+`measure()` takes a decoded polyline (and, optionally, elevations sampled at
+even spacing along it) and returns distance, ascent, grade-adjusted MET,
+steps and calories in one pass over the arrays, vectorized when numpy is
+installed. `pre_estimate()` gives the same metrics from straight-line
+(haversine) distances through a candidate's points times a street-detour
+factor, so candidates can be compared with a step, distance or calorie
+target, and clearly infeasible ones dropped, before any Directions call.
+
+MET follows the ACSM walking equation relative to level ground: on level
+ground it equals the flat MET_VALUES, and uphill grades scale it
+(1 + GRADE_FACTORS[mode] * grade). Downhill earns no credit.
+"""
+
+import math
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python loops
+    np = None
+
+EARTH_RADIUS_M = 6_371_008.8
+
+# Level-ground MET per mode (the figures FitnessAgent always used)
+MET_VALUES = {"walking": 3.3, "bicycling": 6.0}
+# MET multiplier per unit of uphill grade. Walking: ACSM's 1.8 * speed * grade
+# term over level-ground VO2 at 80 m/min; bicycling: a rider holding pace
+GRADE_FACTORS = {"walking": 12.5, "bicycling": 10.0}
+MAX_GRADE = 0.25
+# Typical speeds for pre-estimates, m/s
+SPEEDS_MPS = {"walking": 1.34, "bicycling": 4.5}
+# Metres per step (also how step targets become distances)
+STRIDE_M = 0.8
+# Street distance over straight-line distance, for pre-estimates
+DETOUR_FACTOR = 1.3
+DEFAULT_WEIGHT_KG = 70
+
+Point = Tuple[float, float]
+
+class RouteMetrics:
+    """Distance, duration, effort and energy for one route or candidate."""
+    __slots__ = ("distance_m", "duration_s", "ascent_m", "met", "steps", "calories", "estimated")
+
+    def __init__(self, distance_m: float, duration_s: float, ascent_m: float, met: float,
+                 steps: int, calories: float, estimated: bool):
+        self.distance_m = distance_m
+        self.duration_s = duration_s
+        self.ascent_m = ascent_m
+        self.met = met
+        self.steps = steps
+        self.calories = calories
+        self.estimated = estimated
+
+    def meets(self, distance_m: Optional[float] = None, calories: Optional[float] = None) -> bool:
+        """True when every given target (None or 0 means no target) is reached."""
+        return ((distance_m is None or self.distance_m >= distance_m) and
+                (calories is None or self.calories >= calories))
+
+def haversine_m(a: Point, b: Point) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(h)))
+
+def cumulative_distance_m(coords: Sequence[Point]) -> List[float]:
+    """Distance from the first point to every point along the path."""
+    if np is not None and len(coords) > 1:
+        pts = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+        dlat, dlng = np.diff(pts[:, 0]), np.diff(pts[:, 1])
+        h = np.sin(dlat / 2) ** 2 + np.cos(pts[:-1, 0]) * np.cos(pts[1:, 0]) * np.sin(dlng / 2) ** 2
+        seg = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(1.0, h)))
+        return np.concatenate(([0.0], np.cumsum(seg))).tolist()
+    out = [0.0]
+    for a, b in zip(coords, coords[1:]):
+        out.append(out[-1] + haversine_m(a, b))
+    return out
+
+def grade_adjusted_met(mode: str, elevations: Optional[Sequence[float]], spacing_m: float) -> Tuple[float, float]:
+    """
+    (mean MET, total ascent in metres) for elevations sampled every
+    `spacing_m` metres. Equal spacing means equal time per interval, so the
+    mean over intervals is the time-weighted MET.
+    """
+    base = MET_VALUES.get(mode, MET_VALUES["walking"])
+    if not elevations or len(elevations) < 2 or spacing_m <= 0:
+        return base, 0.0
+    factor = GRADE_FACTORS.get(mode, GRADE_FACTORS["walking"])
+    if np is not None:
+        rise = np.diff(np.asarray(elevations, dtype=np.float64))
+        climb = np.clip(rise, 0.0, None)
+        grades = np.minimum(climb / spacing_m, MAX_GRADE)
+        return float(base * (1 + factor * grades).mean()), float(climb.sum())
+    ascent, total = 0.0, 0.0
+    for lo, hi in zip(elevations, elevations[1:]):
+        climb = max(0.0, hi - lo)
+        ascent += climb
+        total += 1 + factor * min(climb / spacing_m, MAX_GRADE)
+    return base * total / (len(elevations) - 1), ascent
+
+def calories(met: float, duration_s: float, weight_kg: float = DEFAULT_WEIGHT_KG) -> float:
+    """kcal = MET x 3.5 x kg / 200 per minute."""
+    return met * 3.5 * weight_kg / 200 * (duration_s / 60)
+
+def _steps(mode: str, distance_m: float) -> int:
+    return int(distance_m / STRIDE_M) if mode == "walking" else 0
+
+def measure(coords: Sequence[Point], mode: str, duration_s: Optional[float] = None,
+            elevations: Optional[Sequence[float]] = None, weight_kg: float = DEFAULT_WEIGHT_KG,
+            distance_m: Optional[float] = None) -> RouteMetrics:
+    """
+    Metrics for a decoded route. `distance_m` and `duration_s` (e.g. the
+    Directions totals) override the path length and the typical-speed time.
+    """
+    length = cumulative_distance_m(coords)[-1] if coords else 0.0
+    distance = length if distance_m is None else distance_m
+    duration = distance / SPEEDS_MPS.get(mode, SPEEDS_MPS["walking"]) if duration_s is None else duration_s
+    spacing = length / (len(elevations) - 1) if elevations and len(elevations) > 1 else 0.0
+    met, ascent = grade_adjusted_met(mode, elevations, spacing)
+    return RouteMetrics(distance, duration, ascent, met, _steps(mode, distance),
+                        calories(met, duration, weight_kg), estimated=False)
+
+def pre_estimate(points: Sequence[Point], mode: str, weight_kg: float = DEFAULT_WEIGHT_KG,
+                 loop: bool = False) -> RouteMetrics:
+    """
+    Metrics guessed from straight lines through `points` (back to the first
+    one when `loop`) times DETOUR_FACTOR, at the mode's typical speed on
+    level ground. No upstream calls.
+    """
+    path = list(points) + [points[0]] if loop and points else list(points)
+    distance = cumulative_distance_m(path)[-1] * DETOUR_FACTOR if len(path) > 1 else 0.0
+    duration = distance / SPEEDS_MPS.get(mode, SPEEDS_MPS["walking"])
+    met = MET_VALUES.get(mode, MET_VALUES["walking"])
+    return RouteMetrics(distance, duration, 0.0, met, _steps(mode, distance),
+                        calories(met, duration, weight_kg), estimated=True)
+
+def target_distance_m(mode: str, distance_m: Optional[float] = None, steps: Optional[float] = None,
+                      calories_kcal: Optional[float] = None, weight_kg: float = DEFAULT_WEIGHT_KG) -> Optional[float]:
+    """Level-ground distance that meets every given target, or None without targets."""
+    needs = []
+    if distance_m:
+        needs.append(distance_m)
+    if steps:
+        needs.append(steps * STRIDE_M)
+    if calories_kcal:
+        speed = SPEEDS_MPS.get(mode, SPEEDS_MPS["walking"])
+        per_second = calories(MET_VALUES.get(mode, MET_VALUES["walking"]), 1.0, weight_kg)
+        needs.append(calories_kcal / per_second * speed)
+    return max(needs) if needs else None
@@ -1,16 +1,22 @@
 import os
-from dotenv import load_dotenv
-import googlemaps
+from config import load_env
 import polyline
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from models import RouteIntent  
+from upstream import create_maps_client
+from deadline import Deadline, should_degrade
+from upstream_scheduler import BULK
+from leg_cache import LegCache, LegResult, leg_key
+from corridor import CorridorCoverage, corridor_centres
+from waypoints import WaypointList
+from scenic_raster import get_scenic_raster
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 class ScenicRouteResponse(BaseModel):
-    waypoints: List[Dict[str, Any]]  # [{"name": ..., "lat": ..., "lng": ...}, …]
+    waypoints: WaypointList  # dumps to [{"name": ..., "lat": ..., "lng": ...}, …]
 
 class ScenicAgent:
     """
@@ -21,9 +27,25 @@ class ScenicAgent:
         self.api_key = api_key or os.getenv("GOOGLE_MAPS_API_KEY")
         if not self.api_key:
             raise ValueError("Missing Google Maps API key")
-        self.client = googlemaps.Client(key=self.api_key)
-
-    def get_scenic_route(self, intent: RouteIntent) -> ScenicRouteResponse:
+        self.client = create_maps_client(self.api_key)
+        # Areas already searched in this request; scoring alternatives and
+        # extracting waypoints share them, so the chosen route costs no new calls
+        self._coverage = CorridorCoverage()
+
+    # Most places_nearby queries per polyline, normally and under a tight budget
+    PLACES_SAMPLES = 10
+    DEGRADED_PLACES_SAMPLES = 3
+    # Places query radius and the half-width of the corridor it must cover
+    PLACES_RADIUS_M = 500
+    CORRIDOR_HALF_WIDTH_M = 250
+    PLACES_KEYWORD = "park|viewpoint"
+
+    def get_scenic_route(
+        self,
+        intent: RouteIntent,
+        deadline: Optional[Deadline] = None,
+        leg_cache: Optional[LegCache] = None
+    ) -> ScenicRouteResponse:
         # Determine primary travel mode (default to driving)
         mode = intent.travel_modes[0] if intent.travel_modes else "driving"
 
@@ -31,7 +53,7 @@ class ScenicAgent:
         points: List[Dict[str, Any]] = []
 
         # a) Origin
-        orig = self._geocode(intent.origin)
+        orig = self._geocode(intent.origin, deadline)
         points.append({"name": intent.origin, "lat": orig["lat"], "lng": orig["lng"]})
 
         # b) Stops handling; if no destination and stops exist, last stop becomes destination
@@ -44,7 +66,7 @@ class ScenicAgent:
                 dest_point = {"name": g.get("name", last["name"]), "lat": g["latitude"], "lng": g["longitude"]}
             else:
                 addr = last.get("address") or last["name"]
-                loc  = self._geocode(addr)
+                loc  = self._geocode(addr, deadline)
                 dest_point = {"name": last["name"], "lat": loc["lat"], "lng": loc["lng"]}
 
         # c) Intermediate stops
@@ -54,7 +76,7 @@ class ScenicAgent:
                 points.append({"name": g.get("name", stop["name"]), "lat": g["latitude"], "lng": g["longitude"]})
             else:
                 addr = stop.get("address") or stop["name"]
-                loc  = self._geocode(addr)
+                loc  = self._geocode(addr, deadline)
                 points.append({"name": stop["name"], "lat": loc["lat"], "lng": loc["lng"]})
 
         # d) Destination
@@ -66,23 +88,32 @@ class ScenicAgent:
                 if intent.location_hint and intent.location_hint.city
                 else intent.origin
             )
-            loc = self._geocode(dest_str)
+            loc = self._geocode(dest_str, deadline)
             points.append({"name": dest_str, "lat": loc["lat"], "lng": loc["lng"]})
 
         # 2. Build ordered waypoints: start with origin
-        waypoints = [points[0]]
+        waypoints = WaypointList([points[0]])
 
         # 3. For each leg, compute scenic segment and extract POI waypoints
+        #    (unchanged legs of a refined request come from the leg cache)
+        optimize = bool(intent.optimize_waypoints)
         for start, end in zip(points, points[1:]):
-            coords = self._best_scenic_segment(start, end, mode, bool(intent.optimize_waypoints))
-            scenic_wpts = self._extract_scenic_waypoints(coords)
-            waypoints.extend(scenic_wpts)
-            waypoints.append(end)
+            key = leg_key(start, end, mode, optimize)
+            leg = leg_cache.get(key) if leg_cache is not None else None
+            if leg is None:
+                degraded_before = len(deadline.degradations) if deadline else 0
+                coords = self._best_scenic_segment(start, end, mode, optimize, deadline)
+                leg = LegResult(coords, self._extract_scenic_waypoints(coords, deadline))
+                # Only full-quality legs are worth reusing
+                if leg_cache is not None and (not deadline or len(deadline.degradations) == degraded_before):
+                    leg_cache.put(key, leg)
+            waypoints.extend(leg.waypoints)
+            waypoints.add(end)
 
         return ScenicRouteResponse(waypoints=waypoints)
 
-    def _geocode(self, address: str) -> Dict[str, float]:
-        res = self.client.geocode(address)
+    def _geocode(self, address: str, deadline: Optional[Deadline] = None) -> Dict[str, float]:
+        res = self.client.geocode(address, deadline=deadline)
         if not res:
             raise RuntimeError(f"Geocode failed for '{address}'")
         return res[0]["geometry"]["location"]
@@ -92,57 +123,92 @@ class ScenicAgent:
         start: Dict[str, float],
         end: Dict[str, float],
         mode: str,
-        optimize: bool
+        optimize: bool,
+        deadline: Optional[Deadline] = None
     ) -> List[List[float]]:
+        first_only = should_degrade(deadline, "first_alternative")
         routes = self.client.directions(
             origin=(start["lat"], start["lng"]),
             destination=(end["lat"], end["lng"]),
             mode=mode,
-            alternatives=True,
-            optimize_waypoints=optimize
+            alternatives=not first_only,
+            optimize_waypoints=optimize,
+            deadline=deadline
         )
+        if not routes:
+            raise RuntimeError("No route returned by Directions API")
+        if first_only or len(routes) == 1 or should_degrade(deadline, "first_alternative"):
+            return polyline.decode(routes[0]["overview_polyline"]["points"])
+        decoded = [polyline.decode(r["overview_polyline"]["points"]) for r in routes]
+        # A precomputed raster (SCENIC_RASTER_PATH) scores alternatives without upstream calls
+        raster = get_scenic_raster()
+        if raster is not None:
+            scores = [raster.score(pts) for pts in decoded]
+            if None not in scores:
+                return decoded[scores.index(max(scores))]
         scored = []
-        for r in routes:
-            pts = polyline.decode(r["overview_polyline"]["points"])
-            poi   = self._poi_density_score(pts)
-            elev  = self._elevation_variation_score(pts)
+        for pts in decoded:
+            poi   = self._poi_density_score(pts, deadline)
+            elev  = 0.0 if should_degrade(deadline, "skip_elevation") else self._elevation_variation_score(pts, deadline)
             score = poi + 0.5 * elev
             scored.append((score, pts))
         return max(scored, key=lambda x: x[0])[1]
 
-    def _poi_density_score(self, coords: List[List[float]]) -> float:
-        interval = max(1, len(coords) // 10)
-        total = 0
-        for lat, lng in coords[::interval]:
-            res = self.client.places_nearby(location=(lat, lng), radius=500, type="park")
-            total += len(res.get("results", []))
-        return total / max(1, len(coords) / 1000)
+    def _corridor(self, coords: List[List[float]], deadline: Optional[Deadline]):
+        samples = self.DEGRADED_PLACES_SAMPLES if should_degrade(deadline, "fewer_places_samples") else self.PLACES_SAMPLES
+        return corridor_centres(coords, self.PLACES_RADIUS_M, self.CORRIDOR_HALF_WIDTH_M, max_centres=samples)
+
+    def _places_around(self, centre, radius: int, deadline: Optional[Deadline]) -> List[Dict[str, Any]]:
+        """places_nearby for one corridor circle, unless earlier circles already cover it."""
+        coverage = self._coverage
+        if coverage.covers(centre, radius):
+            coverage.skipped += 1
+            return coverage.results_within(centre, radius)
+        results = self.client.places_nearby(location=centre, radius=radius, keyword=self.PLACES_KEYWORD,
+                                            deadline=deadline, priority=BULK).get("results", [])
+        coverage.queries += 1
+        coverage.add(centre, radius, results)
+        return results
+
+    def _poi_density_score(self, coords: List[List[float]], deadline: Optional[Deadline] = None) -> float:
+        """
+        Parks found per corridor circle, scaled to PLACES_SAMPLES circles: the
+        same range as the per-sample park counts the score has always summed,
+        so it keeps its weight against the elevation score (metres).
+        """
+        centres, radius = self._corridor(coords, deadline)
+        counts = []
+        for centre in centres:
+            if deadline is not None and deadline.expired():
+                deadline.should_degrade("fewer_places_samples")
+                break
+            # park|viewpoint results narrowed to what a type="park" search returns
+            counts.append(sum(1 for p in self._places_around(centre, radius, deadline)
+                              if "park" in p.get("types", ())))
+        return self.PLACES_SAMPLES * sum(counts) / len(counts) if counts else 0.0
 
-    def _elevation_variation_score(self, coords: List[List[float]]) -> float:
+    def _elevation_variation_score(self, coords: List[List[float]], deadline: Optional[Deadline] = None) -> float:
         samples = min(len(coords), 10)
-        elev = self.client.elevation_along_path(path=coords, samples=samples)
+        elev = self.client.elevation_along_path(path=coords, samples=samples, deadline=deadline, priority=BULK)
         vals = [p["elevation"] for p in elev]
         return sum(abs(vals[i] - vals[i-1]) for i in range(1, len(vals)))
 
-    def _extract_scenic_waypoints(self, coords: List[List[float]]) -> List[Dict[str, Any]]:
-        interval = max(1, len(coords) // 10)
+    def _extract_scenic_waypoints(self, coords: List[List[float]], deadline: Optional[Deadline] = None) -> WaypointList:
+        centres, radius = self._corridor(coords, deadline)
         seen = set()
-        wpts: List[Dict[str, Any]] = []
-        for lat, lng in coords[::interval]:
-            results = self.client.places_nearby(
-                location=(lat, lng),
-                radius=500,
-                keyword="park|viewpoint"
-            ).get("results", [])
-            if not results:
-                continue
-            top = results[0]
-            pid = top["place_id"]
-            if pid in seen:
+        wpts = WaypointList()
+        for centre in centres:
+            # Scenic stops are optional: return what we have once the budget is gone
+            if deadline is not None and deadline.expired():
+                deadline.should_degrade("fewer_places_samples")
+                break
+            results = self._places_around(centre, radius, deadline)
+            top = next((r for r in results if r["place_id"] not in seen), None)
+            if top is None:
                 continue
-            seen.add(pid)
+            seen.add(top["place_id"])
             loc = top["geometry"]["location"]
-            wpts.append({"name": top["name"], "lat": loc["lat"], "lng": loc["lng"]})
+            wpts.append(top["name"], loc["lat"], loc["lng"])
             if len(wpts) >= 5:
                 break
         return wpts
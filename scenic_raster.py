@@ -0,0 +1,372 @@
+# scenic_raster.py
+
+"""
+Precomputed regional raster of scenic scores, so ScenicAgent can rank
+route alternatives without live Places and Elevation calls.
+
+Built offline from Maps data for a bounding box:
+
+    python scenic_raster.py build --bbox 37.70,-122.35,37.95,-122.10 \\
+        --cell-m 250 --out data/scenic_raster.bin [--feedback feedback.csv]
+    python scenic_raster.py score <encoded polyline>
+
+Each cell combines park/viewpoint density (places within the cell and its
+neighbours), elevation roughness (mean height difference to neighbouring
+cells) and optional user feedback (lat,lng,weight rows), each scaled to
+0..1, weighted like the live score (POIs + 0.5 * elevation).
+
+Layout (little-endian): a 64-byte header (magic "SCENIC1\\0", rows u32,
+cols u32, south f64, west f64, cell height f64 and cell width f64 in
+degrees, padding) followed by rows * cols float32 scores, row-major from
+the south-west corner. The file is memory-mapped; a route is scored by
+resampling its polyline at half-cell spacing and averaging the cells it
+crosses, in one vectorized lookup when numpy is installed.
+"""
+
+import os
+import csv
+import sys
+import math
+import mmap
+import struct
+import argparse
+import threading
+from array import array
+from typing import Iterable, List, Optional, Sequence, Tuple
+from config import load_env
+
+# Load environment variables from .env file
+load_env()
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python lookups
+    np = None
+
+MAGIC = b"SCENIC1\0"
+# magic, rows, cols, south, west, cell height (deg), cell width (deg), padding to 64 bytes
+HEADER = struct.Struct("<8sIIdddd16x")
+
+M_PER_DEG_LAT = 111_320.0
+
+# Component weights, matching ScenicAgent's live score (POIs + 0.5 * elevation)
+POI_WEIGHT = 1.0
+ELEVATION_WEIGHT = 0.5
+FEEDBACK_WEIGHT = 0.5
+
+# Routes with less of their length inside the raster fall back to live scoring
+MIN_COVERAGE = 0.8
+
+PLACES_KEYWORD = "park|viewpoint"
+# Most elevation samples per request (the Elevation API limit)
+MAX_ELEVATION_SAMPLES = 512
+
+class RasterSpec:
+    """Geometry of a raster: `rows` x `cols` cells from the south-west corner."""
+    def __init__(self, south: float, west: float, cell_lat: float, cell_lng: float, rows: int, cols: int):
+        self.south, self.west = south, west
+        self.cell_lat, self.cell_lng = cell_lat, cell_lng
+        self.rows, self.cols = rows, cols
+
+    @classmethod
+    def from_bbox(cls, south: float, west: float, north: float, east: float, cell_m: float) -> "RasterSpec":
+        cell_lat = cell_m / M_PER_DEG_LAT
+        cell_lng = cell_m / (M_PER_DEG_LAT * math.cos(math.radians((south + north) / 2)))
+        rows = max(1, math.ceil((north - south) / cell_lat))
+        cols = max(1, math.ceil((east - west) / cell_lng))
+        return cls(south, west, cell_lat, cell_lng, rows, cols)
+
+    @property
+    def cell_m(self) -> float:
+        return self.cell_lat * M_PER_DEG_LAT
+
+    def centre(self, row: int, col: int) -> Tuple[float, float]:
+        return self.south + (row + 0.5) * self.cell_lat, self.west + (col + 0.5) * self.cell_lng
+
+    def cell(self, lat: float, lng: float) -> Optional[Tuple[int, int]]:
+        row = math.floor((lat - self.south) / self.cell_lat)
+        col = math.floor((lng - self.west) / self.cell_lng)
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row, col
+        return None
+
+def _neighbourhood_sum(spec: RasterSpec, values: Sequence[float]) -> List[float]:
+    """3x3 box sum per cell (so a cell sees the POIs a corridor search around it would)."""
+    out = [0.0] * len(values)
+    for r in range(spec.rows):
+        for c in range(spec.cols):
+            total = 0.0
+            for rr in range(max(0, r - 1), min(spec.rows, r + 2)):
+                base = rr * spec.cols
+                for cc in range(max(0, c - 1), min(spec.cols, c + 2)):
+                    total += values[base + cc]
+            out[r * spec.cols + c] = total
+    return out
+
+def _roughness(spec: RasterSpec, elevations: Sequence[float]) -> List[float]:
+    """Mean absolute height difference to the 4-neighbours, per cell."""
+    out = [0.0] * len(elevations)
+    for r in range(spec.rows):
+        for c in range(spec.cols):
+            here = elevations[r * spec.cols + c]
+            diffs = [abs(here - elevations[rr * spec.cols + cc])
+                     for rr, cc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1))
+                     if 0 <= rr < spec.rows and 0 <= cc < spec.cols]
+            out[r * spec.cols + c] = sum(diffs) / len(diffs) if diffs else 0.0
+    return out
+
+def _scaled(values: Sequence[float]) -> List[float]:
+    top = max(values, default=0.0)
+    return [v / top for v in values] if top > 0 else [0.0] * len(values)
+
+def compute_scores(spec: RasterSpec, pois: Iterable[Tuple[float, float]],
+                   elevations: Optional[Sequence[float]] = None,
+                   feedback: Iterable[Tuple[float, float, float]] = ()) -> List[float]:
+    """Scenic score per cell from POI locations, cell-centre elevations and feedback points."""
+    n = spec.rows * spec.cols
+    counts = [0.0] * n
+    for lat, lng in pois:
+        cell = spec.cell(lat, lng)
+        if cell is not None:
+            counts[cell[0] * spec.cols + cell[1]] += 1
+    scores = [POI_WEIGHT * v for v in _scaled(_neighbourhood_sum(spec, counts))]
+    if elevations is not None:
+        for i, v in enumerate(_scaled(_roughness(spec, elevations))):
+            scores[i] += ELEVATION_WEIGHT * v
+    votes = [0.0] * n
+    for lat, lng, weight in feedback:
+        cell = spec.cell(lat, lng)
+        if cell is not None:
+            votes[cell[0] * spec.cols + cell[1]] += weight
+    if any(votes):
+        # Negative feedback lowers a cell; scale by the largest magnitude
+        top = max(abs(v) for v in votes)
+        for i, v in enumerate(votes):
+            scores[i] += FEEDBACK_WEIGHT * v / top
+    return scores
+
+def write_raster(path: str, spec: RasterSpec, scores: Sequence[float]):
+    """Atomically write a raster file."""
+    if len(scores) != spec.rows * spec.cols:
+        raise ValueError(f"Expected {spec.rows * spec.cols} scores, got {len(scores)}")
+    values = array("f", scores)
+    if sys.byteorder != "little":
+        values.byteswap()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, spec.rows, spec.cols, spec.south, spec.west, spec.cell_lat, spec.cell_lng))
+        f.write(values.tobytes())
+    os.replace(tmp, path)
+
+# --- Offline inputs from the Maps APIs ---
+
+def fetch_pois(client, spec: RasterSpec, block: int = 4) -> List[Tuple[float, float]]:
+    """Parks and viewpoints over the raster: one places_nearby per `block` x `block` cells."""
+    from upstream_scheduler import BULK
+    radius = int(spec.cell_m * block * math.sqrt(2) / 2) + 1
+    seen = {}
+    for r in range(0, spec.rows, block):
+        for c in range(0, spec.cols, block):
+            lat, lng = spec.centre(min(spec.rows - 1, r + block // 2), min(spec.cols - 1, c + block // 2))
+            results = client.places_nearby(location=(lat, lng), radius=radius, keyword=PLACES_KEYWORD,
+                                           priority=BULK).get("results", [])
+            for place in results:
+                loc = place["geometry"]["location"]
+                seen[place.get("place_id") or (loc["lat"], loc["lng"])] = (loc["lat"], loc["lng"])
+    return list(seen.values())
+
+def fetch_elevations(client, spec: RasterSpec) -> List[float]:
+    """Cell-centre elevations, one elevation_along_path per row (split at the API's sample limit)."""
+    from upstream_scheduler import BULK
+    elevations: List[float] = []
+    for r in range(spec.rows):
+        for start in range(0, spec.cols, MAX_ELEVATION_SAMPLES):
+            cols = range(start, min(spec.cols, start + MAX_ELEVATION_SAMPLES))
+            if len(cols) == 1:
+                # A path needs two ends; sample the one centre twice
+                path = [spec.centre(r, cols[0])] * 2
+            else:
+                path = [spec.centre(r, cols[0]), spec.centre(r, cols[-1])]
+            points = client.elevation_along_path(path=path, samples=max(2, len(cols)), priority=BULK)
+            elevations.extend(p["elevation"] for p in points[:len(cols)])
+    return elevations
+
+def load_feedback(path: str) -> List[Tuple[float, float, float]]:
+    """lat,lng,weight rows (header optional; weight defaults to 1)."""
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            try:
+                lat, lng = float(row[0]), float(row[1])
+            except (ValueError, IndexError):
+                continue
+            rows.append((lat, lng, float(row[2]) if len(row) > 2 and row[2] else 1.0))
+    return rows
+
+# --- Request-time lookups ---
+
+def _resample(coords: Sequence[Sequence[float]], step_m: float) -> Tuple[List[float], List[float]]:
+    """Points every ~step_m metres along the polyline (pure Python)."""
+    lat0 = math.radians(coords[0][0])
+    kx = M_PER_DEG_LAT * math.cos(lat0)
+    cum = [0.0]
+    for (a_lat, a_lng), (b_lat, b_lng) in zip(coords, coords[1:]):
+        cum.append(cum[-1] + math.hypot((b_lat - a_lat) * M_PER_DEG_LAT, (b_lng - a_lng) * kx))
+    n = max(2, int(cum[-1] / step_m) + 1)
+    lats, lngs = [], []
+    seg = 0
+    for k in range(n):
+        s = cum[-1] * k / (n - 1)
+        while seg < len(cum) - 2 and cum[seg + 1] < s:
+            seg += 1
+        span = cum[seg + 1] - cum[seg] if len(cum) > 1 else 0.0
+        t = (s - cum[seg]) / span if span > 0 else 0.0
+        a = coords[seg]
+        b = coords[min(seg + 1, len(coords) - 1)]
+        lats.append(a[0] + (b[0] - a[0]) * t)
+        lngs.append(a[1] + (b[1] - a[1]) * t)
+    return lats, lngs
+
+class ScenicRaster:
+    """A memory-mapped scenic-score raster."""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size:
+            raise ValueError(f"{path} is too short to be a scenic raster")
+        magic, rows, cols, south, west, cell_lat, cell_lng = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a scenic raster")
+        if len(self._mm) < HEADER.size + rows * cols * 4:
+            raise ValueError(f"{path} is truncated")
+        self.spec = RasterSpec(south, west, cell_lat, cell_lng, rows, cols)
+        if np is not None:
+            self._grid = np.frombuffer(self._mm, dtype="<f4", count=rows * cols, offset=HEADER.size).reshape(rows, cols)
+        elif sys.byteorder == "little":
+            self._cells = memoryview(self._mm)[HEADER.size:HEADER.size + rows * cols * 4].cast("f")
+        else:
+            self._cells = array("f", self._mm[HEADER.size:HEADER.size + rows * cols * 4])
+            self._cells.byteswap()
+
+    def value(self, lat: float, lng: float) -> Optional[float]:
+        cell = self.spec.cell(lat, lng)
+        if cell is None:
+            return None
+        if np is not None:
+            return float(self._grid[cell])
+        return self._cells[cell[0] * self.spec.cols + cell[1]]
+
+    def score(self, coords: Sequence[Sequence[float]]) -> Optional[float]:
+        """
+        Mean scenic score along a decoded polyline, or None when less than
+        MIN_COVERAGE of it lies inside the raster.
+        """
+        if not coords:
+            return None
+        spec = self.spec
+        step = spec.cell_m / 2
+        if np is not None:
+            return self._score_numpy(coords, step)
+        lats, lngs = _resample(coords, step)
+        values = []
+        for lat, lng in zip(lats, lngs):
+            cell = spec.cell(lat, lng)
+            if cell is not None:
+                values.append(self._cells[cell[0] * spec.cols + cell[1]])
+        if len(values) < MIN_COVERAGE * len(lats):
+            return None
+        return sum(values) / len(values)
+
+    def _score_numpy(self, coords: Sequence[Sequence[float]], step: float) -> Optional[float]:
+        spec = self.spec
+        pts = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        kx = M_PER_DEG_LAT * math.cos(math.radians(pts[0, 0]))
+        seg = np.hypot(np.diff(pts[:, 0]) * M_PER_DEG_LAT, np.diff(pts[:, 1]) * kx)
+        cum = np.concatenate(([0.0], np.cumsum(seg)))
+        n = max(2, int(cum[-1] / step) + 1)
+        s = np.linspace(0.0, cum[-1], n)
+        lat = np.interp(s, cum, pts[:, 0])
+        lng = np.interp(s, cum, pts[:, 1])
+        rows = np.floor((lat - spec.south) / spec.cell_lat).astype(np.int64)
+        cols = np.floor((lng - spec.west) / spec.cell_lng).astype(np.int64)
+        inside = (rows >= 0) & (rows < spec.rows) & (cols >= 0) & (cols < spec.cols)
+        if inside.sum() < MIN_COVERAGE * n:
+            return None
+        return float(self._grid[rows[inside], cols[inside]].mean())
+
+_raster: Optional[ScenicRaster] = None
+_raster_lock = threading.Lock()
+# (path, mtime) of the last file that failed to load, so it isn't retried per request
+_failed: Optional[Tuple[str, Optional[float]]] = None
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def get_scenic_raster() -> Optional[ScenicRaster]:
+    """
+    Process-wide raster from SCENIC_RASTER_PATH, or None when unset or
+    unreadable. A failed load is retried only once the file changes.
+    """
+    global _raster, _failed
+    path = os.getenv("SCENIC_RASTER_PATH")
+    if not path:
+        return None
+    if _raster is None or _raster.path != path:
+        attempt = (path, _mtime(path))
+        if _failed == attempt:
+            return None
+        with _raster_lock:
+            if _raster is None or _raster.path != path:
+                if _failed == attempt:
+                    return None
+                try:
+                    _raster = ScenicRaster(path)
+                except (OSError, ValueError) as e:
+                    print(f"Warning: scenic raster unavailable: {str(e)}")
+                    _failed = attempt
+                    return None
+    return _raster
+
+def build_from_maps(bbox: Tuple[float, float, float, float], cell_m: float, out: str,
+                    feedback_path: Optional[str] = None, elevation: bool = True,
+                    api_key: Optional[str] = None) -> RasterSpec:
+    """Fetch POIs (and elevations) for `bbox` (south, west, north, east) and write the raster."""
+    from upstream import create_maps_client
+    client = create_maps_client(api_key or os.getenv("GOOGLE_MAPS_API_KEY"))
+    spec = RasterSpec.from_bbox(*bbox, cell_m)
+    pois = fetch_pois(client, spec)
+    elevations = fetch_elevations(client, spec) if elevation else None
+    feedback = load_feedback(feedback_path) if feedback_path else ()
+    write_raster(out, spec, compute_scores(spec, pois, elevations, feedback))
+    return spec
+
+def main():
+    ap = argparse.ArgumentParser(description="Build or query a precomputed scenic-score raster")
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--bbox", required=True, help="south,west,north,east")
+    b.add_argument("--cell-m", type=float, default=250.0)
+    b.add_argument("--out", default=os.getenv("SCENIC_RASTER_PATH", "data/scenic_raster.bin"))
+    b.add_argument("--feedback", help="CSV of lat,lng,weight user feedback")
+    b.add_argument("--no-elevation", action="store_true")
+    s = sub.add_parser("score")
+    s.add_argument("polyline", help="encoded polyline")
+    s.add_argument("--raster", default=os.getenv("SCENIC_RASTER_PATH", "data/scenic_raster.bin"))
+    args = ap.parse_args()
+
+    if args.command == "build":
+        bbox = tuple(float(v) for v in args.bbox.split(","))
+        if len(bbox) != 4:
+            ap.error("--bbox takes south,west,north,east")
+        spec = build_from_maps(bbox, args.cell_m, args.out, args.feedback, not args.no_elevation)
+        print(f"Wrote {args.out} ({spec.rows}x{spec.cols} cells of {args.cell_m:.0f} m)")
+    else:
+        import polyline
+        print(ScenicRaster(args.raster).score(polyline.decode(args.polyline)))
+
+if __name__ == "__main__":
+    main()
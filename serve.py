@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Pre-fork launcher: serve `main.app` from several worker processes.
+
+The parent binds the listening socket, imports the app (running the
+WARM_UP hook, so agents, parser and caches load once and are shared
+copy-on-write), then forks the workers. Every worker accepts on the same
+socket with a threaded WSGI server, and the parent restarts any worker
+that dies. SIGINT/SIGTERM stop them all.
+
+Upstream answers are cached in a shared sqlite (WAL) file by default
+(UPSTREAM_CACHE=sqlite), so every worker sees one warm geocode, directions
+and places cache; see upstream_cache.py.
+
+Everything else a request can leave behind lives in one worker's memory:
+async route jobs (jobs.py), navigation sessions (navigation.py), per-session
+leg caches (leg_cache.py) and the route response cache (response_cache.py).
+A follow-up request that lands on another worker won't find its job or
+session (404) or reused legs, and each worker warms its own response cache.
+Clients of /api/jobs, /api/nav/sessions or session_id refinements
+need --workers 1 or a proxy with sticky routing (e.g. by client address).
+
+Usage:
+    python serve.py                         # SERVE_WORKERS (default: CPU count)
+    python serve.py --workers 4 --host 0.0.0.0 --port 8000
+"""
+
+import os
+import sys
+import signal
+import socket
+import argparse
+import logging
+from typing import Dict
+from config import load_env
+
+# Load environment variables from .env file
+load_env()
+
+logger = logging.getLogger("serve")
+
+def _serve_worker(sock: socket.socket, app):
+    from werkzeug.serving import make_server
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+def _spawn(sock: socket.socket, app) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _serve_worker(sock, app)
+        except BaseException:
+            logger.exception("Worker crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+def serve(host: str, port: int, workers: int):
+    os.environ.setdefault("UPSTREAM_CACHE", "sqlite")
+    os.environ.setdefault("WARM_UP", "1")
+
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+
+    from main import app
+
+    if not hasattr(os, "fork") or workers <= 1:
+        print(f"🚀 Serving on http://{host}:{port} (1 process)")
+        _serve_worker(sock, app)
+        return
+
+    children: Dict[int, int] = {}  # pid -> worker slot
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Capture files rotate per process; give each worker its own
+    capture_path = os.getenv("TRAFFIC_CAPTURE_PATH")
+    if capture_path and "{pid}" not in capture_path:
+        from traffic_capture import per_process_path
+        os.environ["TRAFFIC_CAPTURE_PATH"] = per_process_path(capture_path)
+        print(f"Traffic capture writes one file per worker: {os.environ['TRAFFIC_CAPTURE_PATH']}")
+    print("Warning: route jobs, navigation sessions and leg caches are per-worker; "
+          "use --workers 1 or sticky routing for clients that poll or refine")
+    for slot in range(workers):
+        children[_spawn(sock, app)] = slot
+    print(f"🚀 Serving on http://{host}:{port} with {workers} workers (pids {sorted(children)})")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}; restarting")
+            children[_spawn(sock, app)] = slot
+    sock.close()
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve the MapsAI API from several pre-forked workers.")
+    ap.add_argument("--host", default=os.getenv("SERVE_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("SERVE_PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1))))
+    args = ap.parse_args()
+    serve(args.host, args.port, args.workers)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,30 @@
 import re
 import json
-import requests
 import os
-from dotenv import load_dotenv
+from config import load_env
 import google_text_search
-from fitness_agent import FitnessAgent
-from scenic_agent import ScenicAgent
-from fallback_agent import FallbackAgent    
-from polyline_agent import PolylineAgent
 from models import LocationHint, RouteIntent
 from typing import Dict, Optional, Literal, Any
 from pydantic import BaseModel, validator
 from nvidia_agent import NVIDIAAgent
+from deadline import Deadline
+from ip_geo import get_ip_geo
+from upstream import memoized
+from response_cache import normalize_prompt
 
 # Load environment variables from .env file
-load_dotenv()
+load_env()
 
 # --- Configuration ---
 NVIDIA_API_KEY = os.getenv("NVIDIA_API_KEY")
 if not NVIDIA_API_KEY:
-    raise ValueError("NVIDIA_API_KEY environment variable is required. Set it with: export NVIDIA_API_KEY=your_key_here")
+    print("Warning: NVIDIA_API_KEY is not set; intent parsing uses mock responses")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+# Text search bias radius for stops: the default, and the floor used when the
+# IP-prefix table locates the user precisely
+DEFAULT_SEARCH_RADIUS_M = 5000
+MIN_SEARCH_RADIUS_M = 2000
 # --- Data Models (Structured Output) ---
 class LocationHint(BaseModel):
     country: str
@@ -28,6 +32,8 @@ class LocationHint(BaseModel):
     city: Optional[str] = None
     postal_code: Optional[str] = None
     coordinates: Optional[Dict[Literal["latitude", "longitude"], float]] = None
+    accuracy_m: Optional[int] = None  # Radius the location is known to within
+    timezone: Optional[str] = None  # IANA zone, e.g. "America/Los_Angeles"
 
 class RouteIntent(BaseModel):
     intent_type: Literal["Health", "Scenic", "Eco-conscious", "Commute", "Transit", "Event", "Road-Trip", "Other"]
@@ -47,13 +53,25 @@ class NVIDIAIntentParser:
     def __init__(self):
         self.nvidia_agent = NVIDIAAgent(api_key=NVIDIA_API_KEY) 
 
-    # TODO: This is a placeholder for the actual location hint extraction.
     def _extract_location_hint(self, ipv6: str) -> Optional[LocationHint]:
-        """Extract approximate location from IPv6 (US-centric)."""
+        """Approximate location from the local IP-prefix table (IPv6 or IPv4)."""
         try:
-            # if ipv6.startswith("2607:f140"):  # Known US IPv6 prefix
-            #     return LocationHint(country="US", region="East Coast")
-          
+            db = get_ip_geo()
+            match = db.lookup(ipv6) if db and ipv6 else None
+            if match:
+                return LocationHint(
+                    country=match["country"],
+                    region=match["region"],
+                    city=match["city"],
+                    coordinates={
+                        "latitude": match["latitude"],
+                        "longitude": match["longitude"]
+                    },
+                    accuracy_m=int(match["accuracy_km"] * 1000),
+                    timezone=match.get("timezone")
+                )
+
+            # Unknown prefix: default to San Francisco
             return LocationHint(
                 country="US",
                 region="California",
@@ -62,12 +80,27 @@ class NVIDIAIntentParser:
                 coordinates={
                     "latitude": 37.7749,
                     "longitude": -122.4194
-                }
+                },
+                timezone="America/Los_Angeles"
             )
-        except:
+        except Exception:
             return None
 
-    def _enrich_stops_with_google_search(self, route_intent: RouteIntent) -> RouteIntent:
+    def _search_radius(self, location_hint: Optional[LocationHint]) -> int:
+        """Tighter text-search bias when the user's location is known precisely."""
+        if location_hint and location_hint.accuracy_m:
+            return max(MIN_SEARCH_RADIUS_M, min(DEFAULT_SEARCH_RADIUS_M, location_hint.accuracy_m))
+        return DEFAULT_SEARCH_RADIUS_M
+
+    def location_key(self, ipv6: str) -> str:
+        """Coarse location the user is routed from, for cache keys."""
+        hint = self._extract_location_hint(ipv6)
+        if not hint:
+            return ""
+        coords = hint.coordinates or {}
+        return f"{hint.country}|{hint.region or ''}|{hint.city or ''}|{coords.get('latitude', '')},{coords.get('longitude', '')}"
+
+    def _enrich_stops_with_google_search(self, route_intent: RouteIntent, deadline: Optional[Deadline] = None) -> RouteIntent:
         """Enrich each stop with Google Text Search results and return the modified RouteIntent."""
         if not route_intent.stops:
             return route_intent
@@ -79,63 +112,42 @@ class NVIDIAIntentParser:
         location_coords = None
         if route_intent.location_hint and route_intent.location_hint.coordinates:
             location_coords = (route_intent.location_hint.coordinates["latitude"], route_intent.location_hint.coordinates["longitude"])
+        search_radius = self._search_radius(route_intent.location_hint)
         
-        enriched_stops = []
-        for stop in route_intent.stops:
-            # Create a copy of the stop to avoid modifying the original
-            enriched_stop = stop.copy()
-            
-            # Search for the stop name or address
-            search_query = stop.get("name") or stop.get("address") or "place"
-            if search_query:
-                try:
-                    # Perform Google Text Search
-                    search_results = google_client.search(
-                        query=search_query,
-                        location=location_coords,
-                        radius=5000
-                    )
-                    
-                    # Add search results to the stop
-                    enriched_stop["gsr"] = search_results
-                    
-                except Exception as e:
-                    # If search fails, add empty results but don't fail the entire process
-                    enriched_stop["gsr"] = []
-                    print(f"Warning: Google search failed for '{search_query}': {str(e)}")
-            else:
-                enriched_stop["gsr"] = []
-            
-            enriched_stops.append(enriched_stop)
-        
-        # Create a new RouteIntent with the enriched stops
-        enriched_route_intent = RouteIntent(
-            intent_type=route_intent.intent_type,
-            origin=route_intent.origin,
-            destination=route_intent.destination,
-            travel_modes=route_intent.travel_modes,
-            departure_time=route_intent.departure_time,
-            arrival_time=route_intent.arrival_time,
-            constraints=route_intent.constraints,
-            avoid=route_intent.avoid,
-            optimize_waypoints=route_intent.optimize_waypoints,
-            stops=enriched_stops,
-            location_hint=route_intent.location_hint
+        # Search every stop's name or address at once; a failed search leaves its stop with no results
+        queries = [stop.get("name") or stop.get("address") or "place" for stop in route_intent.stops]
+        search_results = google_client.search_many(
+            queries,
+            location=location_coords,
+            radius=search_radius,
+            deadline=deadline
         )
+        # Copies, so the original stops are not modified
+        enriched_stops = [dict(stop, gsr=results) for stop, results in zip(route_intent.stops, search_results)]
         
-        return enriched_route_intent
+        # Copy with the enriched stops; the other fields were validated already
+        return route_intent.model_copy(update={"stops": enriched_stops})
 
-    def _parse_to_structured(self, prompt: str, ipv6: str) -> Dict:
-        """Call NVIDIA's NLP model to extract intent."""
-        return self.nvidia_agent.parse_intent(prompt, ipv6)
+    def _parse_to_structured(self, prompt: str, ipv6: str, deadline: Optional[Deadline] = None) -> Dict:
+        """
+        Call NVIDIA's NLP model to extract intent. Answers are memoized and
+        cached across requests (the "intent" upstream cache) per normalized
+        prompt and coarse user location. Answers with a departure or arrival
+        time are not cached: the times are absolute ("8am tomorrow" resolved
+        on the day it was asked), so they go stale.
+        """
+        key = (normalize_prompt(prompt), self.location_key(ipv6))
+        raw = memoized("intent", key, {}, lambda: self.nvidia_agent.parse_intent(prompt, ipv6, deadline=deadline),
+                       cache_if=lambda parsed: not (parsed.get("departure_time") or parsed.get("arrival_time")))
+        return dict(raw)
 
-    def parse_prompt(self, prompt: str, user_ipv6: str) -> RouteIntent:
+    def parse_prompt(self, prompt: str, user_ipv6: str, deadline: Optional[Deadline] = None) -> RouteIntent:
         """Main function: Parse natural language into a RouteIntent object."""
         # Step 1: Extract location hint for defaults
         location_hint = self._extract_location_hint(user_ipv6)
         
         # Step 2: Call ASI:One agent
-        raw_response = self._parse_to_structured(prompt, user_ipv6)
+        raw_response = self._parse_to_structured(prompt, user_ipv6, deadline)
         
         # Step 3: Validate and enrich response
         if not raw_response.get("destination"):
@@ -147,7 +159,7 @@ class NVIDIAIntentParser:
         
         # Step 5: Enrich stops with Google search results if stops exist
         if route_intent.stops:
-            enriched_route_intent = self._enrich_stops_with_google_search(route_intent)
+            enriched_route_intent = self._enrich_stops_with_google_search(route_intent, deadline)
             # Update the stops field with enriched data
             route_intent = enriched_route_intent
                 
@@ -155,6 +167,11 @@ class NVIDIAIntentParser:
 
 # --- Example Usage ---
 if __name__ == "__main__":
+    from fitness_agent import FitnessAgent
+    from scenic_agent import ScenicAgent
+    from fallback_agent import FallbackAgent
+    from polyline_agent import PolylineAgent
+
     # Example prompts matching your use cases
     # prompts = [
     #     "Give me a scenic route from UC Berkeley to Castro Valley",
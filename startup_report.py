@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Break down the cold-start cost of importing the app, module by module.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+aggregates the self time of every imported module by top-level package, so
+it is easy to see which dependency a cold start is paying for.
+
+Usage:
+    python startup_report.py                # import main, top 15 packages
+    python startup_report.py starter --top 30
+    WARM_UP=1 python startup_report.py      # include the warm-up hook
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for every module imported by `module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def by_package(rows: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Self time summed per top-level package, in microseconds."""
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name.split(".")[0]] += self_us
+    return dict(totals)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("module", nargs="?", default="main")
+    ap.add_argument("--top", type=int, default=15)
+    args = ap.parse_args()
+
+    rows = import_times(args.module)
+    totals = by_package(rows)
+    total_us = sum(totals.values())
+    print(f"import {args.module}: {total_us / 1000:.1f} ms across {len(rows)} modules\n")
+    print(f"{'package':<28}{'self ms':>10}{'share':>8}")
+    for package, us in sorted(totals.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"{package:<28}{us / 1000:>10.1f}{us / total_us:>8.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for /api/routes/batch: prompt dedup, shared upstream memo and item validation
+"""
+
+import threading
+import pytest
+import main
+from upstream import memoized
+
+class _Intent:
+    def __init__(self, prompt):
+        self.prompt = prompt
+
+    def model_dump(self):
+        return {"prompt": self.prompt}
+
+class _Parser:
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def parse_prompt(self, prompt, ipv6, deadline=None):
+        with self._lock:
+            self.calls.append((prompt, deadline))
+        return _Intent(prompt)
+
+@pytest.fixture
+def batch(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_CACHE", "off")
+    monkeypatch.delenv("ROUTE_BUDGET_MS", raising=False)
+    parser, geocodes = _Parser(), []
+
+    def plan_modes(intent, deadline=None, session_id=None):
+        # Every prompt geocodes the same place, so the batch should ask once
+        place = memoized("geocode", ("Berkeley, CA",), {}, lambda: geocodes.append(1) or [{"lat": 37.87}])
+        return {"waypoints": {"prompt": intent.prompt, "place": place}}
+
+    monkeypatch.setattr(main, "get_parser", lambda: parser)
+    monkeypatch.setattr(main, "plan_modes", plan_modes)
+    client = main.app.test_client()
+    return lambda body: client.post("/api/routes/batch", json=body).get_json(), parser, geocodes
+
+def test_identical_prompts_are_parsed_once_and_upstream_calls_shared(batch):
+    post, parser, geocodes = batch
+    out = post({"prompts": ["scenic walk", "scenic walk", "bike loop"]})
+    assert sorted(p for p, _ in parser.calls) == ["bike loop", "scenic walk"]
+    assert len(geocodes) == 1
+    assert [r["index"] for r in out["results"]] == [0, 1, 2]
+    assert out["stats"]["unique_prompts"] == 2
+    assert out["stats"]["upstream_calls"] == 1 and out["stats"]["deduplicated_calls"] == 2
+
+def test_invalid_items_get_their_own_errors(batch):
+    post, parser, _ = batch
+    out = post({"items": ["scenic walk", 42, {"prompt": ""}, {"prompt": "bike loop", "budget_ms": -5}]})
+    assert [r.get("error") for r in out["results"]] == [
+        None, "Each item must be a prompt string or an object", "Missing prompt", "budget_ms must be a positive number"]
+    assert out["stats"]["succeeded"] == 1 and out["stats"]["failed"] == 3
+    assert [p for p, _ in parser.calls] == ["scenic walk"]
+
+def test_parse_gets_the_loosest_budget_of_its_items(batch):
+    post, parser, _ = batch
+    post({"items": [{"prompt": "scenic walk", "budget_ms": 500}, {"prompt": "scenic walk", "budget_ms": 5000}]})
+    (_, deadline), = parser.calls
+    assert deadline is not None and deadline.budget_s == 5.0
+    parser.calls.clear()
+    post({"items": [{"prompt": "bike loop", "budget_ms": 500}, {"prompt": "bike loop"}]})
+    assert parser.calls == [("bike loop", None)]
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the Commute fast path, against a stubbed Directions client
+"""
+
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from commute_agent import CommuteAgent
+from deadline import Deadline
+from models import LocationHint, RouteIntent
+
+def _route(end, seconds, traffic=None, legs=1):
+    leg = {"start_location": {"lat": 37.80, "lng": -122.27}, "end_location": end,
+           "duration": {"value": seconds}}
+    if traffic is not None:
+        leg["duration_in_traffic"] = {"value": traffic}
+    return {"legs": [dict(leg) for _ in range(legs)]}
+
+class _Directions:
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    def directions(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.routes
+
+def _agent(routes):
+    agent = CommuteAgent(api_key="AIzaLocalTestKey")
+    agent.client = _Directions(routes)
+    return agent
+
+def test_one_directions_call_picks_the_fastest_alternative_in_traffic():
+    agent = _agent([
+        _route({"lat": 37.79, "lng": -122.40}, 900, traffic=1500),
+        _route({"lat": 37.78, "lng": -122.41}, 1000, traffic=1100),
+    ])
+    intent = RouteIntent(intent_type="Commute", origin="Oakland, CA", destination="Downtown SF",
+                         travel_modes=["driving"])
+    result = agent.get_commute_route(intent)
+    assert len(agent.client.calls) == 1
+    call = agent.client.calls[0]
+    assert call["alternatives"] is True and call["departure_time"] == "now"
+    assert result.waypoints.to_json() == [
+        {"name": "Oakland, CA", "lat": 37.80, "lng": -122.27},
+        {"name": "Downtown SF", "lat": 37.78, "lng": -122.41},
+    ]
+
+def test_stops_disable_alternatives_and_tight_budgets_take_the_first():
+    stop = {"name": "Coffee", "gsr": [{"name": "Blue Bottle", "latitude": 37.81, "longitude": -122.26}]}
+    agent = _agent([_route({"lat": 37.81, "lng": -122.26}, 300, legs=2)])
+    intent = RouteIntent(intent_type="Commute", origin="Oakland, CA", destination="Downtown SF",
+                         travel_modes=["walking"], stops=[stop])
+    result = agent.get_commute_route(intent)
+    call = agent.client.calls[0]
+    assert call["alternatives"] is False and call["waypoints"] == [(37.81, -122.26)]
+    assert "departure_time" not in call  # walking has no traffic
+    assert [w["name"] for w in result.waypoints] == ["Oakland, CA", "Blue Bottle", "Downtown SF"]
+
+    spent = Deadline(1000)
+    spent.started -= 10
+    agent.get_commute_route(intent.model_copy(update={"stops": None}), deadline=spent)
+    assert agent.client.calls[-1]["alternatives"] is False
+
+def test_departure_time_parsing():
+    tomorrow = datetime.now(timezone.utc) + timedelta(days=1)
+    naive = tomorrow.replace(tzinfo=None, microsecond=0).isoformat()
+    la = CommuteAgent._departure_time(naive, "America/Los_Angeles")
+    assert la == tomorrow.replace(tzinfo=None, microsecond=0).replace(tzinfo=ZoneInfo("America/Los_Angeles"))
+    # Without a known zone a wall-clock time can't be placed
+    assert CommuteAgent._departure_time(naive) == "now"
+    assert CommuteAgent._departure_time(naive, "Not/AZone") == "now"
+    aware = tomorrow.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    assert CommuteAgent._departure_time(aware) == tomorrow.replace(microsecond=0)
+    assert CommuteAgent._departure_time("2001-01-01T08:00:00Z") == "now"
+    assert CommuteAgent._departure_time("tomorrow morning", "America/Los_Angeles") == "now"
+
+def test_location_hint_zone_reaches_directions():
+    agent = _agent([_route({"lat": 37.78, "lng": -122.41}, 600)])
+    later = (datetime.now(timezone.utc) + timedelta(days=2)).replace(tzinfo=None, microsecond=0)
+    intent = RouteIntent(intent_type="Commute", origin="Oakland, CA", destination="Downtown SF",
+                         travel_modes=["transit"], departure_time=later.isoformat(),
+                         location_hint=LocationHint(country="US", timezone="America/New_York"))
+    agent.get_commute_route(intent)
+    assert agent.client.calls[0]["departure_time"] == later.replace(tzinfo=ZoneInfo("America/New_York"))
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Tests for corridor-coverage Places sampling
+"""
+
+from corridor import CorridorCoverage, corridor_centres, corridor_length_km
+
+# ~9.6 km straight line east, with a vertex every ~10 m
+LINE = [(37.0, -122.0 + i * 0.0001125) for i in range(961)]
+
+def test_centres_cover_corridor_with_few_calls():
+    centres, radius = corridor_centres(LINE, radius_m=500, half_width_m=250)
+    # 2·sqrt(500² − 250²) ≈ 866 m of corridor per circle
+    assert len(centres) == 12 and radius == 500
+    assert abs(corridor_length_km(LINE) - 9.6) < 0.1
+
+def test_max_centres_grows_radius():
+    centres, radius = corridor_centres(LINE, radius_m=500, half_width_m=250, max_centres=3)
+    assert len(centres) == 3
+    # Each circle must span a third of the line plus the half-width
+    assert radius >= ((9600 / 3 / 2) ** 2 + 250 ** 2) ** 0.5 - 50
+
+def test_covered_circle_answers_from_earlier_results():
+    coverage = CorridorCoverage()
+    place = {"place_id": "p1", "geometry": {"location": {"lat": 37.0, "lng": -122.0}}}
+    coverage.add((37.0, -122.0), 2000, [place])
+    assert coverage.covers((37.0, -122.001), 500)
+    assert coverage.results_within((37.0, -122.001), 500) == [place]
+    assert not coverage.covers((37.0, -121.95), 500)
+
+def test_full_page_of_results_does_not_cover():
+    coverage = CorridorCoverage()
+    page = [{"place_id": f"p{i}", "geometry": {"location": {"lat": 37.0, "lng": -122.0}}} for i in range(20)]
+    coverage.add((37.0, -122.0), 2000, page)
+    # Places stopped at 20, so a smaller circle inside may hold places not listed
+    assert not coverage.covers((37.0, -122.001), 500)
+    coverage.add((37.0, -122.0), 2000, page[:19])
+    assert coverage.covers((37.0, -122.001), 500)
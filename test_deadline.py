@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for request latency budgets: degradation order and the 504 response path
+"""
+
+import pytest
+import main
+from deadline import DEGRADATION_STEPS, MIN_CALL_TIMEOUT_S, Deadline, DeadlineExceeded, should_degrade
+from models import RouteIntent
+
+def _at_fraction(deadline, fraction):
+    """Move the deadline's start back so `fraction` of the budget remains."""
+    deadline.started -= deadline.remaining() - fraction * deadline.budget_s
+
+def test_degradations_apply_in_threshold_order():
+    thresholds = [t for _, t in DEGRADATION_STEPS]
+    assert thresholds == sorted(thresholds, reverse=True)
+    deadline = Deadline(10000)
+    steps = [step for step, _ in DEGRADATION_STEPS]
+    assert not any(deadline.should_degrade(s) for s in steps)
+    for (step, threshold), nxt in zip(DEGRADATION_STEPS, steps[1:] + [None]):
+        _at_fraction(deadline, threshold - 0.01)
+        assert deadline.should_degrade(step)
+        if nxt is not None:
+            assert not deadline.should_degrade(nxt)
+    # Each step is recorded once, in the order it kicked in
+    assert deadline.should_degrade(steps[0])
+    assert deadline.degradations == steps
+    assert not should_degrade(None, steps[-1])
+
+def test_expired_budget_stops_required_calls():
+    deadline = Deadline(1000)
+    assert deadline.timeout(cap=0.2) == pytest.approx(0.2, abs=0.01)
+    _at_fraction(deadline, 0)
+    assert deadline.timeout() == MIN_CALL_TIMEOUT_S
+    with pytest.raises(DeadlineExceeded, match="before directions"):
+        deadline.check("directions")
+
+class _Parser:
+    def parse_prompt(self, prompt, ipv6, deadline=None):
+        return RouteIntent(intent_type="Scenic", origin="Berkeley", destination="Oakland")
+
+    def location_key(self, ipv6):
+        return ""
+
+@pytest.fixture
+def route(monkeypatch):
+    monkeypatch.setattr(main, "get_parser", lambda: _Parser())
+    monkeypatch.delenv("ROUTE_BUDGET_MS", raising=False)
+    monkeypatch.delenv("ROUTE_CACHE_ENABLED", raising=False)
+    client = main.app.test_client()
+
+    def post(plan_modes, **body):
+        monkeypatch.setattr(main, "plan_modes", plan_modes)
+        return client.post("/api/route", json={"prompt": "scenic", **body})
+    return post
+
+def test_tight_budget_degrades_and_reports_it(route):
+    def plan_modes(intent, deadline=None, session_id=None):
+        _at_fraction(deadline, 0.3)
+        deadline.should_degrade("fewer_places_samples")
+        deadline.should_degrade("skip_elevation")
+        return {"waypoints": {"waypoints": []}}
+    for _ in range(2):
+        response = route(plan_modes, prompt="degraded scenic", budget_ms=2000)
+        assert response.status_code == 200
+        assert response.get_json()["degradations"] == ["fewer_places_samples", "skip_elevation"]
+        # Degraded answers are never stored in the response cache
+        assert response.headers["X-Route-Cache"] == "MISS"
+
+def test_exhausted_budget_answers_504_with_degradations(route):
+    def plan_modes(intent, deadline=None, session_id=None):
+        _at_fraction(deadline, 0.2)
+        deadline.should_degrade("first_alternative")
+        _at_fraction(deadline, 0)
+        deadline.check("directions")
+    response = route(plan_modes, budget_ms=500, cache=False)
+    assert response.status_code == 504
+    body = response.get_json()
+    assert "before directions" in body["error"] and body["degradations"] == ["first_alternative"]
+
+def test_invalid_budget_is_rejected(route):
+    assert route(lambda *a, **k: {}, budget_ms=-1).status_code == 400
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Tests for the compact (columnar, polyline-encoded) response form
+"""
+
+from encoding import compact, expand
+
+BODY = {
+    "intent": {"intent_type": "Scenic", "origin": "UC Berkeley", "stops": []},
+    "waypoints": {"waypoints": [
+        {"name": "UC Berkeley", "lat": 37.8712141, "lng": -122.255463},
+        {"name": "Garber Park", "lat": 37.8621779, "lng": -122.2363179, "rating": 4.6},
+        {"name": "Castro Valley", "lat": 37.6955029, "lng": -122.0738678},
+    ]},
+    "degradations": [],
+}
+
+def test_compact_is_columnar_and_round_trips():
+    packed = compact(BODY)
+    columns = packed["waypoints"]["waypoints"]
+    assert columns["names"] == ["UC Berkeley", "Garber Park", "Castro Valley"]
+    assert columns["extra"] == [None, {"rating": 4.6}, None]
+    assert packed["intent"] == BODY["intent"]
+
+    restored = expand(packed)
+    for original, decoded in zip(BODY["waypoints"]["waypoints"], restored["waypoints"]["waypoints"]):
+        assert abs(original["lat"] - decoded["lat"]) < 1e-6 and abs(original["lng"] - decoded["lng"]) < 1e-6
+        assert original.get("rating") == decoded.get("rating")
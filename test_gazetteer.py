@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Tests for the local gazetteer (exact, fuzzy and learned resolution)
+"""
+
+from gazetteer import Gazetteer
+
+PLACES = [
+    {"name": "UC Berkeley", "aliases": ["University of California, Berkeley"], "lat": 37.8712, "lng": -122.2555},
+    {"name": "Castro Valley", "lat": 37.6955, "lng": -122.0739},
+    {"name": "123 Main St", "lat": 37.0, "lng": -122.0},
+]
+
+def _location(result):
+    return result["geometry"]["location"]
+
+def test_exact_and_alias_lookup():
+    g = Gazetteer(PLACES)
+    assert _location(g.resolve("uc  berkeley!"))["lat"] == 37.8712
+    assert _location(g.resolve("University of California Berkeley"))["lng"] == -122.2555
+
+def test_fuzzy_lookup_tolerates_typos_but_not_numbers():
+    g = Gazetteer(PLACES)
+    assert _location(g.resolve("Castro Vally"))["lat"] == 37.6955
+    assert g.resolve("124 Main St") is None
+    assert g.resolve("Sacramento") is None
+
+def test_learns_unambiguous_geocodes(tmp_path):
+    path = tmp_path / "learned.jsonl"
+    g = Gazetteer(PLACES, learned_path=str(path))
+    result = {"formatted_address": "Lake Merritt, Oakland, CA",
+              "geometry": {"location": {"lat": 37.8024, "lng": -122.2588}}}
+    g.learn("Lake Merritt", [result, result])  # ambiguous
+    g.learn("Ferry Building", [{**result, "partial_match": True}])
+    assert g.resolve("Lake Merritt") is None and g.resolve("Ferry Building") is None
+
+    g.learn("Lake Merritt", [result])
+    assert _location(g.resolve("lake merritt"))["lat"] == 37.8024
+    # Persisted for the next process
+    assert _location(Gazetteer(PLACES, learned_path=str(path)).resolve("Lake Merritt"))["lat"] == 37.8024
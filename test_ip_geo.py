@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the IP-prefix geolocation trie
+"""
+
+import os
+import random
+import tempfile
+import ipaddress
+import ip_geo
+from ip_geo import IPGeoDB, IPGeoTable, build
+
+HEADER = "prefix,country,region,city,latitude,longitude,accuracy_km\n"
+
+def _random_rows(rng, count):
+    rows = []
+    for i in range(count):
+        if rng.random() < 0.5:
+            net = ipaddress.ip_network((rng.getrandbits(32), rng.randint(8, 28)), strict=False)
+        else:
+            net = ipaddress.ip_network((rng.getrandbits(128), rng.randint(16, 64)), strict=False)
+        rows.append({"prefix": str(net), "country": "US", "city": f"City {i}",
+                     "latitude": "37.0", "longitude": "-122.0", "accuracy_km": "3"})
+    # Nested prefixes so longest-match actually matters
+    for row in list(rows[:20]):
+        net = ipaddress.ip_network(row["prefix"])
+        if net.prefixlen + 4 <= net.max_prefixlen:
+            sub = next(net.subnets(prefixlen_diff=4))
+            rows.append({**row, "prefix": str(sub), "city": row["city"] + " (sub)"})
+    return rows
+
+def _brute_force(rows, address):
+    ip = ipaddress.ip_address(address)
+    best = None
+    for row in rows:
+        net = ipaddress.ip_network(row["prefix"])
+        if net.version == ip.version and ip in net and (best is None or net.prefixlen > best[0]):
+            best = (net.prefixlen, row["city"])
+    return best[1] if best else None
+
+def test_longest_prefix_matches_brute_force(tmp_path):
+    rng = random.Random(7)
+    rows = _random_rows(rng, 200)
+    path = tmp_path / "prefixes.bin"
+    path.write_bytes(build(rows))
+    table = IPGeoTable(str(path))
+
+    probes = []
+    for row in rows:
+        net = ipaddress.ip_network(row["prefix"])
+        probes.append(str(net.network_address + rng.randrange(net.num_addresses)))
+    probes += [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(100)]
+    probes += [str(ipaddress.IPv6Address(rng.getrandbits(128))) for _ in range(100)]
+    for address in probes:
+        found = table.lookup(address)
+        assert (found["city"] if found else None) == _brute_force(rows, address), address
+
+def test_hot_reload_picks_up_csv_changes(tmp_path):
+    csv_path = tmp_path / "prefixes.csv"
+    csv_path.write_text(HEADER + "2607:f140::/32,US,California,Berkeley,37.87,-122.27,3\n")
+    db = IPGeoDB(str(csv_path), check_s=0)
+    assert db.lookup("2607:f140::1")["city"] == "Berkeley"
+    assert db.lookup("128.32.0.1") is None
+
+    csv_path.write_text(HEADER + "128.32.0.0/16,US,California,Berkeley,37.87,-122.27,3\n")
+    stamp = os.path.getmtime(csv_path) + 5
+    os.utime(csv_path, (stamp, stamp))
+    assert db.lookup("128.32.0.1")["city"] == "Berkeley"
+    assert db.lookup("2607:f140::1") is None
+    assert db.reloads == 2
+
+def test_read_only_csv_directory_compiles_to_temp(tmp_path, monkeypatch):
+    csv_path = tmp_path / "prefixes.csv"
+    csv_path.write_text(HEADER + "2607:f140::/32,US,California,Berkeley,37.87,-122.27,3\n")
+    monkeypatch.setattr(ip_geo.os, "access", lambda path, mode: False)
+    db = IPGeoDB(str(csv_path), check_s=0)
+    assert os.path.dirname(db.bin_path) == tempfile.gettempdir()
+    assert db.lookup("2607:f140::1")["city"] == "Berkeley"
+    assert not (tmp_path / "prefixes.bin").exists()
+    os.remove(db.bin_path)
+
+def test_unreadable_table_is_not_retried_until_it_changes(tmp_path, monkeypatch):
+    bin_path = tmp_path / "broken.bin"
+    bin_path.write_bytes(b"garbage")
+    monkeypatch.setattr(ip_geo, "_db", None)
+    monkeypatch.setattr(ip_geo, "_failed", None)
+    monkeypatch.setenv("IP_GEO_DB", str(bin_path))
+    loads = []
+    real = ip_geo.IPGeoDB
+    monkeypatch.setattr(ip_geo, "IPGeoDB", lambda *a, **kw: loads.append(a) or real(*a, **kw))
+    assert ip_geo.get_ip_geo() is None and ip_geo.get_ip_geo() is None
+    assert len(loads) == 1
+    csv_path = tmp_path / "prefixes.csv"
+    csv_path.write_text(HEADER + "2607:f140::/32,US,California,Berkeley,37.87,-122.27,3\n")
+    ip_geo.build_file(str(csv_path), str(bin_path))
+    os.utime(bin_path, (0, 12345))
+    assert ip_geo.get_ip_geo().lookup("2607:f140::1")["city"] == "Berkeley"
+    assert len(loads) == 2
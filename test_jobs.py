@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the async route job queue and the /api/jobs poll endpoint
+"""
+
+import time
+import threading
+import pytest
+from jobs import JobQueue, JobQueueFull
+
+def _blocked(release, body=None, status=200):
+    def work():
+        release.wait(5)
+        return (body or {"ok": True}), status
+    return work
+
+def test_jobs_queue_behind_busy_workers_and_finish():
+    release = threading.Event()
+    queue = JobQueue(workers=1, max_pending=4)
+    first, second = queue.submit(_blocked(release)), queue.submit(_blocked(release))
+    time.sleep(0.05)
+    assert (first.status, second.status) == ("running", "queued")
+    assert queue.stats() == {"queued": 1, "running": 1, "done": 0, "failed": 0}
+    release.set()
+    assert queue.get(second.id, wait_s=2).to_dict() == {"job_id": second.id, "status": "done", "result": {"ok": True}}
+
+def test_max_pending_rejects_new_jobs():
+    release = threading.Event()
+    queue = JobQueue(workers=1, max_pending=2)
+    queue.submit(_blocked(release))
+    queue.submit(_blocked(release))
+    with pytest.raises(JobQueueFull):
+        queue.submit(_blocked(release))
+    release.set()
+
+def test_long_poll_returns_when_the_job_finishes():
+    release = threading.Event()
+    queue = JobQueue(workers=1)
+    job = queue.submit(_blocked(release))
+    threading.Timer(0.1, release.set).start()
+    started = time.monotonic()
+    assert queue.get(job.id, wait_s=5).status == "done"
+    assert 0.05 < time.monotonic() - started < 2
+    # Without a result in time, the wait gives up and the job is still pending
+    held = threading.Event()
+    slow = queue.submit(_blocked(held))
+    assert queue.get(slow.id, wait_s=0.05).status in ("queued", "running")
+    held.set()
+
+def test_finished_jobs_expire_after_ttl():
+    queue = JobQueue(workers=1, ttl_s=0.05)
+    job = queue.submit(lambda: ({"ok": True}, 200))
+    assert queue.get(job.id, wait_s=1).status == "done"
+    time.sleep(0.1)
+    assert queue.get(job.id) is None
+
+def test_poll_returns_the_finished_jobs_http_status(monkeypatch):
+    import main
+    queue = JobQueue(workers=1)
+    monkeypatch.setattr(main, "get_job_queue", lambda: queue)
+    job = queue.submit(lambda: ({"error": "Route planning ran out of time"}, 504))
+    response = main.app.test_client().get(f"/api/jobs/{job.id}?wait=2")
+    assert response.status_code == 504
+    assert response.get_json()["status"] == "failed"
+    assert main.app.test_client().get("/api/jobs/missing").status_code == 404
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Tests for the tolerant LLM JSON extractor and token accounting
+"""
+
+import pytest
+from json_extract import JSONExtractError, extract_json
+from local_nvidia import LocalNVIDIA
+from nvidia_agent import NVIDIAAgent, get_token_usage
+
+def test_repairs_common_model_mistakes():
+    fenced = 'Sure!\n```json\n{"intent_type": "Scenic", "avoid": ["tolls",],}\n```'
+    assert extract_json(fenced, dict) == {"intent_type": "Scenic", "avoid": ["tolls"]}
+    assert extract_json("{'name': 'Peet\\'s', open: True, 'note': None}") == \
+        {"name": "Peet's", "open": True, "note": None}
+    # Cut off by max_tokens mid-string
+    assert extract_json('[{"name": "Tilden", "lat": 37.88}, {"name": "Lake Mer', list) == \
+        [{"name": "Tilden", "lat": 37.88}, {"name": "Lake Mer"}]
+
+def test_skips_prose_brackets_and_rejects_garbage():
+    text = 'Here are [2] stops: [{"name": "A", "lat": 1.5, "lng": 2}]'
+    assert extract_json(text, list, accept=lambda v: all(isinstance(w, dict) for w in v)) == \
+        [{"name": "A", "lat": 1.5, "lng": 2}]
+    with pytest.raises(JSONExtractError):
+        extract_json("I can't help with that.", dict)
+
+def test_token_usage_is_reported_per_task():
+    get_token_usage().reset()
+    with LocalNVIDIA() as server:
+        agent = NVIDIAAgent(base_url=server.base_url, mock_mode=False, guided_json="nvext")
+        intent = agent.parse_intent("Scenic route from UC Berkeley to Castro Valley", "::1")
+        agent.plan_route(intent)
+        calls = server.snapshot()
+    stats = get_token_usage().stats()
+    assert calls["guided"] == 2
+    assert stats["intent"]["prompt_tokens"] + stats["waypoints"]["prompt_tokens"] == calls["prompt_tokens"]
+    assert stats["intent"]["estimated"] == 0 and stats["intent"]["max_tokens"] == 320
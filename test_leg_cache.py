@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for per-session leg caches: reuse across refinements and session eviction
+"""
+
+from leg_cache import LegCache, LegResult, SessionLegCaches, leg_key
+from local_upstreams import LocalUpstreams
+from models import RouteIntent
+from waypoints import WaypointList
+
+def _stop(name, lat, lng):
+    return {"name": name, "gsr": [{"name": name, "latitude": lat, "longitude": lng}]}
+
+def test_refinement_only_recomputes_changed_legs(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_CACHE", "off")
+    monkeypatch.delenv("SCENIC_RASTER_PATH", raising=False)
+    caches = SessionLegCaches()
+    with LocalUpstreams() as upstreams:
+        monkeypatch.setenv("GOOGLE_MAPS_BASE_URL", upstreams.base_url)
+        from scenic_agent import ScenicAgent
+
+        def plan(destination, session_id):
+            intent = RouteIntent(intent_type="Scenic", origin="UC Berkeley", destination=destination,
+                                 travel_modes=["walking"], stops=[_stop("Rose Garden", 37.8855, -122.2620)])
+            before = upstreams.snapshot().get("directions", 0)
+            result = ScenicAgent(api_key="AIzaLocalTestKey").get_scenic_route(intent, leg_cache=caches.for_session(session_id))
+            return result, upstreams.snapshot().get("directions", 0) - before
+
+        first, calls = plan("Lake Merritt", "chat-1")
+        assert calls == 2
+        # Same origin and stop, new destination: only the last leg is recomputed
+        refined, calls = plan("Piedmont Park", "chat-1")
+        assert calls == 1
+        assert refined.waypoints.to_json()[:3] == first.waypoints.to_json()[:3]
+        # Another conversation doesn't see chat-1's legs
+        _, calls = plan("Lake Merritt", "chat-2")
+        assert calls == 2
+    stats = caches.stats()
+    assert stats["sessions"] == 2 and stats["session_hits"] == 1
+
+def test_sessions_are_evicted_by_count_and_age(monkeypatch):
+    caches = SessionLegCaches(max_sessions=2, session_ttl_s=60)
+    key = leg_key({"lat": 37.0, "lng": -122.0}, {"lat": 37.1, "lng": -122.1}, "walking", False)
+    caches.for_session("a").put(key, LegResult([(37.0, -122.0)], WaypointList()))
+    assert caches.for_session("a").get(key) is not None
+    caches.for_session("b")
+    caches.for_session("c")  # a is the least recently used session
+    assert caches.for_session("a").get(key) is None
+
+    caches.for_session("c").put(key, LegResult([(37.0, -122.0)], WaypointList()))
+    stamp, cache = caches._sessions["c"]
+    caches._sessions["c"] = (stamp - 61, cache)
+    assert caches.for_session("c").get(key) is None
+    assert caches.for_session(None) is caches.shared
+
+def test_leg_keys_quantize_endpoints_and_entries_expire():
+    a = leg_key({"lat": 37.87161, "lng": -122.27271}, {"lat": 37.8, "lng": -122.2}, "walking", False)
+    b = leg_key({"lat": 37.87159, "lng": -122.27269}, {"lat": 37.8, "lng": -122.2}, "walking", False)
+    assert a == b != leg_key({"lat": 37.87161, "lng": -122.27271}, {"lat": 37.8, "lng": -122.2}, "walking", True)
+    cache = LegCache(max_entries=1, ttl_s=60)
+    cache.put(a, LegResult([], WaypointList()))
+    cache.put(("other",), LegResult([], WaypointList()))
+    assert cache.get(a) is None and cache.get(("other",)) is not None
+    stored, result = cache._entries[("other",)]
+    cache._entries[("other",)] = (stored - 61, result)
+    assert cache.get(("other",)) is None
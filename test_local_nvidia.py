@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Tests for the local NVIDIA chat completions stand-in and the HTTP client path
+"""
+
+from local_nvidia import LocalNVIDIA
+from nvidia_agent import NVIDIAAgent
+
+PROMPT = "Give me a scenic route from UC Berkeley to Castro Valley"
+IPV6 = "2607:f140:6000:800e:384d:a5ee:7eb4:fa5e"
+
+def test_http_path_matches_mock_mode():
+    with LocalNVIDIA() as server:
+        agent = NVIDIAAgent(base_url=server.base_url, mock_mode=False)
+        expected = NVIDIAAgent(mock_mode=True).parse_intent(PROMPT, IPV6)
+        assert agent.parse_intent(PROMPT, IPV6) == expected
+        streaming = NVIDIAAgent(base_url=server.base_url, mock_mode=False, stream=True)
+        assert streaming.parse_intent(PROMPT, IPV6) == expected
+        assert server.snapshot()["streamed"] == 1
+
+def test_injected_errors_are_retried():
+    with LocalNVIDIA(error_rate=0.5, seed=3) as server:
+        agent = NVIDIAAgent(base_url=server.base_url, mock_mode=False, max_retries=6)
+        for _ in range(5):
+            assert agent.parse_intent(PROMPT, IPV6)["intent_type"] == "Scenic"
+        calls = server.snapshot()
+        assert calls["errors"] > 0 and calls["requests"] == 5 + calls["errors"]
+
+def test_mock_mode_is_on_unless_disabled(monkeypatch):
+    monkeypatch.delenv("NVIDIA_MOCK_MODE", raising=False)
+    assert NVIDIAAgent(api_key="nvapi-test").mock_mode is True
+    monkeypatch.setenv("NVIDIA_MOCK_MODE", "0")
+    assert NVIDIAAgent(api_key="nvapi-test").mock_mode is False
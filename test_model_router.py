@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for latency-aware model tiering
+"""
+
+from local_nvidia import LocalNVIDIA
+from model_router import ModelRouter
+from nvidia_agent import NVIDIAAgent
+
+TIERS = [
+    {"model": "small", "max_prompt_tokens": 200, "max_stops": 1, "max_latency_ms": 500},
+    {"model": "large"},
+]
+
+def test_tier_follows_prompt_complexity():
+    router = ModelRouter(TIERS)
+    assert router.choose("intent", prompt_tokens=120) == "small"
+    assert router.choose("intent", prompt_tokens=800) == "large"
+    assert router.choose("waypoints", prompt_tokens=120, stops=4) == "large"
+    assert router.stats()["models"]["small"]["routed"] == {"intent": 1}
+
+def test_traffic_shifts_away_from_failing_and_slow_models():
+    router = ModelRouter(TIERS, min_samples=3)
+    for _ in range(3):
+        router.record("small", 0.1, ok=False)
+    assert router.choose("intent", prompt_tokens=50) == "large"
+    # Once the large tier fails too, the lighter one is tried again
+    for _ in range(3):
+        router.record("large", 0.1, ok=False)
+    assert router.choose("intent", prompt_tokens=50) == "small"
+
+    slow = ModelRouter(TIERS, min_samples=3)
+    slow.record("small", 0.9, ok=True)
+    # One slow call is not enough to move traffic
+    assert slow.choose("intent", prompt_tokens=50) == "small"
+    for _ in range(2):
+        slow.record("small", 0.9, ok=True)
+    assert slow.choose("intent", prompt_tokens=50) == "large"
+    assert slow.stats()["models"]["small"]["healthy"] is False
+
+def test_agent_reports_latency_per_model(monkeypatch):
+    import model_router
+    monkeypatch.setattr(model_router, "_router", ModelRouter(TIERS))
+    with LocalNVIDIA(latency_ms=5) as server:
+        agent = NVIDIAAgent(base_url=server.base_url, mock_mode=False)
+        agent.parse_intent("Scenic route from UC Berkeley to Castro Valley", "::1")
+    models = model_router.get_model_router().stats()["models"]
+    assert models["small"]["calls"] == 1 and models["small"]["p50_ms"] >= 5
+    assert models["large"]["calls"] == 0
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the navigation route index (snapping, remaining distance/ETA) and
+sessions (re-routing, passed stops, endpoints)
+"""
+
+import polyline
+import pytest
+import navigation
+from navigation import NavigationSession, NavigationSessions, RouteIndex, haversine_m
+
+# Straight east-west line of 11 points ~100 m apart, 10 s per segment
+POINTS = [(37.0, -122.0 + i * 0.0011) for i in range(11)]
+TIMES = [i * 10.0 for i in range(11)]
+
+def test_cumulative_arrays():
+    index = RouteIndex(POINTS, TIMES)
+    assert abs(index.total_distance_m - haversine_m(*POINTS[0], *POINTS[-1])) < 1
+    assert index.total_duration_s == 100.0
+
+def test_locate_on_and_off_route():
+    index = RouteIndex(POINTS, TIMES)
+    dist, seg, frac = index.locate(37.0, -122.0 + 4.5 * 0.0011)
+    assert dist < 1 and seg == 4 and abs(frac - 0.5) < 0.01
+
+    # ~111 m north of the route
+    dist, _, _ = index.locate(37.001, -122.0 + 5 * 0.0011)
+    assert 100 < dist < 120
+
+    # Far away: falls back to scanning every segment
+    dist, seg, _ = index.locate(38.0, -122.0)
+    assert dist > 100000 and seg == 0
+
+def test_remaining_eta_halfway():
+    index = RouteIndex(POINTS, TIMES)
+    dist, seg, frac = index.locate(37.0, -122.0 + 5 * 0.0011)
+    remaining_m, remaining_s = index.remaining(index.along_distance(seg, frac))
+    assert abs(remaining_m - index.total_distance_m / 2) < 2
+    assert abs(remaining_s - 50.0) < 0.5
+
+class _Directions:
+    """Stands in for the maps client: straight legs between the requested points."""
+    def __init__(self):
+        self.calls = []
+
+    def directions(self, origin, destination, mode, waypoints=None):
+        self.calls.append({"origin": origin, "destination": destination, "waypoints": waypoints})
+        stops = [origin] + list(waypoints or []) + [destination]
+        steps = []
+        for a, b in zip(stops, stops[1:]):
+            pts = [(a[0] + (b[0] - a[0]) * k / 10, a[1] + (b[1] - a[1]) * k / 10) for k in range(11)]
+            steps.append({"polyline": {"points": polyline.encode(pts)}, "duration": {"value": 60}})
+        return [{"legs": [{"steps": steps}]}]
+
+# Origin, one stop and the destination on the POINTS line, ~880 m apart
+WAYPOINTS = [{"lat": 37.0, "lng": -122.0}, {"lat": 37.0, "lng": -121.99}, {"lat": 37.0, "lng": -121.98}]
+
+@pytest.fixture
+def maps(monkeypatch):
+    stub = _Directions()
+    monkeypatch.setattr(navigation, "create_maps_client", lambda api_key: stub)
+    return stub
+
+def test_on_route_updates_make_no_upstream_calls(maps):
+    session = NavigationSession(WAYPOINTS)
+    for i in range(10):
+        status = session.update(37.0, -122.0 + i * 0.002)
+        assert status["on_route"] and not status["rerouted"]
+    assert status["remaining_distance_m"] < session.index.total_distance_m / 2
+    assert session.upstream_calls == 1 and len(maps.calls) == 1
+
+def test_reroute_needs_consecutive_off_route_updates(maps):
+    session = NavigationSession(WAYPOINTS, threshold_m=50, off_route_updates=2)
+    # ~110 m north of the route, but back on it in between
+    assert not session.update(37.001, -121.999)["rerouted"]
+    assert session.update(37.0, -121.998)["on_route"]
+    assert not session.update(37.001, -121.997)["rerouted"]
+    assert session.upstream_calls == 1
+
+    status = session.update(37.001, -121.996)
+    assert status["rerouted"] and status["reroutes"] == 1 and status["on_route"]
+    assert session.upstream_calls == 2
+    assert maps.calls[-1]["origin"] == (37.001, -121.996)
+    assert maps.calls[-1]["waypoints"] == [(37.0, -121.99)]
+
+def test_reroute_drops_passed_stops(maps):
+    session = NavigationSession(WAYPOINTS, off_route_updates=1)
+    session.update(37.0, -121.995)
+    session.update(37.0, -121.985)  # past the stop
+    assert [s["lng"] for s in session._stops_ahead()] == [-121.98]
+
+    session.update(37.001, -121.984)
+    assert maps.calls[-1]["waypoints"] is None
+    assert maps.calls[-1]["destination"] == (37.0, -121.98)
+
+def test_nav_session_endpoints(maps, monkeypatch):
+    import main
+    sessions = NavigationSessions()
+    monkeypatch.setattr(main, "get_nav_sessions", lambda: sessions)
+    client = main.app.test_client()
+
+    assert client.post("/api/nav/sessions", json={"waypoints": WAYPOINTS[:1]}).status_code == 400
+    assert client.post("/api/nav/sessions", json={"waypoints": WAYPOINTS, "mode": "teleport"}).status_code == 400
+    assert client.post("/api/nav/sessions", json={"waypoints": [{"lat": 37.0}, {"lng": -122.0}]}).status_code == 400
+
+    response = client.post("/api/nav/sessions", json={"waypoints": WAYPOINTS, "off_route_threshold_m": 30})
+    assert response.status_code == 201
+    session_id = response.get_json()["session_id"]
+    assert response.get_json()["off_route_threshold_m"] == 30
+
+    response = client.post(f"/api/nav/sessions/{session_id}/position", json={"lat": 37.0, "lng": -121.99})
+    assert response.status_code == 200 and response.get_json()["on_route"]
+    assert client.post(f"/api/nav/sessions/{session_id}/position", json={"lat": "north"}).status_code == 400
+    summary = client.get(f"/api/nav/sessions/{session_id}").get_json()
+    assert summary["updates"] == 1 and summary["upstream_calls"] == 1
+
+    assert client.delete(f"/api/nav/sessions/{session_id}").status_code == 200
+    assert client.get(f"/api/nav/sessions/{session_id}").status_code == 404
+    assert client.delete(f"/api/nav/sessions/{session_id}").status_code == 404
+    assert client.post(f"/api/nav/sessions/{session_id}/position", json={"lat": 37.0, "lng": -121.99}).status_code == 404
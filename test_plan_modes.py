@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for planning several travel modes concurrently (plan_modes)
+"""
+
+import time
+import threading
+import pytest
+import main
+import polyline_agent
+from commute_agent import CommuteRouteResponse
+from deadline import Deadline, DeadlineExceeded
+from models import RouteIntent
+from polyline_agent import RouteSummaryResponse
+from upstream import memoized
+from waypoints import WaypointList
+
+DURATIONS_S = {"driving": 900, "walking": 3600, "bicycling": 1200}
+
+class _Summaries:
+    def __init__(self, api_key=None):
+        pass
+
+    def get_route_summary(self, intent, waypoints, optimize=False, deadline=None):
+        mode = intent.travel_modes[0]
+        return RouteSummaryResponse(polyline="", total_distance_m=5000, total_duration_s=DURATIONS_S[mode])
+
+@pytest.fixture
+def agents(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_CACHE", "off")
+    monkeypatch.setattr(polyline_agent, "PolylineAgent", _Summaries)
+    state = {"geocodes": 0, "threads": set(), "fail": set()}
+    lock = threading.Lock()
+
+    def plan_route(intent, deadline=None, session_id=None):
+        mode = intent.travel_modes[0]
+        with lock:
+            state["threads"].add(threading.get_ident())
+        # Every mode geocodes the origin; the shared memo makes that one call
+        loc = memoized("geocode", (intent.origin,), {},
+                       lambda: state.__setitem__("geocodes", state["geocodes"] + 1) or {"lat": 37.87, "lng": -122.27})
+        time.sleep(0.2)
+        if mode in state["fail"]:
+            raise RuntimeError(f"No {mode} route")
+        if mode == "transit":
+            deadline.check("directions")
+        return CommuteRouteResponse(waypoints=WaypointList([{"name": mode, **loc}]))
+
+    monkeypatch.setattr(main, "plan_route", plan_route)
+    return state
+
+def _intent(*modes):
+    return RouteIntent(intent_type="Commute", origin="Berkeley", destination="Oakland", travel_modes=list(modes))
+
+def test_modes_run_concurrently_and_the_fastest_is_recommended(agents):
+    started = time.monotonic()
+    out = main.plan_modes(_intent("walking", "driving", "bicycling", "walking", "teleport"))
+    assert time.monotonic() - started < 0.5  # three 0.2 s modes in parallel
+    assert len(agents["threads"]) == 3 and agents["geocodes"] == 1
+    assert [m["mode"] for m in out["modes"]] == ["walking", "driving", "bicycling"]
+    assert out["recommended_mode"] == "driving"
+    assert out["waypoints"] == {"waypoints": [{"name": "driving", "lat": 37.87, "lng": -122.27}]}
+    assert out["modes"][0]["total_duration_s"] == 3600 and out["modes"][0]["error"] is None
+
+def test_a_failing_mode_is_reported_while_others_succeed(agents):
+    agents["fail"] = {"driving"}
+    out = main.plan_modes(_intent("walking", "driving", "bicycling"))
+    failed = out["modes"][1]
+    assert failed["mode"] == "driving" and failed["error"] == "No driving route"
+    assert failed["total_duration_s"] is None and failed["waypoints"] == []
+    assert out["recommended_mode"] == "bicycling"
+
+    agents["fail"] = {"walking", "driving"}
+    with pytest.raises(RuntimeError, match="No travel mode could be planned"):
+        main.plan_modes(_intent("walking", "driving"))
+
+def test_a_blown_budget_fails_the_whole_request(agents):
+    deadline = Deadline(100)
+    with pytest.raises(DeadlineExceeded):
+        main.plan_modes(_intent("walking", "transit"), deadline)
+
+def test_a_single_mode_skips_the_summaries(agents):
+    out = main.plan_modes(_intent("walking"))
+    assert out == {"waypoints": {"waypoints": [{"name": "walking", "lat": 37.87, "lng": -122.27}]}}
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Tests for traffic capture (call traces, rotation) and replayed upstreams
+"""
+
+import os
+from replay import RecordedUpstreams, load_capture
+from traffic_capture import TrafficCapture, per_process_path
+from upstream import CallMemo, memo_scope, memoized, trace_scope
+
+def test_trace_records_upstream_and_memoized_answers():
+    capture = TrafficCapture("unused.jsonl", sample_rate=1.0)
+    trace = capture.sample()
+    with trace_scope(trace), memo_scope(CallMemo()):
+        for _ in range(2):
+            memoized("elevation_along_path", ("path",), {}, lambda: [{"elevation": 12.0}])
+    assert [c["source"] for c in trace.calls] == ["upstream", "cached"]
+    assert trace.calls[0]["ms"] is not None and trace.calls[1]["response"] == [{"elevation": 12.0}]
+
+def test_capture_rotates_and_replays_recorded_answers(tmp_path):
+    path = str(tmp_path / "capture.jsonl")
+    capture = TrafficCapture(path, sample_rate=1.0, max_bytes=300, backups=2)
+    for i in range(4):
+        trace = capture.sample()
+        with trace_scope(trace):
+            memoized("elevation_along_path", (f"path{i}",), {}, lambda: [{"elevation": float(i)}])
+        capture.write({"prompt": f"p{i}"}, 200, 5.0, "BYPASS", trace, 1000.0 + i)
+
+    records = load_capture(path)
+    assert (tmp_path / "capture.jsonl.1").exists()
+    # Oldest rotated file first, newest last
+    assert [r["request"]["prompt"] for r in records] == sorted(r["request"]["prompt"] for r in records)
+
+    recorded = RecordedUpstreams(records, latency_scale=0)
+    call = records[-1]["upstream"][0]
+    assert recorded(call["api"], call["key"], lambda: "live") == call["response"]
+    assert recorded("geocode", "never seen", lambda: "live") == "live"
+    assert recorded.unrecorded == {"geocode": 1}
+
+def test_capture_stores_only_the_client_network(tmp_path):
+    path = str(tmp_path / "capture.{pid}.jsonl")
+    capture = TrafficCapture(path, sample_rate=1.0)
+    assert str(os.getpid()) in capture.path
+    for ip in ("2607:f140:6000:800e::1", "128.32.17.9", "not an address"):
+        capture.write({"prompt": "p", "ipv6": ip}, 200, 1.0, "MISS", capture.sample(), 1000.0)
+    records = load_capture(path)
+    assert [r["request"]["ipv6"] for r in records] == ["2607:f140:6000::", "128.32.17.0", None]
+    assert per_process_path(str(tmp_path / "capture.jsonl")) == str(tmp_path / "capture.{pid}.jsonl")
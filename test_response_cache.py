@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Tests for the whole-response cache: expiry, byte-bounded eviction and X-Route-Cache
+"""
+
+import threading
+import main
+from models import RouteIntent
+from response_cache import ResponseCache
+
+def _age(cache, key, seconds):
+    cache._entries[key].stored -= seconds
+
+def test_fresh_then_stale_then_expired():
+    cache = ResponseCache(ttl_s=10, stale_s=20)
+    key = cache.key("  Scenic   walk!", "US|CA", None)
+    assert key == cache.key("scenic walk", "US|CA", "")
+    cache.put(key, {"route": 1})
+    assert cache.get(key) == ({"route": 1}, "HIT")
+    _age(cache, key, 15)
+    assert cache.get(key) == ({"route": 1}, "STALE")
+    _age(cache, key, 20)
+    assert cache.get(key) == (None, "MISS")
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+def test_byte_bound_evicts_least_recently_used():
+    body = {"route": "x" * 80}
+    size = len('{"route":"' + "x" * 80 + '"}')
+    cache = ResponseCache(max_bytes=3 * size)
+    for name in "abc":
+        cache.put((name,), body)
+    cache.get(("a",))  # a is now the most recently used
+    cache.put(("d",), body)
+    assert [k for k in ("a", "b", "c", "d") if cache.get((k,))[0]] == ["a", "c", "d"]
+    stats = cache.stats()
+    assert stats["bytes"] == 3 * size and stats["evicted"] == 1
+    cache.put(("huge",), {"route": "x" * (4 * size)})
+    assert cache.get(("huge",)) == (None, "MISS")
+
+def test_revalidate_runs_one_refresh_per_key():
+    cache = ResponseCache(ttl_s=0, stale_s=60)
+    cache.put(("k",), {"v": 1})
+    release, calls = threading.Event(), []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"v": 2}
+    cache.revalidate(("k",), compute)
+    cache.revalidate(("k",), compute)
+    release.set()
+    cache._refresher.shutdown(wait=True)
+    assert len(calls) == 1
+    assert cache._entries[("k",)].body == {"v": 2} and cache.stats()["refreshed"] == 1
+
+class _Parser:
+    def __init__(self):
+        self.parses = 0
+
+    def parse_prompt(self, prompt, ipv6, deadline=None):
+        self.parses += 1
+        return RouteIntent(intent_type="Commute", origin="Berkeley", destination="Oakland")
+
+    def location_key(self, ipv6):
+        return "US|California|Berkeley"
+
+def test_route_cache_header(monkeypatch):
+    cache, parser = ResponseCache(ttl_s=60, stale_s=60), _Parser()
+    monkeypatch.setattr(main, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(main, "get_parser", lambda: parser)
+    monkeypatch.setattr(main, "plan_modes", lambda intent, deadline=None, session_id=None: {"waypoints": {"waypoints": []}})
+    monkeypatch.delenv("ROUTE_BUDGET_MS", raising=False)
+    client = main.app.test_client()
+
+    def state(**kwargs):
+        response = client.post("/api/route", json={"prompt": "Commute to Oakland", **kwargs.pop("body", {})}, **kwargs)
+        assert response.status_code == 200
+        return response.headers["X-Route-Cache"]
+
+    assert [state(), state()] == ["MISS", "HIT"]
+    assert state(body={"cache": False}) == "BYPASS"
+    assert state(headers={"Cache-Control": "no-cache"}) == "BYPASS"
+    assert parser.parses == 3
+    _age(cache, next(iter(cache._entries)), 90)
+    assert state() == "STALE"
+    cache._refresher.shutdown(wait=True)
+    assert parser.parses == 4 and state() == "HIT"
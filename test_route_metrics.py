@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the route metrics engine and FitnessAgent's pre-estimates
+"""
+
+import pytest
+import route_metrics
+from route_metrics import haversine_m, measure, pre_estimate
+
+BERKELEY = (37.8716, -122.2727)
+
+def test_level_ground_matches_flat_met_and_hills_cost_more():
+    route = [BERKELEY, (37.8806, -122.2727)]  # ~1 km due north
+    flat = measure(route, "walking", duration_s=750, elevations=[50.0] * 5)
+    assert flat.met == pytest.approx(3.3)
+    assert flat.calories == pytest.approx(3.3 * 3.5 * 70 / 200 * 12.5)
+    assert flat.steps == int(flat.distance_m / route_metrics.STRIDE_M)
+    hilly = measure(route, "walking", duration_s=750, elevations=[50.0, 70.0, 60.0, 80.0, 80.0])
+    assert hilly.ascent_m == pytest.approx(40.0)
+    assert hilly.met > flat.met and hilly.calories > flat.calories
+    assert measure(route, "bicycling", duration_s=300).steps == 0
+
+def test_pre_estimate_uses_haversine_with_detour():
+    assert haversine_m(BERKELEY, (38.8716, -122.2727)) == pytest.approx(111_195, rel=1e-3)
+    loop = pre_estimate([BERKELEY, (37.8806, -122.2727)], "walking", loop=True)
+    assert loop.estimated
+    assert loop.distance_m == pytest.approx(2 * 1000.8 * route_metrics.DETOUR_FACTOR, rel=1e-2)
+    assert route_metrics.target_distance_m("walking", steps=10000) == pytest.approx(8000)
+
+def test_fitness_loop_picks_poi_by_pre_estimate(monkeypatch):
+    from local_upstreams import LocalUpstreams
+    from upstream import CallMemo, memo_scope
+    monkeypatch.setenv("UPSTREAM_CACHE", "off")
+    monkeypatch.setenv("NVIDIA_MOCK_MODE", "1")
+    with LocalUpstreams() as upstreams:
+        monkeypatch.setenv("GOOGLE_MAPS_BASE_URL", upstreams.base_url)
+        from fitness_agent import FitnessAgent
+        from models import RouteIntent
+        agent = FitnessAgent(maps_key="AIzaLocalTestKey", places_key="AIzaLocalTestKey")
+        intent = RouteIntent(intent_type="Health", origin="2601 Telegraph Ave", destination="2601 Telegraph Ave",
+                             travel_modes=["walking"], constraints=["10000 steps"])
+        with memo_scope(CallMemo()):
+            result = agent.get_fitness_route(intent)
+            start = agent._geocode("2601 Telegraph Ave")
+            candidates = agent.places.search("park|trail", location=(start["lat"], start["lng"]),
+                                             radius=8000, top_k=5)
+        calls = upstreams.snapshot()
+    # Every nearby candidate is far short of 8 km; the longest loop wins, with one Directions call
+    farthest = max(candidates, key=lambda p: haversine_m((start["lat"], start["lng"]), (p["latitude"], p["longitude"])))
+    assert result.waypoints[1]["name"] == farthest["name"]
+    assert calls["directions"] == 1 and calls["text_search"] == 1
+    assert result.steps > 0 and result.calories_burned > 0
+
+def test_numpy_and_pure_python_paths_agree(monkeypatch):
+    pytest.importorskip("numpy")
+    route = [BERKELEY, (37.8761, -122.2700), (37.8806, -122.2727), (37.8850, -122.2690)]
+    elevations = [50.0, 72.0, 61.0, 90.0, 88.0, 95.0]
+    vectorized = measure(route, "walking", duration_s=1200, elevations=elevations)
+    monkeypatch.setattr(route_metrics, "np", None)
+    pure = measure(route, "walking", duration_s=1200, elevations=elevations)
+    for name in ("distance_m", "duration_s", "ascent_m", "met", "steps", "calories"):
+        assert getattr(vectorized, name) == pytest.approx(getattr(pure, name))
+    assert route_metrics.cumulative_distance_m(route) == pytest.approx(
+        [0.0] + [sum(haversine_m(a, b) for a, b in zip(route[:i], route[1:i + 1])) for i in range(1, len(route))])
+
+def test_meets_ignores_missing_targets():
+    metrics = measure([BERKELEY, (37.8806, -122.2727)], "walking", duration_s=750)
+    assert metrics.meets() and metrics.meets(distance_m=900)
+    assert not metrics.meets(distance_m=900, calories=500)
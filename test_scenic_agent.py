@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Tests for how ScenicAgent ranks Directions alternatives, against stubbed upstreams
+"""
+
+import polyline
+from scenic_agent import ScenicAgent
+
+# Two ~2 km alternatives heading east: one through parks, one over hills
+PARKS = [(37.80, -122.27 + i * 0.00225) for i in range(11)]
+HILLS = [(37.90, -122.27 + i * 0.00225) for i in range(11)]
+
+class _Maps:
+    def __init__(self):
+        self.places_calls = 0
+
+    def directions(self, **kwargs):
+        return [{"overview_polyline": {"points": polyline.encode(pts)}} for pts in (HILLS, PARKS)]
+
+    def places_nearby(self, location, radius, keyword=None, deadline=None, priority=None):
+        self.places_calls += 1
+        lat, lng = location
+        count = 12 if lat < 37.85 else 1
+        return {"results": [
+            {"place_id": f"{lat:.4f},{lng:.4f}#{i}", "name": f"Park {i}", "types": ["park"],
+             "geometry": {"location": {"lat": lat, "lng": lng}}}
+            for i in range(count)
+        ]}
+
+    def elevation_along_path(self, path, samples, deadline=None, priority=None):
+        lat = path[0][0]
+        climb = 5.0 if lat < 37.85 else 20.0  # 45 m vs 180 m of variation
+        return [{"elevation": 100 + climb * (i % 2)} for i in range(samples)]
+
+def test_more_parks_beat_more_climbing(monkeypatch):
+    monkeypatch.delenv("SCENIC_RASTER_PATH", raising=False)
+    agent = ScenicAgent(api_key="AIzaLocalTestKey")
+    agent.client = _Maps()
+    start, end = {"lat": 37.80, "lng": -122.27}, {"lat": 37.80, "lng": -122.2475}
+    chosen = agent._best_scenic_segment(start, end, "walking", False)
+    assert {round(lat, 5) for lat, _ in chosen} == {37.80}
+    # Park counts are on the per-sample scale, comparable to metres of climbing
+    parks = agent._poi_density_score(PARKS)
+    assert parks == ScenicAgent.PLACES_SAMPLES * 12
+    assert parks + 0.5 * agent._elevation_variation_score(PARKS) > \
+        agent._poi_density_score(HILLS) + 0.5 * agent._elevation_variation_score(HILLS)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Tests for the precomputed scenic-score raster
+"""
+
+import os
+import scenic_raster
+from local_upstreams import LocalUpstreams
+from scenic_raster import RasterSpec, ScenicRaster, compute_scores, write_raster
+
+# 8 x 8 cells of ~250 m around Berkeley
+SPEC = RasterSpec.from_bbox(37.86, -122.28, 37.8779, -122.2575, 250)
+
+def _raster(tmp_path, pois, elevations=None, feedback=()):
+    path = str(tmp_path / "scenic.bin")
+    write_raster(path, SPEC, compute_scores(SPEC, pois, elevations, feedback))
+    return ScenicRaster(path)
+
+def test_routes_through_parks_and_hills_score_higher(tmp_path):
+    north_parks = [SPEC.centre(6, c) for c in range(SPEC.cols) for _ in range(3)]
+    hills = [(40.0 * (r % 2) if r >= 4 else 0.0) for r in range(SPEC.rows) for _ in range(SPEC.cols)]
+    raster = _raster(tmp_path, north_parks, hills, feedback=[(*SPEC.centre(1, 1), -5)])
+    west, east = SPEC.west + SPEC.cell_lng / 2, SPEC.west + SPEC.cell_lng * (SPEC.cols - 0.5)
+    north = [(SPEC.centre(6, 0)[0], west), (SPEC.centre(6, 0)[0], east)]
+    south = [(SPEC.centre(1, 0)[0], west), (SPEC.centre(1, 0)[0], east)]
+    assert raster.score(north) > raster.score(south)
+    assert raster.value(*SPEC.centre(1, 1)) < 0
+    # Mostly outside the raster: the caller scores it live
+    assert raster.score([(37.5, -122.5), (37.6, -122.4)]) is None
+
+def test_build_from_maps_and_env_loading(tmp_path, monkeypatch):
+    path = str(tmp_path / "built.bin")
+    with LocalUpstreams() as upstreams:
+        monkeypatch.setenv("GOOGLE_MAPS_BASE_URL", upstreams.base_url)
+        monkeypatch.setenv("UPSTREAM_CACHE", "off")
+        spec = scenic_raster.build_from_maps((37.86, -122.28, 37.8779, -122.2575), 250, path, api_key="AIza-test")
+        calls = upstreams.snapshot()
+    assert (spec.rows, spec.cols) == (SPEC.rows, SPEC.cols)
+    assert calls["elevation"] == spec.rows and calls["places_nearby"] == 4
+    monkeypatch.setattr(scenic_raster, "_raster", None)
+    monkeypatch.setenv("SCENIC_RASTER_PATH", path)
+    raster = scenic_raster.get_scenic_raster()
+    assert raster is not None and raster.spec.rows == spec.rows
+    assert raster.score([SPEC.centre(0, 0), SPEC.centre(7, 7)]) >= 0
+
+def test_unreadable_raster_is_not_retried_until_it_changes(tmp_path, monkeypatch):
+    path = tmp_path / "broken.bin"
+    path.write_bytes(b"not a raster")
+    monkeypatch.setattr(scenic_raster, "_raster", None)
+    monkeypatch.setattr(scenic_raster, "_failed", None)
+    monkeypatch.setenv("SCENIC_RASTER_PATH", str(path))
+    loads = []
+    real = scenic_raster.ScenicRaster
+    monkeypatch.setattr(scenic_raster, "ScenicRaster", lambda p: loads.append(p) or real(p))
+    assert scenic_raster.get_scenic_raster() is None
+    assert scenic_raster.get_scenic_raster() is None
+    assert len(loads) == 1
+    write_raster(str(path), SPEC, compute_scores(SPEC, [], None, ()))
+    os.utime(path, (0, 12345))
+    assert scenic_raster.get_scenic_raster() is not None and len(loads) == 2
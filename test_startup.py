@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Tests for fast startup: lazy agent imports and the warm-up hook
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+AGENT_MODULES = ("scenic_agent", "fitness_agent", "commute_agent", "polyline_agent",
+                 "fallback_agent", "starter", "nvidia_agent", "googlemaps")
+
+def test_importing_main_does_not_import_the_agents():
+    env = {k: v for k, v in os.environ.items() if k != "WARM_UP"}
+    env.update(GOOGLE_MAPS_API_KEY="AIzaLocalTestKey")
+    probe = f"import sys, json, main; print(json.dumps([m for m in {list(AGENT_MODULES)!r} if m in sys.modules]))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=os.path.dirname(os.path.abspath(__file__)),
+                         env=env, capture_output=True, text=True, timeout=60, check=True)
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == []
+
+def test_warm_up_times_every_step(monkeypatch):
+    import main
+    monkeypatch.setenv("GOOGLE_MAPS_API_KEY", "AIzaLocalTestKey")
+    monkeypatch.setenv("UPSTREAM_CACHE", "off")
+    monkeypatch.delenv("SCENIC_RASTER_PATH", raising=False)
+    timings = main.warm_up()
+    assert list(timings) == ["agents", "parser", "maps_client", "scheduler", "response_cache", "leg_caches",
+                             "job_queue", "upstream_cache", "gazetteer", "ip_geo", "scenic_raster"]
+    assert all(isinstance(ms, float) and ms >= 0 for ms in timings.values())
+    assert "scenic_agent" in sys.modules and main._parser is not None
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Tests for PlacesTextSearchClient caching, top-k and bulk search
+"""
+
+import pytest
+from google_text_search import PlacesTextSearchClient
+from local_upstreams import LocalUpstreams
+from upstream import CallMemo, memo_scope
+import upstream_cache
+from upstream_cache import UpstreamCache, MemoryStore, DEFAULT_TTLS_S
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_CACHE", "off")
+    with LocalUpstreams() as upstreams:
+        monkeypatch.setenv("GOOGLE_MAPS_BASE_URL", upstreams.base_url)
+        yield PlacesTextSearchClient("test-key"), upstreams
+
+def test_nearby_searches_share_one_call(client):
+    places, upstreams = client
+    with memo_scope(CallMemo()):
+        first = places.search("sushi", location=(37.87151, -122.25851), radius=3000)
+        nearby = places.search("sushi", location=(37.87412, -122.26188), radius=3000, top_k=3)
+    assert len(first) == 1 and len(nearby) == 3
+    assert nearby[0] == first[0]
+    assert upstreams.snapshot()["text_search"] == 1
+
+def test_search_many_keeps_order_and_dedupes(client):
+    places, upstreams = client
+    with memo_scope(CallMemo()):
+        results = places.search_many(["arcade", "sushi", "arcade", "tea"], location=(37.87, -122.26))
+    assert [r[0]["name"] for r in results] == ["Arcade 1", "Sushi 1", "Arcade 1", "Tea 1"]
+    assert upstreams.snapshot()["text_search"] == 3
+
+def test_failed_status_is_not_cached(client, monkeypatch):
+    places, upstreams = client
+    cache = UpstreamCache(MemoryStore(), DEFAULT_TTLS_S)
+    monkeypatch.setenv("UPSTREAM_CACHE", "memory")
+    monkeypatch.setattr(upstream_cache, "_cache", cache)
+    answer = upstreams._text_search
+    monkeypatch.setattr(upstreams, "_text_search", lambda params: {"status": "OVER_QUERY_LIMIT", "results": []})
+    with pytest.raises(RuntimeError, match="OVER_QUERY_LIMIT"):
+        places.search("ramen", location=(37.87, -122.26))
+    assert places.search_many(["ramen"], location=(37.87, -122.26)) == [[]]
+    monkeypatch.setattr(upstreams, "_text_search", answer)
+    assert places.search("ramen", location=(37.87, -122.26))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the cross-request upstream cache (memory and shared sqlite stores)
+"""
+
+import os
+import time
+import pytest
+from cache_snapshot import SnapshotMismatch, read_snapshot, write_snapshot
+import upstream_cache
+from starter import NVIDIAIntentParser
+from upstream_cache import MemoryStore, SqliteStore, UpstreamCache
+
+def _counting_call(result):
+    calls = []
+    def fn():
+        calls.append(1)
+        return result
+    return fn, calls
+
+def test_sqlite_store_is_shared_between_caches(tmp_path):
+    path = str(tmp_path / "upstream.sqlite")
+    # Two caches over one file stand in for two worker processes
+    first, second = UpstreamCache(SqliteStore(path)), UpstreamCache(SqliteStore(path))
+    fn, calls = _counting_call([{"geometry": {"location": {"lat": 37.87, "lng": -122.26}}}])
+
+    assert first.get_or_call("geocode", "k", fn) == second.get_or_call("geocode", "k", fn)
+    assert len(calls) == 1
+    stats = second.stats()
+    assert stats["backend"] == "sqlite" and stats["entries"] == 1
+    assert stats["worker"]["geocode"] == {"hits": 1, "misses": 0, "stores": 0}
+    assert stats["aggregate"]["geocode"]["hits"] == 1
+
+def test_entries_expire_and_hits_are_copies():
+    cache = UpstreamCache(MemoryStore(), {"directions": 0.05})
+    fn, calls = _counting_call({"routes": [1, 2]})
+    hit = None
+    for _ in range(2):
+        hit = cache.get_or_call("directions", "k", fn)
+    hit["routes"].append(3)
+    assert cache.get_or_call("directions", "k", fn) == {"routes": [1, 2]}
+    assert len(calls) == 1
+
+    time.sleep(0.06)
+    cache.get_or_call("directions", "k", fn)
+    assert len(calls) == 2
+    assert not cache.caches("elevation_along_path")
+
+def test_snapshot_warm_starts_a_new_cache(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    cache = UpstreamCache(MemoryStore(), snapshot_path=path)
+    hot, _ = _counting_call({"hot": True})
+    for _ in range(3):
+        cache.get_or_call("geocode", "hot", hot)
+    cache.get_or_call("intent", "cold", lambda: {"cold": True})
+    cache.save_snapshot()
+
+    restarted = UpstreamCache(MemoryStore(), snapshot_path=path)
+    assert restarted.load_snapshot() == 2
+    fn, calls = _counting_call(None)
+    assert restarted.get_or_call("geocode", "hot", fn) == {"hot": True}
+    assert restarted.get_or_call("intent", "cold", fn) == {"cold": True}
+    assert not calls
+    # Hottest first, so a smaller snapshot keeps the most-hit entries
+    assert [e[1] for e in cache.store.hottest(1)] == ["hot"]
+
+def test_incompatible_or_expired_snapshot_entries_are_skipped(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    write_snapshot(path, [("geocode", "old", "[]", time.time() - 1), ("geocode", "new", "[]", time.time() + 60)], 1)
+    assert [e[1] for e in read_snapshot(path, 1)] == ["new"]
+    with pytest.raises(SnapshotMismatch):
+        list(read_snapshot(path, 2))
+
+@pytest.mark.parametrize("cut", [3, 20])
+def test_truncated_snapshot_is_rejected_without_raising(tmp_path, cut):
+    path = str(tmp_path / "snapshot.bin")
+    write_snapshot(path, [("geocode", f"k{i}", '{"v": 1}', time.time() + 60) for i in range(2)], 1)
+    with open(path, "rb+") as f:
+        f.truncate(os.path.getsize(path) - cut)
+    with pytest.raises(SnapshotMismatch, match="truncated"):
+        list(read_snapshot(path, 1))
+    cache = UpstreamCache(MemoryStore(), snapshot_path=path)
+    assert cache.load_snapshot() == 0
+    assert cache.store.entries() == 0
+    assert cache.snapshot_stats["loaded"] == 0
+
+def test_intents_with_times_are_not_cached(monkeypatch):
+    monkeypatch.setenv("UPSTREAM_CACHE", "memory")
+    monkeypatch.setattr(upstream_cache, "_cache", UpstreamCache(MemoryStore()))
+    parser = NVIDIAIntentParser()
+    calls = []
+    def parse_intent(prompt, ipv6, deadline=None):
+        calls.append(prompt)
+        timed = "tomorrow" in prompt
+        return {"intent_type": "Commute", "origin": "Home", "departure_time": "2026-10-20T08:00:00" if timed else None}
+    monkeypatch.setattr(parser.nvidia_agent, "parse_intent", parse_intent)
+
+    for _ in range(2):
+        parser._parse_to_structured("commute to work at 8am tomorrow", "")
+        parser._parse_to_structured("commute to work", "")
+    assert calls == ["commute to work at 8am tomorrow", "commute to work", "commute to work at 8am tomorrow"]
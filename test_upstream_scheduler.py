@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-API token bucket, bulkhead and priority queue
+"""
+
+import threading
+import time
+from deadline import Deadline, DeadlineExceeded
+from upstream_scheduler import UpstreamScheduler, INTERACTIVE, BULK
+
+def _scheduler(qps=1000, burst=1000, max_in_flight=1):
+    return UpstreamScheduler({"places": {"qps": qps, "burst": burst, "max_in_flight": max_in_flight}})
+
+def test_bulkhead_caps_in_flight():
+    scheduler = _scheduler(max_in_flight=2)
+    peak = []
+    lock = threading.Lock()
+    running = [0]
+
+    def call():
+        with scheduler.slot("places"):
+            with lock:
+                running[0] += 1
+                peak.append(running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(peak) == 2
+    assert scheduler.stats()["places"]["calls"] == 8
+
+def test_token_bucket_paces_calls():
+    scheduler = _scheduler(qps=50, burst=1, max_in_flight=10)
+    started = time.monotonic()
+    for _ in range(6):
+        with scheduler.slot("places"):
+            pass
+    # First call uses the burst token, the other five wait ~20 ms each
+    assert time.monotonic() - started >= 0.09
+
+def test_interactive_jumps_ahead_of_bulk():
+    scheduler = _scheduler(max_in_flight=1)
+    order = []
+    gate = threading.Event()
+
+    def hold():
+        with scheduler.slot("places", BULK):
+            gate.wait(1)
+
+    def call(name, priority):
+        with scheduler.slot("places", priority):
+            order.append(name)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    time.sleep(0.02)
+    waiters = [threading.Thread(target=call, args=(f"bulk{i}", BULK)) for i in range(3)]
+    for t in waiters:
+        t.start()
+    time.sleep(0.02)
+    urgent = threading.Thread(target=call, args=("geocode-like", INTERACTIVE))
+    urgent.start()
+    time.sleep(0.02)
+    gate.set()
+    for t in [holder, urgent, *waiters]:
+        t.join()
+    assert order[0] == "geocode-like"
+    assert order[1:] == ["bulk0", "bulk1", "bulk2"]
+
+def test_deadline_aborts_queue_wait():
+    scheduler = _scheduler(max_in_flight=1)
+    gate = threading.Event()
+
+    def hold():
+        with scheduler.slot("places"):
+            gate.wait(1)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    time.sleep(0.02)
+    try:
+        with scheduler.slot("places", deadline=Deadline(30)):
+            raise AssertionError("slot should not be granted")
+    except DeadlineExceeded:
+        pass
+    gate.set()
+    holder.join()
+    stats = scheduler.stats()["places"]
+    assert stats["rejected"] == 1 and stats["queued"] == 0
+
+if __name__ == "__main__":
+    for test in [test_bulkhead_caps_in_flight, test_token_bucket_paces_calls,
+                 test_interactive_jumps_ahead_of_bulk, test_deadline_aborts_queue_wait]:
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Tests for the columnar WaypointList and its pydantic schema
+"""
+
+import json
+import pytest
+from pydantic import ValidationError
+from commute_agent import CommuteRouteResponse
+from models import ModeSummary
+from waypoints import WaypointList
+
+POINTS = [
+    {"name": "UC Berkeley", "lat": 37.8719, "lng": -122.2585},
+    {"name": "Coffee stop"},  # name-only placeholder
+    {"name": "Lake Merritt", "lat": 37.8024, "lng": -122.2583, "place_id": "ChIJ123"},
+]
+
+def test_round_trips_through_pydantic_models():
+    summary = ModeSummary(mode="walking", total_distance_m=9000, waypoints=POINTS)
+    assert isinstance(summary.waypoints, WaypointList)
+    assert summary.model_dump()["waypoints"] == POINTS
+    text = summary.model_dump_json()
+    assert json.loads(text)["waypoints"] == POINTS
+    again = ModeSummary.model_validate_json(text)
+    assert again == summary and again.waypoints.to_json() == POINTS
+    # A WaypointList passes through validation as-is
+    wl = WaypointList(POINTS)
+    assert CommuteRouteResponse(waypoints=wl).waypoints is wl
+    assert ModeSummary(mode="driving").model_dump()["waypoints"] == []
+
+def test_json_schema_matches_the_public_shape():
+    prop = ModeSummary.model_json_schema()["properties"]["waypoints"]
+    assert prop["type"] == "array" and prop["items"]["type"] == "object"
+
+def test_rows_read_like_dicts():
+    wl = WaypointList(POINTS)
+    assert wl[0]["lat"] == 37.8719 and wl[-1]["place_id"] == "ChIJ123"
+    assert wl[1].get("lat") is None
+    with pytest.raises(KeyError):
+        wl[1]["lat"]
+    assert wl[1:].to_json() == POINTS[1:]
+    combined = WaypointList(POINTS[:1])
+    combined.extend(wl[1:])
+    assert combined == POINTS
+    with pytest.raises(ValidationError):
+        ModeSummary(mode="walking", waypoints="not a list")
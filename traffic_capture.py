@@ -0,0 +1,145 @@
+# traffic_capture.py
+
+"""
+Opt-in capture of sampled /api/route traffic for replay (see replay.py).
+
+Each sampled request becomes one JSON line:
+
+    {"ts": <epoch s>, "request": <POST body>, "status": 200,
+     "latency_ms": 812.4, "cache": "MISS",
+     "upstream": [{"api": "geocode", "key": "...", "source": "upstream",
+                   "ms": 41.2, "response": [...]}, ...]}
+
+"upstream" is the request's CallTrace: every geocode, directions, places,
+text search, elevation and intent answer it used, including the ones a cache
+served, so a replay can answer all of them without the real services.
+
+The body is stored as sent (prompts included) except "ipv6", which is cut
+to its network (/48 for IPv6, /24 for IPv4) before it is written: enough for
+the same IP-prefix location on replay, not enough to identify a client.
+
+Files rotate at `max_bytes` (path, path.1, ... path.<backups>). Rotation is
+per process, so every worker needs its own file: put "{pid}" in the path
+(serve.py adds it when starting several workers).
+"""
+
+import os
+import json
+import random
+import ipaddress
+import threading
+from typing import Any, Dict, Optional
+from config import load_env
+from upstream import CallTrace
+
+# Load environment variables from .env file
+load_env()
+
+# Address bits kept from a request's "ipv6"
+IPV6_KEEP_BITS = 48
+IPV4_KEEP_BITS = 24
+
+def coarse_address(address: Any) -> Optional[str]:
+    """The network part of an IPv6 or IPv4 address (host bits zeroed), or None if unparseable."""
+    try:
+        ip = ipaddress.ip_address(str(address).strip())
+    except ValueError:
+        return None
+    bits = IPV6_KEEP_BITS if ip.version == 6 else IPV4_KEEP_BITS
+    return str(ipaddress.ip_network(f"{ip}/{bits}", strict=False).network_address)
+
+def per_process_path(path: str) -> str:
+    """`path` with "{pid}" before its extension, unless it already has one."""
+    if "{pid}" in path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{{pid}}{ext}"
+
+class TrafficCapture:
+    """Samples requests and appends them, with their upstream trace, to rotating JSONL."""
+    def __init__(self, path: str, sample_rate: float = 0.01, max_bytes: int = 50 * 1024 * 1024,
+                 backups: int = 5):
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self.sampled = 0
+        self.written = 0
+        self.dropped = 0
+
+    def sample(self) -> Optional[CallTrace]:
+        """A trace to record this request into, or None if it isn't sampled."""
+        if random.random() >= self.sample_rate:
+            return None
+        self.sampled += 1
+        return CallTrace()
+
+    def write(self, request_body: Any, status: int, latency_ms: float, cache_state: Optional[str],
+              trace: CallTrace, started_at: float):
+        if isinstance(request_body, dict) and "ipv6" in request_body:
+            request_body = dict(request_body, ipv6=coarse_address(request_body["ipv6"]))
+        record = {
+            "ts": round(started_at, 3),
+            "request": request_body,
+            "status": status,
+            "latency_ms": round(latency_ms, 1),
+            "cache": cache_state,
+            "upstream": trace.calls,
+        }
+        try:
+            line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+        except (TypeError, ValueError) as e:
+            self.dropped += 1
+            print(f"Warning: could not serialize captured request: {str(e)}")
+            return
+        with self._lock:
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                self.written += 1
+            except OSError as e:
+                self.dropped += 1
+                print(f"Warning: traffic capture write failed: {str(e)}")
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "sample_rate": self.sample_rate, "sampled": self.sampled,
+                "written": self.written, "dropped": self.dropped}
+
+_capture: Optional[TrafficCapture] = None
+_capture_pid: Optional[int] = None
+_capture_lock = threading.Lock()
+
+def get_traffic_capture() -> Optional[TrafficCapture]:
+    """
+    Process-wide capture when TRAFFIC_CAPTURE_PATH is set, else None.
+    TRAFFIC_CAPTURE_SAMPLE (fraction, default 0.01),
+    TRAFFIC_CAPTURE_MAX_BYTES and TRAFFIC_CAPTURE_BACKUPS tune it.
+    """
+    global _capture, _capture_pid
+    path = os.getenv("TRAFFIC_CAPTURE_PATH")
+    if not path:
+        return None
+    # Recreated in forked workers so "{pid}" resolves per process
+    if _capture is None or _capture_pid != os.getpid():
+        with _capture_lock:
+            if _capture is None or _capture_pid != os.getpid():
+                _capture = TrafficCapture(
+                    path,
+                    sample_rate=float(os.getenv("TRAFFIC_CAPTURE_SAMPLE", "0.01")),
+                    max_bytes=int(os.getenv("TRAFFIC_CAPTURE_MAX_BYTES", str(50 * 1024 * 1024))),
+                    backups=int(os.getenv("TRAFFIC_CAPTURE_BACKUPS", "5")),
+                )
+                _capture_pid = os.getpid()
+    return _capture
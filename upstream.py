@@ -0,0 +1,279 @@
+# upstream.py
+
+import os
+import time
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+from config import load_env
+from deadline import Deadline, DeadlineExceeded
+from upstream_scheduler import get_scheduler, INTERACTIVE
+from gazetteer import get_gazetteer
+from upstream_cache import get_upstream_cache
+
+if TYPE_CHECKING:
+    import googlemaps
+
+# Load environment variables from .env file
+load_env()
+
+# Default host for every Google Maps web service we call (geocode, directions,
+# places, elevation, text search). Override with GOOGLE_MAPS_BASE_URL to point
+# the agents at a local stand-in (see local_upstreams.py).
+DEFAULT_MAPS_BASE_URL = "https://maps.googleapis.com"
+
+# HTTP timeout for upstream calls made without a deadline, in seconds
+DEFAULT_TIMEOUT_S = 10.0
+
+# googlemaps.Client method -> upstream scheduler bucket
+SCHEDULER_APIS = {
+    "geocode": "geocode",
+    "directions": "directions",
+    "places_nearby": "places",
+    "elevation_along_path": "elevation",
+}
+
+def maps_base_url() -> str:
+    """Base URL for Google Maps web services, without a trailing slash."""
+    return (os.getenv("GOOGLE_MAPS_BASE_URL") or DEFAULT_MAPS_BASE_URL).rstrip("/")
+
+class CallMemo:
+    """
+    Single-flight memo of upstream results, shared by every request in a scope
+    (e.g. one /api/routes/batch call). The first caller for a key makes the
+    upstream call; concurrent and later callers get the same result object,
+    so results must be treated as read-only. Failed calls are not memoized.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Future] = {}
+        self.calls = 0
+        self.hits = 0
+
+    def get_or_call(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._entries.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._entries[key] = future
+                self.calls += 1
+            else:
+                self.hits += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._entries.pop(key, None)
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"upstream_calls": self.calls, "deduplicated_calls": self.hits}
+
+_current_memo: ContextVar[Optional[CallMemo]] = ContextVar("upstream_call_memo", default=None)
+
+@contextmanager
+def memo_scope(memo: CallMemo):
+    """Route upstream calls made in this context (thread) through `memo`."""
+    token = _current_memo.set(memo)
+    try:
+        yield memo
+    finally:
+        _current_memo.reset(token)
+
+def current_memo() -> Optional[CallMemo]:
+    """The CallMemo active in this context, so worker threads can re-enter it."""
+    return _current_memo.get()
+
+class CallTrace:
+    """
+    Every upstream answer one request used, in order, for traffic capture
+    (see traffic_capture.py). `source` is "upstream" when the call went out
+    (with its latency) and "cached" when a cache or the CallMemo answered.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: List[Dict[str, Any]] = []
+
+    def observe(self, api: str, key: str, fetch: Callable[[], Any],
+                through: Callable[[Callable[[], Any]], Any]) -> Any:
+        fetched: List[float] = []
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return fetch()
+            finally:
+                fetched.append((time.perf_counter() - started) * 1000)
+
+        call: Dict[str, Any] = {"api": api, "key": key}
+        try:
+            call["response"] = through(timed)
+            return call["response"]
+        except Exception as e:
+            call["error"] = str(e)
+            raise
+        finally:
+            call["source"] = "upstream" if fetched else "cached"
+            call["ms"] = round(fetched[0], 1) if fetched else None
+            with self._lock:
+                self.calls.append(call)
+
+_current_trace: ContextVar[Optional[CallTrace]] = ContextVar("upstream_call_trace", default=None)
+
+@contextmanager
+def trace_scope(trace: Optional[CallTrace]):
+    """Record upstream calls made in this context (thread) into `trace`, if given."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def current_trace() -> Optional[CallTrace]:
+    return _current_trace.get()
+
+# Replaces every real upstream call when set: hook(api, key, fetch) -> answer.
+# Caches and the CallMemo still sit in front of it (see replay.py).
+_upstream_override: Optional[Callable[[str, str, Callable[[], Any]], Any]] = None
+
+def set_upstream_override(hook: Optional[Callable[[str, str, Callable[[], Any]], Any]]):
+    global _upstream_override
+    _upstream_override = hook
+
+def memoized(api: str, args: tuple, kwargs: Dict[str, Any], fn: Callable[[], Any],
+             cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+    """
+    Run `fn` through the active CallMemo, if any, and the cross-request
+    upstream cache (see upstream_cache.py), both keyed by the call's arguments.
+    With `cache_if`, only answers it accepts are kept across requests.
+    """
+    key = repr((api, args, sorted(kwargs.items())))
+    if _upstream_override is not None:
+        fn = partial(_upstream_override, api, key, fn)
+    trace = _current_trace.get()
+    if trace is not None:
+        return trace.observe(api, key, fn, partial(_through_caches, api, key, cache_if=cache_if))
+    return _through_caches(api, key, fn, cache_if)
+
+def _through_caches(api: str, key: str, fn: Callable[[], Any],
+                    cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+    cache = get_upstream_cache()
+    if cache is not None and cache.caches(api):
+        fn = partial(cache.get_or_call, api, key, fn, cache_if)
+    memo = _current_memo.get()
+    if memo is None:
+        return fn()
+    return memo.get_or_call(key, fn)
+
+class MapsClient:
+    """
+    Drop-in wrapper around googlemaps.Client for the calls the agents make.
+
+    Every method accepts an optional `deadline`; the call is refused once the
+    budget is spent and otherwise runs with an HTTP timeout (and retry window)
+    bounded by what is left. googlemaps keeps its timeout on the client, so
+    each thread gets its own googlemaps.Client over one shared HTTP session.
+
+    Calls also go through the process-wide upstream scheduler; pass
+    `priority=BULK` for background sampling so it queues behind interactive work.
+    """
+    def __init__(self, api_key: str):
+        # googlemaps and requests load with the first client, not with the app
+        import requests
+        self.api_key = api_key
+        self.session = requests.Session()
+        self._local = threading.local()
+        # Validate the key eagerly, like googlemaps.Client does
+        self._client()
+
+    def _client(self) -> "googlemaps.Client":
+        client = getattr(self._local, "client", None)
+        if client is None:
+            import googlemaps
+            client = googlemaps.Client(
+                key=self.api_key,
+                base_url=maps_base_url(),
+                timeout=DEFAULT_TIMEOUT_S,
+                requests_session=self.session,
+            )
+            self._local.client = client
+        return client
+
+    def _call(self, api: str, *args, deadline: Optional[Deadline] = None,
+              priority: str = INTERACTIVE, **kwargs) -> Any:
+        def call():
+            with get_scheduler().slot(SCHEDULER_APIS[api], priority, deadline):
+                return self._send(api, *args, deadline=deadline, **kwargs)
+        return memoized(api, args, kwargs, call)
+
+    def _send(self, api: str, *args, deadline: Optional[Deadline] = None, **kwargs) -> Any:
+        import googlemaps
+        client = self._client()
+        if deadline is not None:
+            deadline.check(api)
+            timeout = deadline.timeout(DEFAULT_TIMEOUT_S)
+            client.retry_timeout = timedelta(seconds=timeout)
+        else:
+            timeout = DEFAULT_TIMEOUT_S
+            client.retry_timeout = timedelta(seconds=60)
+        client.requests_kwargs["timeout"] = timeout
+        try:
+            return getattr(client, api)(*args, **kwargs)
+        except googlemaps.exceptions.Timeout:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded(f"Latency budget exhausted during {api}")
+            raise
+
+    # geocode() arguments that change the answer; the gazetteer can't honour them
+    GEOCODE_FILTERS = {"components", "bounds", "region", "language", "place_id"}
+
+    def geocode(self, address=None, *args, **kwargs):
+        """Known names resolve from the local gazetteer; confident answers are learned."""
+        gazetteer = get_gazetteer()
+        plain = isinstance(address, str) and not args and not self.GEOCODE_FILTERS & kwargs.keys()
+        if gazetteer is not None and plain:
+            hit = gazetteer.resolve(address)
+            if hit is not None:
+                return [hit]
+        results = self._call("geocode", address, *args, **kwargs)
+        if gazetteer is not None and plain:
+            gazetteer.learn(address, results)
+        return results
+
+    def directions(self, *args, **kwargs):
+        return self._call("directions", *args, **kwargs)
+
+    def places_nearby(self, *args, **kwargs):
+        return self._call("places_nearby", *args, **kwargs)
+
+    def elevation_along_path(self, *args, **kwargs):
+        return self._call("elevation_along_path", *args, **kwargs)
+
+_clients: Dict[Tuple[str, str], MapsClient] = {}
+_clients_lock = threading.Lock()
+
+def create_maps_client(api_key: str) -> MapsClient:
+    """
+    Maps client for `api_key` at the configured base URL. Clients are pooled
+    per (key, base URL), so every agent instance shares one HTTP session and
+    its keep-alive connections instead of opening its own.
+    """
+    key = (api_key, maps_base_url())
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = MapsClient(api_key)
+    return client
@@ -0,0 +1,349 @@
+# upstream_cache.py
+
+"""
+Cross-request cache of upstream answers (geocode, directions, places) and
+of parsed intents.
+
+Two stores:
+
+- memory: a per-process LRU. Fine for a single process; under several
+  workers each one keeps (and warms) its own copy.
+- sqlite: one database file in WAL mode shared by every worker process, so
+  a geocode answered in one worker is a hit in all of them. Readers never
+  block the writer, and each process/thread opens its own connection.
+
+Values are stored as JSON, so every hit is a private copy. Hit/miss counters
+are kept per worker; with the sqlite store they are also flushed to the
+database so any worker can report the aggregate across all of them.
+
+With UPSTREAM_CACHE_SNAPSHOT_PATH set, the hottest entries are periodically
+written to a snapshot file (see cache_snapshot.py) and preloaded from it
+when the cache is created, so a restarted process starts warm.
+"""
+
+import os
+import json
+import time
+import struct
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, List, Optional
+from config import load_env
+from cache_snapshot import Entry, SnapshotMismatch, read_snapshot, write_snapshot
+
+# Load environment variables from .env file
+load_env()
+
+# Upstream API (as passed to upstream.memoized) -> default TTL in seconds.
+# Directions answers depend on traffic, so they expire like /api/route responses.
+DEFAULT_TTLS_S = {
+    "geocode": 30 * 24 * 3600,
+    "directions": 300,
+    "places_nearby": 24 * 3600,
+    "text_search": 24 * 3600,
+    "intent": 24 * 3600,
+}
+
+# Bump when cache keys or cached value shapes change, so older snapshots are skipped
+CACHE_VERSION = 1
+
+DEFAULT_SQLITE_PATH = os.path.join(tempfile.gettempdir(), "mapsai-upstream-cache.sqlite")
+
+# How often a worker writes changed counters to the shared store, in seconds
+STATS_FLUSH_S = 1.0
+
+class MemoryStore:
+    """Per-process LRU of key -> [expires_at, JSON text, api, hits]."""
+    name = "memory"
+    shared = False
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            entry[3] += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, api: str, value: str, ttl_s: float):
+        with self._lock:
+            self._entries[key] = [time.time() + ttl_s, value, api, 0]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def entries(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def hottest(self, limit: int) -> List[Entry]:
+        """Unexpired entries, most hit first (most recently used among equals)."""
+        now = time.time()
+        with self._lock:
+            rows = [(key, e) for key, e in reversed(self._entries.items()) if e[0] > now]
+        rows.sort(key=lambda row: -row[1][3])  # stable: recency breaks ties
+        return [(e[2], key, e[1], e[0]) for key, e in rows[:limit]]
+
+    def flush_stats(self, pid: int, counts: Dict[str, Dict[str, int]]):
+        pass
+
+    def worker_stats(self) -> Optional[Dict[str, Dict[str, Dict[str, int]]]]:
+        return None
+
+class SqliteStore:
+    """Shared sqlite (WAL) store; safe to use from several processes and threads."""
+    name = "sqlite"
+    shared = True
+
+    # Expired and excess rows are pruned every this many writes
+    PRUNE_EVERY = 256
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, max_entries: int = 200000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        # Closed straight away, so a pre-forking parent holds no connection
+        db = self._open()
+        try:
+            db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                       "key TEXT PRIMARY KEY, api TEXT, value TEXT, stored REAL, expires REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS worker_stats ("
+                       "pid INTEGER, api TEXT, hits INTEGER, misses INTEGER, stores INTEGER, "
+                       "updated REAL, PRIMARY KEY (pid, api))")
+        finally:
+            db.close()
+
+    def _open(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not cross fork() or threads: one per (process, thread)
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = self._open()
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, api: str, value: str, ttl_s: float):
+        now = time.time()
+        db = self._connect()
+        db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (key, api, value, now, now + ttl_s))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            db.execute("DELETE FROM entries WHERE expires < ?", (now,))
+            db.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY stored DESC "
+                       "LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def entries(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def hottest(self, limit: int) -> List[Entry]:
+        """Unexpired entries, most recently fetched first (hits aren't tracked per row)."""
+        return self._connect().execute(
+            "SELECT api, key, value, expires FROM entries WHERE expires > ? ORDER BY stored DESC LIMIT ?",
+            (time.time(), limit)
+        ).fetchall()
+
+    def flush_stats(self, pid: int, counts: Dict[str, Dict[str, int]]):
+        now = time.time()
+        self._connect().executemany(
+            "INSERT OR REPLACE INTO worker_stats VALUES (?, ?, ?, ?, ?, ?)",
+            [(pid, api, c["hits"], c["misses"], c["stores"], now) for api, c in counts.items()]
+        )
+
+    def worker_stats(self) -> Optional[Dict[str, Dict[str, Dict[str, int]]]]:
+        workers: Dict[str, Dict[str, Dict[str, int]]] = defaultdict(dict)
+        for pid, api, hits, misses, stores in self._connect().execute(
+                "SELECT pid, api, hits, misses, stores FROM worker_stats"):
+            workers[str(pid)][api] = {"hits": hits, "misses": misses, "stores": stores}
+        return dict(workers)
+
+class UpstreamCache:
+    """
+    TTL cache in front of the upstream APIs listed in `ttls_s`. Only
+    successful answers are stored; store errors degrade to a miss.
+    """
+    def __init__(self, store, ttls_s: Optional[Dict[str, float]] = None,
+                 snapshot_path: Optional[str] = None, snapshot_interval_s: float = 300,
+                 snapshot_entries: int = 20000):
+        self.store = store
+        self.ttls_s = dict(DEFAULT_TTLS_S if ttls_s is None else ttls_s)
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval_s = snapshot_interval_s
+        self.snapshot_entries = snapshot_entries
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "stores": 0})
+        self._pid = None
+        self._dirty = False
+        self.snapshot_stats = {"loaded": 0, "saved": 0, "last_saved_at": None}
+
+    def caches(self, api: str) -> bool:
+        return self.ttls_s.get(api, 0) > 0
+
+    def get_or_call(self, api: str, key: str, fn: Callable[[], Any],
+                    cache_if: Optional[Callable[[Any], bool]] = None) -> Any:
+        try:
+            cached = self.store.get(key)
+        except sqlite3.Error as e:
+            print(f"Warning: upstream cache read failed: {str(e)}")
+            cached = None
+        if cached is not None:
+            self._count(api, "hits")
+            return json.loads(cached)
+        self._count(api, "misses")
+        result = fn()
+        if cache_if is not None and not cache_if(result):
+            return result
+        try:
+            self.store.put(key, api, json.dumps(result), self.ttls_s[api])
+            self._count(api, "stores")
+        except (TypeError, ValueError):
+            pass  # not JSON-serializable; just don't cache it
+        except sqlite3.Error as e:
+            print(f"Warning: upstream cache write failed: {str(e)}")
+        return result
+
+    def _count(self, api: str, field: str):
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use in this process (e.g. a freshly forked worker):
+                # own counters, and a flusher thread for shared stores
+                self._pid = os.getpid()
+                self._counts.clear()
+                if self.store.shared:
+                    threading.Thread(target=self._flush_loop, name="upstream-cache-stats", daemon=True).start()
+                if self.snapshot_path:
+                    threading.Thread(target=self._snapshot_loop, name="upstream-cache-snapshot", daemon=True).start()
+            self._counts[api][field] += 1
+            self._dirty = True
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(STATS_FLUSH_S)
+            if self._dirty:
+                self.flush_stats()
+
+    def _snapshot_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.snapshot_interval_s)
+            self.save_snapshot()
+
+    def save_snapshot(self) -> int:
+        """Write the hottest entries to `snapshot_path`. Returns how many."""
+        try:
+            count = write_snapshot(self.snapshot_path, self.store.hottest(self.snapshot_entries), CACHE_VERSION)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: upstream cache snapshot failed: {str(e)}")
+            return 0
+        self.snapshot_stats.update(saved=count, last_saved_at=time.time())
+        return count
+
+    def load_snapshot(self) -> int:
+        """Preload unexpired entries from `snapshot_path`. Returns how many."""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        count = 0
+        try:
+            # Read the whole file first so a truncated snapshot loads nothing rather than a prefix
+            entries = list(read_snapshot(self.snapshot_path, CACHE_VERSION))
+            for api, key, value, expires_at in entries:
+                if self.caches(api):
+                    self.store.put(key, api, value, expires_at - time.time())
+                    count += 1
+        except SnapshotMismatch as e:
+            print(f"Warning: skipping upstream cache snapshot: {str(e)}")
+        except (OSError, ValueError, UnicodeDecodeError, struct.error, sqlite3.Error) as e:
+            print(f"Warning: upstream cache snapshot unreadable: {str(e)}")
+        self.snapshot_stats["loaded"] = count
+        return count
+
+    def flush_stats(self):
+        with self._lock:
+            if self._pid is None:
+                return
+            counts = {api: dict(c) for api, c in self._counts.items()}
+            self._dirty = False
+        try:
+            self.store.flush_stats(self._pid, counts)
+        except sqlite3.Error as e:
+            print(f"Warning: upstream cache stats flush failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """This worker's counters, plus every worker's and their sum for shared stores."""
+        self.flush_stats()
+        with self._lock:
+            worker = {api: dict(c) for api, c in self._counts.items()}
+        out: Dict[str, Any] = {"backend": self.store.name, "entries": self.store.entries(),
+                               "pid": os.getpid(), "worker": worker}
+        if self.snapshot_path:
+            out["snapshot"] = {"path": self.snapshot_path, **self.snapshot_stats}
+        workers = self.store.worker_stats()
+        if workers is not None:
+            aggregate: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "stores": 0})
+            for per_api in workers.values():
+                for api, c in per_api.items():
+                    for field in ("hits", "misses", "stores"):
+                        aggregate[api][field] += c[field]
+            out["workers"] = workers
+            out["aggregate"] = dict(aggregate)
+        return out
+
+_cache: Optional[UpstreamCache] = None
+_cache_lock = threading.Lock()
+
+def get_upstream_cache() -> Optional[UpstreamCache]:
+    """
+    Process-wide upstream cache: UPSTREAM_CACHE=memory (default), sqlite or
+    off. UPSTREAM_CACHE_PATH, UPSTREAM_CACHE_MAX_ENTRIES and
+    UPSTREAM_CACHE_TTLS (JSON, e.g. {"directions": 120}) tune it;
+    UPSTREAM_CACHE_SNAPSHOT_PATH (with UPSTREAM_CACHE_SNAPSHOT_S and
+    UPSTREAM_CACHE_SNAPSHOT_ENTRIES) enables warm-start snapshots.
+    """
+    global _cache
+    backend = os.getenv("UPSTREAM_CACHE", "memory")
+    if backend == "off":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttls = dict(DEFAULT_TTLS_S)
+                ttls.update(json.loads(os.getenv("UPSTREAM_CACHE_TTLS", "{}")))
+                max_entries = os.getenv("UPSTREAM_CACHE_MAX_ENTRIES")
+                if backend == "sqlite":
+                    store = SqliteStore(os.getenv("UPSTREAM_CACHE_PATH", DEFAULT_SQLITE_PATH),
+                                        **({"max_entries": int(max_entries)} if max_entries else {}))
+                else:
+                    store = MemoryStore(**({"max_entries": int(max_entries)} if max_entries else {}))
+                cache = UpstreamCache(
+                    store, ttls,
+                    snapshot_path=os.getenv("UPSTREAM_CACHE_SNAPSHOT_PATH") or None,
+                    snapshot_interval_s=float(os.getenv("UPSTREAM_CACHE_SNAPSHOT_S", "300")),
+                    snapshot_entries=int(os.getenv("UPSTREAM_CACHE_SNAPSHOT_ENTRIES", "20000")),
+                )
+                cache.load_snapshot()
+                _cache = cache
+    return _cache
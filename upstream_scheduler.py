@@ -0,0 +1,186 @@
+# upstream_scheduler.py
+
+import os
+import json
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+from config import load_env
+from deadline import Deadline, DeadlineExceeded
+
+# Load environment variables from .env file
+load_env()
+
+# Priority classes: interactive calls (geocodes, the Directions call a user is
+# waiting on, intent parsing) jump ahead of bulk scenic sampling.
+INTERACTIVE = "interactive"
+BULK = "bulk"
+_PRIORITY_RANK = {INTERACTIVE: 0, BULK: 1}
+
+# Per-API token bucket (qps, burst) and bulkhead (max_in_flight). All agents
+# share one Google key and one NVIDIA key, so these limits are process-wide.
+# Google's default web service quota is 3000 queries/minute per API.
+# Override with UPSTREAM_LIMITS='{"places": {"qps": 20, "max_in_flight": 4}}'.
+DEFAULT_LIMITS: Dict[str, Dict[str, float]] = {
+    "geocode":     {"qps": 50, "burst": 50, "max_in_flight": 16},
+    "directions":  {"qps": 50, "burst": 50, "max_in_flight": 16},
+    "places":      {"qps": 50, "burst": 50, "max_in_flight": 12},
+    "elevation":   {"qps": 50, "burst": 50, "max_in_flight": 8},
+    "text_search": {"qps": 50, "burst": 50, "max_in_flight": 8},
+    "nvidia":      {"qps": 10, "burst": 10, "max_in_flight": 4},
+}
+
+# Queue-wait samples kept per API for percentile metrics
+WAIT_WINDOW = 1024
+
+class TokenBucket:
+    """Classic token bucket; `take()` returns 0 when a token was taken, else seconds to wait."""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class UpstreamLimiter:
+    """
+    Rate limit plus bulkhead for one upstream API.
+
+    Waiters are served strictly by (priority, arrival): a call may start only
+    when it is at the head of the queue, a token is available and fewer than
+    `max_in_flight` calls are running.
+    """
+    def __init__(self, name: str, qps: float, burst: float, max_in_flight: int):
+        self.name = name
+        self.bucket = TokenBucket(qps, burst)
+        self.max_in_flight = int(max_in_flight)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._queue: list = []
+        self._seq = itertools.count()
+        # metrics
+        self.calls = 0
+        self.rejected = 0
+        self._waits = {p: deque(maxlen=WAIT_WINDOW) for p in _PRIORITY_RANK}
+        self._max_wait = 0.0
+
+    def acquire(self, priority: str = INTERACTIVE, deadline: Optional[Deadline] = None):
+        ticket = (_PRIORITY_RANK[priority], next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    wait: Optional[float] = None
+                    if self._queue[0] == ticket and self.in_flight < self.max_in_flight:
+                        wait = self.bucket.take()
+                        if wait == 0:
+                            heapq.heappop(self._queue)
+                            self.in_flight += 1
+                            break
+                    if deadline is not None:
+                        remaining = deadline.remaining()
+                        if remaining <= 0:
+                            raise DeadlineExceeded(f"Latency budget exhausted waiting for {self.name}")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            except BaseException:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self.rejected += 1
+                raise
+            finally:
+                # Let the next waiter re-check whether it is now at the head
+                self._cond.notify_all()
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self.calls += 1
+            self._waits[priority].append(waited)
+            self._max_wait = max(self._max_wait, waited)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out: Dict[str, Any] = {
+                "calls": self.calls,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight,
+                "queued": len(self._queue),
+                "max_in_flight": self.max_in_flight,
+                "qps": self.bucket.rate,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+                "wait_ms": {},
+            }
+            for priority, waits in self._waits.items():
+                ordered = sorted(waits)
+                out["wait_ms"][priority] = {
+                    "samples": len(ordered),
+                    "mean": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+                    "p95": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 2) if ordered else 0.0,
+                }
+            return out
+
+class UpstreamScheduler:
+    """Central registry of per-API limiters shared by every agent in the process."""
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None):
+        limits = limits or DEFAULT_LIMITS
+        self.limiters = {
+            name: UpstreamLimiter(
+                name,
+                qps=cfg["qps"],
+                burst=cfg.get("burst", cfg["qps"]),
+                max_in_flight=cfg["max_in_flight"],
+            )
+            for name, cfg in limits.items()
+        }
+
+    @classmethod
+    def from_env(cls) -> "UpstreamScheduler":
+        limits = {name: dict(cfg) for name, cfg in DEFAULT_LIMITS.items()}
+        overrides = os.getenv("UPSTREAM_LIMITS")
+        if overrides:
+            for name, cfg in json.loads(overrides).items():
+                limits.setdefault(name, {"qps": 10, "max_in_flight": 4}).update(cfg)
+        return cls(limits)
+
+    @contextmanager
+    def slot(self, api: str, priority: str = INTERACTIVE, deadline: Optional[Deadline] = None):
+        """Hold a rate-limited, bulkheaded slot for one call to `api`."""
+        limiter = self.limiters[api]
+        limiter.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+_scheduler: Optional[UpstreamScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> UpstreamScheduler:
+    """Process-wide scheduler, built from UPSTREAM_LIMITS on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = UpstreamScheduler.from_env()
+    return _scheduler
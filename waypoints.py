@@ -0,0 +1,172 @@
+# waypoints.py
+
+import sys
+from array import array
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from pydantic_core import core_schema
+
+# Stored for name-only placeholders; such rows are tracked in `_placeholders`
+_MISSING = float("nan")
+
+class Waypoint:
+    """
+    One stop of a route. Read-only view into a WaypointList row; supports
+    `wp["lat"]` / `wp.get("name")` so code written for dicts keeps working.
+    """
+    __slots__ = ("name", "lat", "lng", "extra")
+
+    def __init__(self, name: Optional[str], lat: Optional[float], lng: Optional[float],
+                 extra: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.lat = lat
+        self.lng = lng
+        self.extra = extra
+
+    def __getitem__(self, key: str) -> Any:
+        if key in ("name", "lat", "lng"):
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"name": self.name}
+        if self.lat is not None:
+            out["lat"] = self.lat
+            out["lng"] = self.lng
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+    def __repr__(self) -> str:
+        return f"Waypoint({self.to_dict()!r})"
+
+class WaypointList:
+    """
+    Ordered waypoints stored column-wise: interned names plus float arrays
+    for lat/lng, with the rare extra keys kept in a sparse side table.
+
+    Agents build and pass these around without Pydantic validating each
+    point; response models declare `waypoints: WaypointList` and the public
+    list-of-dicts JSON is produced once, by `model_dump()` at the edge.
+    """
+    __slots__ = ("names", "lats", "lngs", "_extras", "_placeholders")
+
+    def __init__(self, points: Iterable[Union[Mapping[str, Any], Waypoint]] = ()):
+        self.names: List[Optional[str]] = []
+        self.lats = array("d")
+        self.lngs = array("d")
+        self._extras: Dict[int, Dict[str, Any]] = {}
+        self._placeholders: set = set()  # rows with a name but no coordinates
+        self.extend(points)
+
+    def append(self, name: Optional[str], lat: Optional[float], lng: Optional[float], **extra: Any):
+        if extra:
+            self._extras[len(self.names)] = extra
+        if lat is None or lng is None:
+            self._placeholders.add(len(self.names))
+            lat = lng = _MISSING
+        self.names.append(sys.intern(name) if type(name) is str else name)
+        self.lats.append(lat)
+        self.lngs.append(lng)
+
+    def add(self, point: Union[Mapping[str, Any], Waypoint]):
+        """Append a {"name", "lat", "lng", ...} mapping or a Waypoint."""
+        if isinstance(point, Waypoint):
+            self.append(point.name, point.lat, point.lng, **(point.extra or {}))
+            return
+        extra = {k: v for k, v in point.items() if k not in ("name", "lat", "lng")}
+        self.append(point.get("name"), point.get("lat"), point.get("lng"), **extra)
+
+    def extend(self, points: Iterable[Union[Mapping[str, Any], Waypoint]]):
+        if isinstance(points, WaypointList):
+            offset = len(self.names)
+            self.names.extend(points.names)
+            self.lats.extend(points.lats)
+            self.lngs.extend(points.lngs)
+            self._extras.update({offset + i: e for i, e in points._extras.items()})
+            self._placeholders.update(offset + i for i in points._placeholders)
+            return
+        for point in points:
+            self.add(point)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _row(self, i: int) -> Waypoint:
+        if i in self._placeholders:
+            return Waypoint(self.names[i], None, None, self._extras.get(i))
+        return Waypoint(self.names[i], self.lats[i], self.lngs[i], self._extras.get(i))
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Waypoint, "WaypointList"]:
+        if isinstance(index, slice):
+            out = WaypointList()
+            for i in range(*index.indices(len(self))):
+                out.add(self._row(i))
+            return out
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("waypoint index out of range")
+        return self._row(index)
+
+    def __iter__(self) -> Iterator[Waypoint]:
+        for i in range(len(self)):
+            yield self._row(i)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, WaypointList):
+            return self.to_json() == other.to_json()
+        if isinstance(other, list):
+            return self.to_json() == other
+        return NotImplemented
+
+    def coords(self) -> List[Tuple[float, float]]:
+        return list(zip(self.lats, self.lngs))
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        """The public representation: a list of {"name", "lat", "lng", ...} dicts."""
+        out = [{"name": n, "lat": a, "lng": b} for n, a, b in zip(self.names, self.lats, self.lngs)]
+        for i in self._placeholders:
+            del out[i]["lat"], out[i]["lng"]
+        for i, extra in self._extras.items():
+            out[i].update(extra)
+        return out
+
+    def __repr__(self) -> str:
+        return f"WaypointList({self.to_json()!r})"
+
+    @classmethod
+    def _coerce(cls, value: Any) -> "WaypointList":
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, list):
+            return cls(value)
+        # ValueError, so pydantic reports it as a ValidationError like any other field
+        raise ValueError("waypoints must be a WaypointList or a list of waypoint dicts")
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: Any) -> "core_schema.CoreSchema":
+        from pydantic_core import core_schema
+        # Accept as-is (no per-point validation); dump to plain JSON at the edge
+        return core_schema.no_info_plain_validator_function(
+            cls._coerce,
+            serialization=core_schema.plain_serializer_function_ser_schema(lambda v: v.to_json()),
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(cls, schema: Any, handler: Any) -> Dict[str, Any]:
+        from pydantic_core import core_schema
+        # Documented (e.g. OpenAPI) as the JSON it dumps to
+        return handler(core_schema.list_schema(core_schema.dict_schema(core_schema.str_schema(), core_schema.any_schema())))